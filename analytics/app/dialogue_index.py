@@ -0,0 +1,86 @@
+from datetime import date, datetime, time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+class DialogueIndex:
+    """
+    Индекс диалогов по пользователям для постраничного просмотра.
+
+    Строки сортируются по (user_id, timestamp) один раз при построении;
+    для каждого пользователя хранится диапазон строк `[start, stop)`.
+    Фильтры по дате и тексту применяются только к срезу выбранного
+    пользователя: дата — бинарным поиском по отсортированным меткам
+    времени, текст — по заранее приведенным к нижнему регистру запросам.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        if df.empty:
+            self.frame = pd.DataFrame(columns=["timestamp", "user_id", "username", "query"])
+            self.ranges: dict[int, tuple[int, int]] = {}
+            self._timestamps = np.array([], dtype="datetime64[us]")
+            self._queries = np.array([], dtype=object)
+            return
+
+        frame = df[["timestamp", "user_id", "username", "query"]].sort_values(
+            ["user_id", "timestamp"], kind="stable"
+        ).reset_index(drop=True)
+        user_ids = frame["user_id"].to_numpy()
+        # Границы блоков одинаковых user_id в отсортированном массиве
+        starts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+        stops = np.r_[starts[1:], len(user_ids)]
+
+        self.frame = frame
+        self.ranges = {int(user_ids[s]): (int(s), int(e)) for s, e in zip(starts, stops)}
+        self._timestamps = frame["timestamp"].to_numpy()
+        self._queries = frame["query"].fillna("").str.lower().to_numpy()
+
+    def users(self) -> list[int]:
+        """Возвращает пользователей, отсортированных по числу сообщений (по убыванию)."""
+        return sorted(self.ranges, key=lambda user_id: self.ranges[user_id][0] - self.ranges[user_id][1])
+
+    def message_count(self, user_id: int) -> int:
+        """Количество сообщений пользователя в индексе."""
+        start, stop = self.ranges.get(user_id, (0, 0))
+        return stop - start
+
+    def select(
+        self,
+        user_id: int,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        text: str = "",
+    ) -> np.ndarray:
+        """
+        Находит строки пользователя с учетом фильтров.
+
+        Args:
+            user_id: Идентификатор пользователя.
+            start: Первая дата диапазона (включительно).
+            end: Последняя дата диапазона (включительно).
+            text: Подстрока для поиска в запросах (без учета регистра).
+
+        Returns:
+            Позиции строк в `frame`, упорядоченные по времени.
+        """
+        lo, hi = self.ranges.get(user_id, (0, 0))
+        timestamps = self._timestamps[lo:hi]
+        if start is not None:
+            lo += int(np.searchsorted(timestamps, np.datetime64(datetime.combine(start, time.min)), side="left"))
+        if end is not None:
+            hi = lo + int(np.searchsorted(
+                self._timestamps[lo:hi], np.datetime64(datetime.combine(end, time.max)), side="right"
+            ))
+        rows = np.arange(lo, hi)
+        text = text.strip().lower()
+        if text and len(rows):
+            mask = np.fromiter((text in query for query in self._queries[lo:hi]), dtype=bool, count=len(rows))
+            rows = rows[mask]
+        return rows
+
+    def page(self, rows: np.ndarray, page: int, page_size: int) -> pd.DataFrame:
+        """Возвращает строки одной страницы (нумерация с 1)."""
+        offset = (page - 1) * page_size
+        return self.frame.iloc[rows[offset:offset + page_size]]
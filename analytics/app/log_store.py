@@ -0,0 +1,335 @@
+import gzip
+import json
+import os
+import re
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from rollups import DayRollup
+
+# Имена дневных логов взаимодействий, включая сжатые логи прошедших дней
+_LOG_NAME_RE = re.compile(r"^interactions_(\d{4}-\d{2}-\d{2})\.jsonl(\.gz)?$")
+
+# Схема таблицы взаимодействий; `date` — колонка партиционирования
+INTERACTIONS_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("us")),
+    ("user_id", pa.int64()),
+    ("username", pa.string()),
+    ("query", pa.string()),
+    ("response", pa.string()),
+    ("doc_type", pa.string()),
+    ("query_length", pa.int32()),
+    ("response_length", pa.int32()),
+])
+
+# Если в партиции накопилось больше частей, они сливаются в одну
+MAX_PARTS_PER_PARTITION = 16
+
+# Версия формата агрегатов: при изменении агрегаты пересчитываются из партиций
+ROLLUPS_VERSION = 1
+
+
+class LogStore:
+    """
+    Инкрементальное колоночное хранилище логов взаимодействий бота.
+
+    Логи `interactions_YYYY-MM-DD.jsonl[.gz]` дописываются в Parquet-файлы,
+    партиционированные по дате (`date=YYYY-MM-DD/part-*.parquet`). Для каждого
+    исходного файла запоминается смещение в байтах (в распакованном потоке),
+    поэтому при обновлении читаются только новые строки. Дашборд читает
+    из хранилища лишь нужные колонки и даты.
+
+    Вместе с партициями обновляются дневные агрегаты (`rollups/*.json`),
+    из которых строятся метрики и облако слов за любой период.
+    """
+
+    def __init__(self, store_dir: Path):
+        self.store_dir = store_dir
+        self.data_dir = store_dir / "interactions"
+        self.state_path = store_dir / "_state.json"
+        self.rollups_dir = store_dir / "rollups"
+        self.state = self._load_state()
+        self._rollups: dict[str, tuple[int, DayRollup]] = {}
+        self._lock = threading.Lock()
+
+    def _load_state(self) -> dict:
+        """Читает смещения обработанных файлов."""
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"version": 0, "files": {}}
+
+    def _save_state(self) -> None:
+        """Атомарно сохраняет смещения."""
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    @property
+    def version(self) -> int:
+        """Номер версии данных; увеличивается при каждой загрузке новых строк."""
+        return self.state["version"]
+
+    @staticmethod
+    def _log_files(log_dir: Path) -> dict[str, Path]:
+        """
+        Находит логи взаимодействий, сопоставляя их дневному ключу.
+
+        Если для дня есть и обычный, и сжатый файл (момент ротации),
+        используется обычный.
+        """
+        files: dict[str, Path] = {}
+        for path in sorted(log_dir.glob("interactions_*.jsonl*")):
+            match = _LOG_NAME_RE.match(path.name)
+            if not match:
+                continue
+            key = f"interactions_{match.group(1)}.jsonl"
+            if key not in files or not match.group(2):
+                files[key] = path
+        return files
+
+    @staticmethod
+    def _read_new_lines(path: Path, offset: int) -> tuple[list[bytes], int]:
+        """
+        Читает полные строки после `offset`.
+
+        Незавершенная последняя строка (бот еще пишет ее) не читается
+        и будет обработана при следующем обновлении.
+
+        Returns:
+            Новые строки и смещение после последней полной строки.
+        """
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n")
+        if end < 0:
+            return [], offset
+        return data[:end].split(b"\n"), offset + end + 1
+
+    @staticmethod
+    def _parse(lines: Iterable[bytes]) -> list[dict]:
+        """Разбирает JSON-строки логов, пропуская поврежденные."""
+        records = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+                record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                continue
+            records.append(record)
+        return records
+
+    def _write_partition(self, day: str, records: list[dict], part_name: str) -> None:
+        """Записывает новые строки дня в отдельную часть партиции."""
+        partition = self.data_dir / f"date={day}"
+        partition.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pylist(records, schema=INTERACTIONS_SCHEMA)
+        tmp_path = partition / f".{part_name}.tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, partition / part_name)
+
+        parts = sorted(partition.glob("part-*.parquet"))
+        if len(parts) > MAX_PARTS_PER_PARTITION:
+            self._compact(partition, parts)
+
+    @staticmethod
+    def _compact(partition: Path, parts: list[Path]) -> None:
+        """Сливает части партиции в один файл."""
+        table = pa.concat_tables(pq.read_table(part, schema=INTERACTIONS_SCHEMA) for part in parts)
+        # Имя слитой части сортируется раньше новых частей того же дня
+        target = partition / "part-0-compacted.parquet"
+        tmp_path = partition / ".compacted.tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, target)
+        for part in parts:
+            if part != target:
+                part.unlink(missing_ok=True)
+
+    def ingest(self, log_dir: Path) -> int:
+        """
+        Загружает в хранилище строки, появившиеся в логах с прошлого раза.
+
+        Args:
+            log_dir: Папка с логами бота.
+
+        Returns:
+            Количество добавленных записей.
+        """
+        if not log_dir.exists():
+            return 0
+        # Streamlit обслуживает сессии в разных потоках
+        with self._lock:
+            return self._ingest(log_dir)
+
+    def _load_rollup(self, day: str) -> tuple[int, DayRollup]:
+        """
+        Возвращает агрегаты дня и смещение в логе, до которого они посчитаны.
+        """
+        if day not in self._rollups:
+            try:
+                with open(self.rollups_dir / f"{day}.json", "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._rollups[day] = (data["offset"], DayRollup.from_dict(data["rollup"]))
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                self._rollups[day] = (0, DayRollup())
+        return self._rollups[day]
+
+    def _save_rollup(self, day: str, offset: int, rollup: DayRollup) -> None:
+        """Атомарно сохраняет агрегаты дня."""
+        self.rollups_dir.mkdir(parents=True, exist_ok=True)
+        path = self.rollups_dir / f"{day}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"offset": offset, "rollup": rollup.to_dict()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._rollups[day] = (offset, rollup)
+
+    def _update_rollup(self, day: str, records: list[dict], offset: int, new_offset: int) -> None:
+        """Добавляет записи в агрегаты дня, если этот диапазон логов еще не учтен."""
+        rollup_offset, rollup = self._load_rollup(day)
+        # Повторная загрузка после сбоя не должна учитывать строки дважды
+        if rollup_offset > offset:
+            return
+        rollup.add_records(records)
+        self._save_rollup(day, new_offset, rollup)
+
+    def _rebuild_rollups(self) -> None:
+        """Пересчитывает агрегаты всех дней из партиций хранилища."""
+        columns = ["user_id", "query", "doc_type", "query_length", "response_length"]
+        for day in self.dates():
+            day = day.isoformat()
+            partition = self.data_dir / f"date={day}"
+            table = pa.concat_tables(
+                pq.read_table(part, columns=columns, schema=INTERACTIONS_SCHEMA)
+                for part in sorted(partition.glob("part-*.parquet"))
+            )
+            rollup = DayRollup()
+            rollup.add_records(table.to_pylist())
+            offset = self.state["files"].get(f"interactions_{day}.jsonl", {}).get("offset", 0)
+            self._save_rollup(day, offset, rollup)
+        self.state["rollups_version"] = ROLLUPS_VERSION
+        self.state["version"] += 1
+        self._save_state()
+
+    def _ingest(self, log_dir: Path) -> int:
+        """Выполняет загрузку новых строк (под блокировкой)."""
+        if self.state.get("rollups_version") != ROLLUPS_VERSION:
+            self._rebuild_rollups()
+
+        added = 0
+        files_state = self.state["files"]
+        for key, path in self._log_files(log_dir).items():
+            entry = files_state.setdefault(key, {"offset": 0})
+            size = path.stat().st_size
+            if path.suffix == ".gz":
+                # Сжатый лог неизменен: повторно распаковываем, только если архив изменился
+                if entry.get("gz_size") == size:
+                    continue
+            elif size <= entry["offset"]:
+                continue
+
+            offset = entry["offset"]
+            lines, new_offset = self._read_new_lines(path, offset)
+            records = self._parse(lines)
+            if records:
+                day = key[len("interactions_"):-len(".jsonl")]
+                # Имя части зависит от диапазона байт: повторная загрузка после сбоя ее перезапишет
+                self._write_partition(day, records, f"part-{offset:012d}-{new_offset:012d}.parquet")
+                self._update_rollup(day, records, offset, new_offset)
+                added += len(records)
+            entry["offset"] = new_offset
+            if path.suffix == ".gz":
+                entry["gz_size"] = size
+            self._save_state()
+
+        if added:
+            self.state["version"] += 1
+            self._save_state()
+        return added
+
+    def dates(self) -> list[date]:
+        """Возвращает список дат, за которые в хранилище есть данные."""
+        if not self.data_dir.exists():
+            return []
+        return sorted(
+            date.fromisoformat(p.name[len("date="):])
+            for p in self.data_dir.glob("date=*") if p.is_dir()
+        )
+
+    def daily_rollups(self, start: Optional[date] = None, end: Optional[date] = None) -> dict[date, DayRollup]:
+        """
+        Возвращает агрегаты по дням за период.
+
+        Args:
+            start: Первая дата диапазона (включительно).
+            end: Последняя дата диапазона (включительно).
+
+        Returns:
+            Словарь дата -> агрегаты дня.
+        """
+        rollups = {}
+        with self._lock:
+            for day in self.dates():
+                if (start is not None and day < start) or (end is not None and day > end):
+                    continue
+                rollups[day] = self._load_rollup(day.isoformat())[1]
+        return rollups
+
+    def read(
+        self,
+        columns: list[str],
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        user_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> pa.Table:
+        """
+        Читает из хранилища только нужные колонки и партиции.
+
+        Args:
+            columns: Колонки для чтения (можно включать `date`).
+            start: Первая дата диапазона (включительно).
+            end: Последняя дата диапазона (включительно).
+            user_id: Фильтр по пользователю.
+            since: Нижняя граница `timestamp` (включительно).
+            until: Верхняя граница `timestamp` (включительно).
+
+        Returns:
+            Таблица Arrow с запрошенными колонками.
+        """
+        if not self.data_dir.exists():
+            schema = INTERACTIONS_SCHEMA.append(pa.field("date", pa.string()))
+            return schema.empty_table().select(columns)
+        dataset = ds.dataset(
+            self.data_dir,
+            schema=INTERACTIONS_SCHEMA.append(pa.field("date", pa.string())),
+            format="parquet",
+            partitioning="hive",
+        )
+        expression = None
+        conditions = []
+        if start is not None:
+            conditions.append(ds.field("date") >= start.isoformat())
+        if end is not None:
+            conditions.append(ds.field("date") <= end.isoformat())
+        if user_id is not None:
+            conditions.append(ds.field("user_id") == user_id)
+        if since is not None:
+            conditions.append(ds.field("timestamp") >= pa.scalar(since, type=pa.timestamp("us")))
+        if until is not None:
+            conditions.append(ds.field("timestamp") <= pa.scalar(until, type=pa.timestamp("us")))
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return dataset.to_table(columns=columns, filter=expression)
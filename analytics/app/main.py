@@ -1,83 +1,149 @@
+import os
 import streamlit as st
 import pandas as pd
+from datetime import date, datetime
 from pathlib import Path
-import json
+from typing import Optional
 import plotly.express as px
-from wordcloud import WordCloud
+from wordcloud import WordCloud, STOPWORDS
 import matplotlib.pyplot as plt
 
+from dialogue_index import DialogueIndex
+from log_store import LogStore
+from rollups import DayRollup, merge_rollups
+from sql_store import SqlStore
+
 # --- Конфигурация ---
 # Определяем корень проекта относительно текущего файла
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 LOGS_DIR = PROJECT_ROOT / "telegram_bot" / "logs"
+# Колоночное хранилище логов (должно быть доступно на запись)
+STORE_DIR = Path(os.getenv("ANALYTICS_STORE_DIR", PROJECT_ROOT / "analytics_data"))
+
+# Колонки для индекса диалогов: тексты ответов сюда не загружаются
+OVERVIEW_COLUMNS = ["timestamp", "user_id", "username", "query"]
+DIALOGUE_COLUMNS = ["timestamp", "query", "response"]
+# Размер страницы просмотрщика диалогов по умолчанию
+DIALOGUE_PAGE_SIZE = int(os.getenv("ANALYTICS_DIALOGUE_PAGE_SIZE", "20"))
+PAGE_SIZE_OPTIONS = sorted({10, 20, 50, 100, DIALOGUE_PAGE_SIZE})
+# PostgreSQL с взаимодействиями (таблицы backend); если задан, данные читаются SQL-запросами
+DATABASE_URL = os.getenv("ANALYTICS_DATABASE_URL")
+# Сколько секунд результаты SQL-запросов переиспользуются между обновлениями страницы
+SQL_CACHE_TTL = int(os.getenv("ANALYTICS_SQL_CACHE_TTL", "60"))
 
 # --- Функции для загрузки данных ---
-@st.cache_data
-def load_log_data(log_dir: Path) -> pd.DataFrame:
-    """Загружает все interaction логи из .jsonl файлов в DataFrame."""
-    all_interactions = []
+@st.cache_resource
+def get_log_store() -> LogStore:
+    """Возвращает общее для всех сессий хранилище логов."""
+    return LogStore(STORE_DIR)
+
+def refresh_log_store(store: LogStore, log_dir: Path) -> int:
+    """Догружает в хранилище новые строки логов (только приращение)."""
     if not log_dir.exists():
         st.warning(f"Папка с логами не найдена: {log_dir}")
-        return pd.DataFrame()
+        return 0
+    return store.ingest(log_dir)
 
-    log_files = sorted(log_dir.glob("interactions_*.jsonl"))
-    if not log_files:
-        st.info("Логи взаимодействий пока отсутствуют.")
-        return pd.DataFrame()
-
-    for log_file in log_files:
-        with open(log_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    all_interactions.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue # Пропускаем поврежденные строки
-
-    df = pd.DataFrame(all_interactions)
-    if not df.empty:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['date'] = df['timestamp'].dt.date
-    return df
+@st.cache_data
+def load_log_data(_store: LogStore, version: int, start: Optional[date], end: Optional[date]) -> pd.DataFrame:
+    """
+    Загружает из хранилища колонки для индекса диалогов за выбранный период.
+
+    `version` входит в ключ кеша: при появлении новых логов данные перечитываются.
+    """
+    return _store.read(OVERVIEW_COLUMNS, start=start, end=end).to_pandas()
+
+@st.cache_data
+def load_rollups(_store: LogStore, version: int, start: Optional[date], end: Optional[date]) -> tuple[pd.DataFrame, DayRollup]:
+    """
+    Собирает агрегаты за период: сообщения по дням и сумму агрегатов всех дней.
+    """
+    daily = _store.daily_rollups(start, end)
+    daily_activity = pd.DataFrame(
+        {"date": list(daily), "messages": [rollup.messages for rollup in daily.values()]}
+    )
+    return daily_activity, merge_rollups(daily.values())
+
+@st.cache_resource(max_entries=4)
+def get_dialogue_index(_df: pd.DataFrame, version: int, start: Optional[date], end: Optional[date]) -> DialogueIndex:
+    """Строит индекс диалогов по загруженным данным (один раз на версию и период)."""
+    return DialogueIndex(_df)
+
+@st.cache_data(max_entries=64)
+def load_page_responses(_store: LogStore, version: int, user_id: int, since: datetime, until: datetime) -> pd.DataFrame:
+    """Загружает тексты ответов только для строк одной страницы диалога."""
+    return _store.read(DIALOGUE_COLUMNS, user_id=user_id, since=since, until=until).to_pandas()
+
+@st.cache_resource
+def get_sql_store() -> Optional[SqlStore]:
+    """Возвращает подключение к PostgreSQL, если оно настроено."""
+    return SqlStore(DATABASE_URL) if DATABASE_URL else None
+
+@st.cache_data(ttl=SQL_CACHE_TTL)
+def load_sql_summary(_store: SqlStore, start: Optional[date], end: Optional[date]) -> tuple[pd.DataFrame, DayRollup, int]:
+    """Считает агрегаты периода в PostgreSQL."""
+    return _store.period_summary(start, end)
+
+@st.cache_data(ttl=SQL_CACHE_TTL)
+def load_sql_users(_store: SqlStore, start: Optional[date], end: Optional[date]) -> list[tuple[int, int]]:
+    """Загружает список пользователей с числом сообщений за период."""
+    return _store.users(start, end)
+
+@st.cache_data(ttl=SQL_CACHE_TTL, max_entries=64)
+def load_sql_page(
+    _store: SqlStore, user_id: int, start: Optional[date], end: Optional[date], search: str, page: int, page_size: int
+) -> tuple[pd.DataFrame, int]:
+    """Загружает одну страницу диалога из PostgreSQL."""
+    return _store.dialogue_page(user_id, start, end, search, page, page_size)
 
 # --- Функции для отрисовки ---
-def display_kpi_metrics(df: pd.DataFrame):
-    """Отображает ключевые метрики производительности."""
+def display_kpi_metrics(rollup: DayRollup, unique_users: Optional[int] = None):
+    """
+    Отображает ключевые метрики производительности.
+
+    `unique_users` — точное число пользователей (из PostgreSQL); без него
+    используется приближенная оценка из агрегатов.
+    """
     st.subheader("📊 Ключевые метрики")
     
-    if df.empty:
+    if rollup.messages == 0:
         st.info("Нет данных для отображения метрик.")
         return
 
-    total_messages = len(df)
-    unique_users = df['user_id'].nunique()
-    avg_resp_len = df['response_length'].mean()
-    avg_query_len = df['query_length'].mean()
+    total_messages = rollup.messages
+    users_label = f"{unique_users}" if unique_users is not None else f"≈{rollup.users.count()}"
+    avg_resp_len = rollup.response_length_sum / rollup.messages
+    avg_query_len = rollup.query_length_sum / rollup.messages
 
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Всего сообщений", f"{total_messages}")
-    col2.metric("Уникальных пользователей", f"{unique_users}")
+    col2.metric("Уникальных пользователей", users_label)
     col3.metric("Avg. длина ответа", f"{avg_resp_len:.1f} симв.")
     col4.metric("Avg. длина запроса", f"{avg_query_len:.1f} симв.")
 
-def display_activity_charts(df: pd.DataFrame):
+def display_activity_charts(daily_activity: pd.DataFrame):
     """Отображает графики активности."""
     st.subheader("📈 Активность пользователей")
     
-    if df.empty or 'date' not in df.columns:
+    if daily_activity.empty:
         st.info("Нет данных для построения графиков активности.")
         return
         
     # Активность по дням
-    daily_activity = df.groupby('date').size().reset_index(name='messages')
     fig_daily = px.bar(daily_activity, x='date', y='messages', title='Количество сообщений по дням', text_auto=True)
     fig_daily.update_layout(xaxis_title="Дата", yaxis_title="Количество сообщений")
     st.plotly_chart(fig_daily, use_container_width=True)
 
-def display_content_analysis(df: pd.DataFrame):
+@st.cache_data(max_entries=16)
+def build_wordcloud_image(frequencies: dict[str, int]):
+    """Строит изображение облака слов по готовым частотам."""
+    return WordCloud(width=800, height=400, background_color='white').generate_from_frequencies(frequencies).to_array()
+
+def display_content_analysis(rollup: DayRollup):
     """Отображает анализ контента запросов."""
     st.subheader("📝 Анализ контента")
     
-    if df.empty:
+    if rollup.messages == 0:
         st.info("Нет данных для анализа контента.")
         return
         
@@ -85,7 +151,7 @@ def display_content_analysis(df: pd.DataFrame):
 
     # Распределение типов документов
     with col1:
-        doc_type_counts = df['doc_type'].fillna('N/A').value_counts()
+        doc_type_counts = pd.Series(rollup.doc_types).sort_values(ascending=False)
         fig_pie = px.pie(
             doc_type_counts, 
             values=doc_type_counts.values, 
@@ -97,12 +163,14 @@ def display_content_analysis(df: pd.DataFrame):
     # Облако слов из запросов
     with col2:
         st.write("**Облако популярных слов в запросах**")
-        all_queries = " ".join(df['query'].dropna())
-        if all_queries:
+        frequencies = {
+            word: count for word, count in rollup.tokens.most_common(500) if word not in STOPWORDS
+        }
+        if frequencies:
             try:
-                wordcloud = WordCloud(width=800, height=400, background_color='white').generate(all_queries)
+                image = build_wordcloud_image(frequencies)
                 fig, ax = plt.subplots()
-                ax.imshow(wordcloud, interpolation='bilinear')
+                ax.imshow(image, interpolation='bilinear')
                 ax.axis('off')
                 st.pyplot(fig)
             except Exception as e:
@@ -110,29 +178,92 @@ def display_content_analysis(df: pd.DataFrame):
         else:
             st.info("Нет текста для создания облака слов.")
 
-def display_dialogue_viewer(df: pd.DataFrame):
-    """Отображает просмотрщик диалогов."""
+def display_dialogue_viewer(index: DialogueIndex, store: LogStore, start: Optional[date], end: Optional[date]):
+    """Отображает постраничный просмотрщик диалогов."""
     st.subheader("💬 Просмотр диалогов")
 
-    if df.empty:
+    user_list = index.users()
+    if not user_list:
         st.info("Нет диалогов для просмотра.")
         return
-        
-    user_list = df['user_id'].unique()
-    selected_user = st.selectbox("Выберите пользователя для просмотра диалога:", user_list)
 
-    if selected_user:
-        user_dialogues = df[df['user_id'] == selected_user].sort_values(by='timestamp')
-        
-        for _, row in user_dialogues.iterrows():
-            with st.chat_message("user"):
-                st.markdown(f"**Вы ({row['username']})** в {row['timestamp'].strftime('%Y-%m-%d %H:%M')}:")
-                st.write(row['query'])
-            
-            with st.chat_message("assistant", avatar="🧠"):
-                st.markdown(f"**Mind-Fix** ответил:")
-                st.write(row['response'])
-            st.markdown("---")
+    col_user, col_search, col_size = st.columns([2, 2, 1])
+    selected_user = col_user.selectbox(
+        "Выберите пользователя для просмотра диалога:",
+        user_list,
+        format_func=lambda user_id: f"{user_id} ({index.message_count(user_id)} сообщ.)",
+    )
+    search_text = col_search.text_input("Поиск по запросам:")
+    page_size = col_size.selectbox(
+        "На странице:", PAGE_SIZE_OPTIONS, index=PAGE_SIZE_OPTIONS.index(DIALOGUE_PAGE_SIZE)
+    )
+
+    rows = index.select(selected_user, start=start, end=end, text=search_text)
+    if len(rows) == 0:
+        st.info("Нет сообщений, подходящих под фильтры.")
+        return
+
+    total_pages = (len(rows) + page_size - 1) // page_size
+    page = st.number_input(f"Страница (из {total_pages}):", min_value=1, max_value=total_pages, value=1, step=1)
+    page_rows = index.page(rows, int(page), page_size)
+    st.caption(f"Найдено сообщений: {len(rows)}")
+
+    # Ответы читаются из хранилища только для диапазона времени текущей страницы
+    responses = load_page_responses(
+        store, store.version, int(selected_user),
+        page_rows['timestamp'].min().to_pydatetime(), page_rows['timestamp'].max().to_pydatetime(),
+    )
+    responses = responses.drop_duplicates(subset=['timestamp', 'query'])
+    page_dialogues = page_rows.merge(responses, on=['timestamp', 'query'], how='left')
+    display_dialogue_messages(page_dialogues)
+
+def display_sql_dialogue_viewer(store: SqlStore, start: Optional[date], end: Optional[date]):
+    """Отображает постраничный просмотрщик диалогов, читающий страницы из PostgreSQL."""
+    st.subheader("💬 Просмотр диалогов")
+
+    users = load_sql_users(store, start, end)
+    if not users:
+        st.info("Нет диалогов для просмотра.")
+        return
+    message_counts = dict(users)
+
+    col_user, col_search, col_size = st.columns([2, 2, 1])
+    selected_user = col_user.selectbox(
+        "Выберите пользователя для просмотра диалога:",
+        list(message_counts),
+        format_func=lambda user_id: f"{user_id} ({message_counts[user_id]} сообщ.)",
+    )
+    search_text = col_search.text_input("Поиск по запросам:")
+    page_size = col_size.selectbox(
+        "На странице:", PAGE_SIZE_OPTIONS, index=PAGE_SIZE_OPTIONS.index(DIALOGUE_PAGE_SIZE)
+    )
+
+    # Число страниц известно после первого запроса, поэтому номер страницы хранится в сессии
+    page_key = f"sql_page_{selected_user}_{search_text}_{page_size}"
+    page = int(st.session_state.get(page_key, 1))
+    page_dialogues, total = load_sql_page(store, selected_user, start, end, search_text, page, page_size)
+    if total == 0:
+        st.info("Нет сообщений, подходящих под фильтры.")
+        return
+
+    total_pages = (total + page_size - 1) // page_size
+    st.number_input(
+        f"Страница (из {total_pages}):", min_value=1, max_value=total_pages, step=1, key=page_key
+    )
+    st.caption(f"Найдено сообщений: {total}")
+    display_dialogue_messages(page_dialogues)
+
+def display_dialogue_messages(page_dialogues: pd.DataFrame):
+    """Отображает сообщения одной страницы диалога."""
+    for _, row in page_dialogues.iterrows():
+        with st.chat_message("user"):
+            st.markdown(f"**Вы ({row['username']})** в {row['timestamp'].strftime('%Y-%m-%d %H:%M')}:")
+            st.write(row['query'])
+
+        with st.chat_message("assistant", avatar="🧠"):
+            st.markdown(f"**Mind-Fix** ответил:")
+            st.write(row['response'])
+        st.markdown("---")
 
 def main():
     """
@@ -141,17 +272,62 @@ def main():
     st.set_page_config(page_title="Аналитика Mind-Fix", page_icon="🧠", layout="wide")
     st.title("Панель аналитики Mind-Fix")
 
-    # Загружаем данные
-    df_interactions = load_log_data(LOGS_DIR)
+    sql_store = get_sql_store()
+    if sql_store is not None:
+        display_sql_dashboard(sql_store)
+        return
+
+    # Догружаем новые строки логов и читаем только нужный период
+    store = get_log_store()
+    refresh_log_store(store, LOGS_DIR)
+    available_dates = store.dates()
+    start, end = None, None
+    if available_dates:
+        selected = st.sidebar.date_input(
+            "Период",
+            value=(available_dates[0], available_dates[-1]),
+            min_value=available_dates[0],
+            max_value=available_dates[-1],
+        )
+        if isinstance(selected, (list, tuple)) and len(selected) == 2:
+            start, end = selected
+    else:
+        st.info("Логи взаимодействий пока отсутствуют.")
+
+    daily_activity, period_rollup = load_rollups(store, store.version, start, end)
+    df_interactions = load_log_data(store, store.version, start, end)
 
     # Отображаем компоненты
-    display_kpi_metrics(df_interactions)
+    display_kpi_metrics(period_rollup)
+    st.markdown("---")
+    display_activity_charts(daily_activity)
+    st.markdown("---")
+    display_content_analysis(period_rollup)
+    st.markdown("---")
+    dialogue_index = get_dialogue_index(df_interactions, store.version, start, end)
+    display_dialogue_viewer(dialogue_index, store, start, end)
+
+def display_sql_dashboard(store: SqlStore):
+    """Отображает дашборд по данным PostgreSQL: агрегаты и страницы диалогов считаются в базе."""
+    date_range = store.date_range()
+    start, end = None, None
+    if date_range:
+        selected = st.sidebar.date_input(
+            "Период", value=date_range, min_value=date_range[0], max_value=date_range[1]
+        )
+        if isinstance(selected, (list, tuple)) and len(selected) == 2:
+            start, end = selected
+    else:
+        st.info("Взаимодействия пока отсутствуют.")
+
+    daily_activity, period_rollup, unique_users = load_sql_summary(store, start, end)
+    display_kpi_metrics(period_rollup, unique_users)
     st.markdown("---")
-    display_activity_charts(df_interactions)
+    display_activity_charts(daily_activity)
     st.markdown("---")
-    display_content_analysis(df_interactions)
+    display_content_analysis(period_rollup)
     st.markdown("---")
-    display_dialogue_viewer(df_interactions)
+    display_sql_dialogue_viewer(store, start, end)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
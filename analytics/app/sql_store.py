@@ -0,0 +1,138 @@
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from rollups import DayRollup
+
+# Слова для облака: те же правила, что и `rollups.tokenize` (буквы, от 3 символов)
+_WORDS_SQL = """
+SELECT word, count(*) AS n
+FROM (
+    SELECT regexp_split_to_table(lower(query), '[^a-zа-яё]+') AS word
+    FROM interactions
+    WHERE {period}
+) words
+WHERE length(word) >= 3
+GROUP BY word
+ORDER BY n DESC
+LIMIT :limit
+"""
+
+
+def _period(start: Optional[date], end: Optional[date]) -> tuple[str, dict]:
+    """Условие на период (по индексу `timestamp`) и его параметры."""
+    conditions, params = ["TRUE"], {}
+    if start is not None:
+        conditions.append("timestamp >= :since")
+        params["since"] = datetime.combine(start, time.min)
+    if end is not None:
+        conditions.append("timestamp < :until")
+        params["until"] = datetime.combine(end + timedelta(days=1), time.min)
+    return " AND ".join(conditions), params
+
+
+class SqlStore:
+    """
+    Чтение взаимодействий из PostgreSQL (таблицы backend `interactions`).
+
+    Агрегаты считаются в базе, а просмотрщик диалогов читает одну страницу
+    по индексу `(user_id, timestamp)`, поэтому в память дашборда не
+    загружается весь журнал.
+    """
+
+    def __init__(self, url: str):
+        self.engine = create_engine(url, pool_pre_ping=True, pool_size=2)
+
+    def date_range(self) -> Optional[tuple[date, date]]:
+        """Первая и последняя даты, за которые есть взаимодействия."""
+        with self.engine.connect() as conn:
+            first, last = conn.execute(text("SELECT min(timestamp), max(timestamp) FROM interactions")).one()
+        if first is None:
+            return None
+        return first.date(), last.date()
+
+    def period_summary(
+        self, start: Optional[date], end: Optional[date], words: int = 500
+    ) -> tuple[pd.DataFrame, DayRollup, int]:
+        """
+        Агрегаты за период.
+
+        Returns:
+            Сообщения по дням, агрегаты периода в виде `DayRollup`
+            (без скетча пользователей) и точное число уникальных пользователей.
+        """
+        period, params = _period(start, end)
+        rollup = DayRollup()
+        with self.engine.connect() as conn:
+            daily_activity = pd.read_sql(
+                text(f"SELECT CAST(timestamp AS date) AS date, count(*) AS messages FROM interactions "
+                     f"WHERE {period} GROUP BY 1 ORDER BY 1"),
+                conn, params=params,
+            )
+            messages, users, query_length_sum, response_length_sum = conn.execute(
+                text(f"SELECT count(*), count(DISTINCT user_id), coalesce(sum(query_length), 0), "
+                     f"coalesce(sum(response_length), 0) FROM interactions WHERE {period}"),
+                params,
+            ).one()
+            doc_types = conn.execute(
+                text(f"SELECT coalesce(doc_type, 'N/A'), count(*) FROM interactions WHERE {period} GROUP BY 1"),
+                params,
+            ).all()
+            tokens = conn.execute(text(_WORDS_SQL.format(period=period)), {**params, "limit": words}).all()
+        rollup.messages = messages
+        rollup.query_length_sum = int(query_length_sum)
+        rollup.response_length_sum = int(response_length_sum)
+        rollup.doc_types = Counter(dict(doc_types))
+        rollup.tokens = Counter(dict(tokens))
+        return daily_activity, rollup, users
+
+    def users(self, start: Optional[date], end: Optional[date]) -> list[tuple[int, int]]:
+        """Пользователи и число их сообщений за период (по убыванию числа сообщений)."""
+        period, params = _period(start, end)
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"SELECT user_id, count(*) AS n FROM interactions WHERE {period} "
+                     f"GROUP BY user_id ORDER BY n DESC, user_id"),
+                params,
+            ).all()
+        return [(int(user_id), int(n)) for user_id, n in rows]
+
+    def dialogue_page(
+        self,
+        user_id: int,
+        start: Optional[date],
+        end: Optional[date],
+        search: str,
+        page: int,
+        page_size: int,
+    ) -> tuple[pd.DataFrame, int]:
+        """
+        Одна страница диалога пользователя.
+
+        Args:
+            search: Подстрока для поиска в запросах (без учета регистра).
+            page: Номер страницы (с 1).
+
+        Returns:
+            Строки страницы (timestamp, username, query, response) и общее
+            число сообщений, подходящих под фильтры.
+        """
+        period, params = _period(start, end)
+        condition = f"user_id = :user_id AND {period}"
+        params["user_id"] = user_id
+        search = search.strip()
+        if search:
+            condition += " AND query ILIKE :pattern ESCAPE '\\'"
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params["pattern"] = f"%{escaped}%"
+        with self.engine.connect() as conn:
+            total = conn.execute(text(f"SELECT count(*) FROM interactions WHERE {condition}"), params).scalar_one()
+            rows = pd.read_sql(
+                text(f"SELECT timestamp, username, query, response FROM interactions WHERE {condition} "
+                     f"ORDER BY timestamp LIMIT :limit OFFSET :offset"),
+                conn, params={**params, "limit": page_size, "offset": (page - 1) * page_size},
+            )
+        return rows, int(total)
@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.model_warmup import model_warmer
+
+router = APIRouter()
+
+
+@router.get("/live")
+async def liveness():
+    """
+    Проба живости: процесс запущен и обрабатывает запросы.
+
+    Внешние сервисы не проверяются, чтобы их сбой не приводил
+    к перезапуску backend.
+    """
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness():
+    """
+    Проба готовности: AnythingLLM отвечает (если генерация идет через него),
+    а модель загружена в Ollama.
+
+    Возвращает 503, пока хотя бы одна проверка не пройдена, поэтому
+    трафик направляется на backend только после прогрева модели.
+    """
+    checks = await model_warmer.readiness()
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks, "warmup": model_warmer.get_stats()},
+    )
@@ -0,0 +1,40 @@
+from typing import Any
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from app.services.interaction_store import interaction_writer
+
+router = APIRouter()
+
+class InteractionBatch(BaseModel):
+    # Записи передаются в том виде, в каком бот пишет их в логи: по их
+    # содержимому вычисляется идентификатор, общий с импортом из файлов
+    interactions: list[dict[str, Any]] = []
+    sessions: list[dict[str, Any]] = []
+
+class InteractionBatchResponse(BaseModel):
+    accepted: int
+    dropped: int
+
+
+@router.post("/batch", response_model=InteractionBatchResponse, status_code=202)
+async def ingest_interactions(batch: InteractionBatch):
+    """
+    Принимает пачку записей логов бота для записи в PostgreSQL.
+
+    Записи ставятся в очередь и пишутся в базу фоновой задачей пачками;
+    ответ не ждет записи.
+    """
+    if not interaction_writer.running:
+        raise HTTPException(status_code=503, detail="Хранилище взаимодействий отключено")
+
+    accepted = interaction_writer.enqueue("interactions", batch.interactions)
+    accepted += interaction_writer.enqueue("sessions", batch.sessions)
+    return {"accepted": accepted, "dropped": len(batch.interactions) + len(batch.sessions) - accepted}
+
+
+@router.get("/stats")
+async def interaction_stats():
+    """Возвращает счетчики записи взаимодействий в базу."""
+    return interaction_writer.get_stats()
@@ -1,40 +1,656 @@
-from typing import Optional, Literal
+import asyncio
+import json
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Optional, Literal
 
-from fastapi import APIRouter, HTTPException, Depends, Request
-from pydantic import BaseModel
+import numpy as np
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
 
 from app.core.rag import anything_llm_client
 from app.core.config import settings
+from app.core.context import current_deadline
+from app.core.metrics import REQUESTS_CANCELLED
+from app.services.cache import response_cache
+from app.services.conversation import conversation_store
+from app.services.direct_rag import direct_rag
+from app.services.embeddings import embed_query
+from app.services.admission import AdmissionRejected, admission_queue, single_flight
+from app.services.lexical_index import lexical_index
+from app.services.semantic_cache import semantic_cache
+from app.services.semantic_index import semantic_index
 
 router = APIRouter()
 
+GenerationMode = Literal["anythingllm", "direct"]
+
 class RAGQueryRequest(BaseModel):
     text: str
-    # doc_type и topic больше не нужны, т.к. AnythingLLM управляет контекстом
-    # внутри своего рабочего пространства (workspace)
+    # Идентификатор пользователя для справедливой очереди к LLM
+    user_id: Optional[str] = None
+    # Тип и тема запроса (определяются ботом); по ним выбирается workspace
+    # с соответствующей частью базы знаний
+    doc_type: Optional[str] = None
+    topic: Optional[str] = None
+    # Путь генерации: через AnythingLLM или напрямую в Ollama (по умолчанию GENERATION_MODE)
+    mode: Optional[GenerationMode] = None
+
+class BatchQueryItem(RAGQueryRequest):
+    # Идентификатор вопроса, возвращается вместе с результатом
+    id: Optional[str] = None
+
+class RAGBatchRequest(BaseModel):
+    queries: list[BatchQueryItem] = Field(..., min_length=1)
+    # Идентификатор пользователя для очереди к LLM (общий для всего пакета)
+    user_id: Optional[str] = None
+    # Сколько вопросов пакета обрабатывается одновременно (ограничено BATCH_MAX_CONCURRENCY)
+    concurrency: int = Field(1, ge=1)
+    # Путь генерации для вопросов пакета без собственного `mode`
+    mode: Optional[GenerationMode] = None
 
 class RAGQueryResponse(BaseModel):
     response: str
     sources: list = []
 
-@router.post("/query", response_model=RAGQueryResponse)
-async def query_rag(request: RAGQueryRequest):
+class SearchResult(BaseModel):
+    score: float
+    type: Optional[str] = None
+    topic: Optional[str] = None
+    source: Optional[str] = None
+    text: str
+
+class SearchResponse(BaseModel):
+    results: list[SearchResult]
+    took_ms: float
+
+def _resolve_workspace(request: RAGQueryRequest) -> str:
+    """Выбирает workspace AnythingLLM по теме и типу запроса."""
+    if request.topic and request.topic in settings.ANYTHINGLLM_TOPIC_WORKSPACES:
+        return settings.ANYTHINGLLM_TOPIC_WORKSPACES[request.topic]
+    if request.doc_type and request.doc_type in settings.ANYTHINGLLM_TYPE_WORKSPACES:
+        return settings.ANYTHINGLLM_TYPE_WORKSPACES[request.doc_type]
+    return settings.ANYTHINGLLM_WORKSPACE_SLUG
+
+
+def _user_key(request: RAGQueryRequest | RAGBatchRequest, http_request: Request) -> str:
+    """Определяет ключ пользователя для очереди: user_id или адрес клиента."""
+    if request.user_id:
+        return f"user:{request.user_id}"
+    client = http_request.client
+    return f"ip:{client.host}" if client else "anonymous"
+
+
+def _rejection_to_http(e: AdmissionRejected) -> HTTPException:
+    """Преобразует отказ в допуске в HTTP-ответ с подсказкой Retry-After."""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=e.detail,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def _deadline_exceeded() -> HTTPException:
+    """Ответ на запрос, срок которого (заголовок `X-Request-Timeout`) истек до получения ответа."""
+    REQUESTS_CANCELLED.labels("deadline").inc()
+    return HTTPException(status_code=504, detail="Истек срок ответа на запрос")
+
+
+async def _wait_disconnect(http_request: Request) -> None:
+    """Ждет отключения клиента (тело запроса к этому моменту уже прочитано)."""
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _cancellable(http_request: Request, awaitable: Awaitable[dict]) -> dict:
     """
-    Отправляет запрос к AnythingLLM для получения ответа,
-    обогащенного данными из базы знаний.
+    Выполняет `awaitable`, отменяя его по истечении срока ответа или при отключении клиента.
+
+    Отмена доходит до upstream: соединение с AnythingLLM или Ollama
+    закрывается, и модель прекращает генерацию ответа, который никто
+    не прочитает.
+
+    Raises:
+        HTTPException: 504 — срок истек, 499 — клиент отключился.
     """
-    if not settings.ANYTHINGLLM_WORKSPACE_SLUG:
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_disconnect(http_request))
+    try:
+        async with asyncio.timeout_at(current_deadline()):
+            await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except TimeoutError:
+        raise _deadline_exceeded()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    if task.cancelled():
+        REQUESTS_CANCELLED.labels("disconnect").inc()
+        raise HTTPException(status_code=499, detail="Клиент закрыл соединение")
+    return task.result()
+
+
+def _mode(request: RAGQueryRequest) -> str:
+    """Путь генерации запроса: из поля `mode` или из настроек."""
+    return request.mode or settings.GENERATION_MODE
+
+
+def _require_workspace(modes: set[str]) -> None:
+    """Проверяет, что для запросов через AnythingLLM настроен workspace."""
+    if "anythingllm" in modes and not settings.ANYTHINGLLM_WORKSPACE_SLUG:
         raise HTTPException(status_code=500, detail="Не настроен `ANYTHINGLLM_WORKSPACE_SLUG` в .env")
 
+
+async def _anythingllm_answer(workspace_slug: str, query: str, session_id: Optional[str]) -> dict:
+    """
+    Запрашивает ответ у AnythingLLM.
+
+    Returns:
+        Словарь {"response", "sources"} или {"error": ...} при ошибке AnythingLLM.
+    """
     result = await anything_llm_client.query_workspace(
-        workspace_slug=settings.ANYTHINGLLM_WORKSPACE_SLUG,
-        query=request.text
+        workspace_slug=workspace_slug,
+        query=query,
+        session_id=session_id
     )
-
     if result and "error" not in result:
-        text_response = result.get("textResponse", "Ответ не найден.")
-        sources = result.get("sourceDocuments", [])
-        return {"response": text_response, "sources": sources}
+        return {"response": result.get("textResponse", "Ответ не найден."), "sources": result.get("sourceDocuments", [])}
+    return {"error": result.get("error", "Неизвестная ошибка от AnythingLLM")}
+
+
+def _cache_scope(request: RAGQueryRequest) -> str:
+    """Область кеша ответов: workspace AnythingLLM или модель прямого режима с фильтрами поиска."""
+    if _mode(request) == "direct":
+        return direct_rag.cache_scope(request.doc_type, request.topic)
+    return _resolve_workspace(request)
+
+
+def _generation(request: RAGQueryRequest, prompt: str, session_id: Optional[str]) -> Callable[[], Awaitable[dict]]:
+    """Выбирает путь генерации для запроса; возвращает функцию, запрашивающую ответ."""
+    if _mode(request) == "direct":
+        return lambda: direct_rag.answer(request.text, prompt, request.doc_type, request.topic)
+    workspace_slug = _resolve_workspace(request)
+    return lambda: _anythingllm_answer(workspace_slug, prompt, session_id)
+
+
+def _uses_context(request: RAGQueryRequest) -> bool:
+    """Проверяет, ведется ли для запроса контекст диалога."""
+    return conversation_store.enabled and bool(request.user_id)
+
+
+async def _prompt(request: RAGQueryRequest) -> tuple[str, Optional[str]]:
+    """
+    Собирает запрос к модели с учетом контекста диалога пользователя.
+
+    Returns:
+        Текст запроса (вопрос, дополненный сводкой и последними репликами)
+        и идентификатор сессии AnythingLLM. Контекст передается в самом
+        запросе, поэтому сессия каждый раз новая: иначе AnythingLLM добавил
+        бы к нему еще и собственную, неограниченно растущую историю чата.
+    """
+    if not _uses_context(request):
+        return request.text, None
+    conversation = await conversation_store.get(request.user_id)
+    return conversation.build_prompt(request.text), uuid.uuid4().hex
+
+
+def _cacheable(request: RAGQueryRequest, prompt: str) -> bool:
+    """
+    Проверяет, можно ли брать ответ из кеша и объединять одинаковые запросы.
+
+    Запрос с контекстом диалога уникален для пользователя: он не совпадет
+    ни с чьим другим, а в кеше только вытеснил бы ответы, которые
+    переиспользуются. Поэтому кешируются только вопросы без контекста.
+    """
+    return prompt == request.text
+
+
+async def _answer(
+    scope: str,
+    query: str,
+    user_key: str,
+    generate: Callable[[], Awaitable[dict]],
+    cacheable: bool = True,
+) -> dict:
+    """
+    Возвращает ответ из кеша или запрашивает его у модели через `generate`.
+
+    Одинаковые одновременные запросы обслуживаются одним вызовом upstream.
+
+    Args:
+        scope: Область кеша ответов (см. `_cache_scope`).
+        cacheable: Использовать точный и семантический кеш и объединение
+            одинаковых запросов (см. `_cacheable`); иначе ответ всегда
+            запрашивается у модели.
+
+    Returns:
+        Словарь {"response", "sources"} или {"error": ...} при ошибке upstream.
+
+    Raises:
+        AdmissionRejected: Очередь к LLM переполнена.
+    """
+    async def admitted() -> dict:
+        async with admission_queue.slot(user_key):
+            return await generate()
+
+    if not cacheable:
+        return await admitted()
+
+    cached = await response_cache.get(scope, query)
+    if cached is not None:
+        return cached
+    cached, vector = await semantic_cache.lookup(scope, query)
+    if cached is not None:
+        return cached
+
+    answer = await single_flight.do(response_cache.make_key(scope, query), admitted)
+    if "error" not in answer:
+        await response_cache.set(scope, query, answer)
+        semantic_cache.remember(scope, query, vector)
+    return answer
+
+
+@router.post("/query", response_model=RAGQueryResponse)
+async def query_rag(request: RAGQueryRequest, http_request: Request):
+    """
+    Отправляет запрос к модели (через AnythingLLM или напрямую в Ollama)
+    для получения ответа, обогащенного данными из базы знаний.
+
+    Генерация отменяется, если клиент отключился или истек срок ответа,
+    переданный в заголовке `X-Request-Timeout`.
+    """
+    _require_workspace({_mode(request)})
+
+    prompt, session_id = await _prompt(request)
+    generate = _generation(request, prompt, session_id)
+    try:
+        answer = await _cancellable(http_request, _answer(
+            _cache_scope(request), prompt, _user_key(request, http_request), generate, _cacheable(request, prompt)
+        ))
+    except AdmissionRejected as e:
+        raise _rejection_to_http(e)
+
+    if "error" in answer:
+        raise HTTPException(status_code=503, detail=answer["error"])
+    if _uses_context(request):
+        await conversation_store.append(request.user_id, request.text, answer["response"])
+    return answer
+
+
+async def _batch_item(index: int, item: BatchQueryItem, user_key: str, mode: Optional[str]) -> dict:
+    """
+    Обрабатывает один вопрос пакета; ошибки возвращаются в результате, а не исключением.
+
+    При переполненной очереди вопрос повторяется после паузы Retry-After.
+    Без собственного `mode` используется режим пакета `mode`.
+    """
+    started = time.perf_counter()
+    if item.mode is None and mode is not None:
+        item = item.model_copy(update={"mode": mode})
+    record = {"type": "result", "index": index, "id": item.id, "mode": _mode(item)}
+    scope, generate = _cache_scope(item), _generation(item, item.text, None)
+    attempts = 0
+    while True:
+        try:
+            answer = await _answer(scope, item.text, user_key, generate)
+            break
+        except AdmissionRejected as e:
+            attempts += 1
+            if attempts > settings.BATCH_ADMISSION_RETRIES:
+                answer = {"error": e.detail, "status_code": e.status_code}
+                break
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            answer = {"error": f"Внутренняя ошибка: {e}"}
+            break
+
+    record["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    if "error" in answer:
+        record["status"] = "error"
+        record.update(answer)
+    else:
+        record["status"] = "ok"
+        record["response"] = answer["response"]
+        record["sources"] = answer.get("sources", [])
+    return record
+
+
+async def _batch_results(request: RAGBatchRequest, user_key: str) -> AsyncIterator[str]:
+    """
+    Раздает вопросы пакета воркерам и отдает результаты в NDJSON по мере готовности.
+
+    Последняя строка — сводка пакета. При отключении клиента
+    незавершенные вопросы отменяются.
+    """
+    started = time.perf_counter()
+    concurrency = min(request.concurrency, settings.BATCH_MAX_CONCURRENCY, len(request.queries))
+    pending = iter(enumerate(request.queries))
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker() -> None:
+        for index, item in pending:
+            await results.put(await _batch_item(index, item, user_key, request.mode))
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    errors = 0
+    try:
+        for _ in range(len(request.queries)):
+            record = await results.get()
+            errors += record["status"] == "error"
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    summary = {
+        "type": "summary",
+        "total": len(request.queries),
+        "ok": len(request.queries) - errors,
+        "errors": errors,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    yield json.dumps(summary, ensure_ascii=False) + "\n"
+
+
+@router.post("/query:batch")
+async def query_rag_batch(request: RAGBatchRequest, http_request: Request):
+    """
+    Пакетный вариант `/query` для офлайн-оценки моделей.
+
+    Вопросы обрабатываются с ограниченным параллелизмом через общую очередь
+    к LLM. Ответ — NDJSON: по строке на вопрос в порядке готовности
+    (`index`, `id`, `mode`, `status`, `latency_ms`, `response`/`error`), затем сводка.
+    Ошибка отдельного вопроса не прерывает пакет. Пакет с одними и теми же
+    вопросами в режимах `anythingllm` и `direct` позволяет сравнить оба пути.
+    """
+    _require_workspace({item.mode or request.mode or settings.GENERATION_MODE for item in request.queries})
+    if len(request.queries) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"В пакете больше {settings.BATCH_MAX_ITEMS} вопросов")
+
+    return StreamingResponse(
+        _batch_results(request, _user_key(request, http_request)),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse_event(data: dict) -> str:
+    """Форматирует словарь как одно событие Server-Sent Events."""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _cached_events(cached: dict) -> AsyncIterator[str]:
+    """Отдает закешированный ответ в формате потока."""
+    yield _sse_event({"type": "chunk", "text": cached["response"]})
+    yield _sse_event({"type": "done", "sources": cached.get("sources", [])})
+
+
+class _SlotReleaser:
+    """Однократно освобождает слот очереди после завершения потока."""
+
+    def __init__(self):
+        self.released = False
+        self.started = time.monotonic()
+
+    async def __call__(self) -> None:
+        if not self.released:
+            self.released = True
+            admission_queue.release(time.monotonic() - self.started)
+
+
+async def _anythingllm_stream(workspace_slug: str, prompt: str, session_id: Optional[str]) -> AsyncIterator[dict]:
+    """
+    Переводит события stream-chat AnythingLLM в общий вид потоков генерации.
+
+    Yields:
+        `{"text": ...}` — фрагмент ответа, `{"sources": [...]}` — источники,
+        `{"error": ...}` — ошибка (последнее событие).
+    """
+    async for event in anything_llm_client.stream_workspace(
+        workspace_slug=workspace_slug,
+        query=prompt,
+        session_id=session_id
+    ):
+        if event.get("error"):
+            yield {"error": event["error"]}
+            return
+        if event.get("type") == "abort":
+            yield {"error": "Генерация прервана AnythingLLM"}
+            return
+        if event.get("sources"):
+            yield {"sources": event["sources"]}
+        if event.get("textResponse"):
+            yield {"text": event["textResponse"]}
+
+
+async def _before_deadline(events: AsyncIterator[dict], deadline: Optional[float]) -> AsyncIterator[dict]:
+    """
+    Пропускает события потока генерации до истечения срока ответа.
+
+    Срок ограничивает только ожидание upstream, а не отправку событий клиенту.
+    По истечении срока поток генерации закрывается и выдается `{"error": ...}`.
+    """
+    iterator = aiter(events)
+    while True:
+        try:
+            async with asyncio.timeout_at(deadline):
+                event = await anext(iterator)
+        except StopAsyncIteration:
+            return
+        except TimeoutError:
+            await iterator.aclose()
+            REQUESTS_CANCELLED.labels("deadline").inc()
+            yield {"error": "Истек срок ответа на запрос"}
+            return
+        yield event
+
+
+def _generation_stream(request: RAGQueryRequest, prompt: str, session_id: Optional[str]) -> AsyncIterator[dict]:
+    """Поток генерации по выбранному для запроса пути (события как у `_anythingllm_stream`)."""
+    if _mode(request) == "direct":
+        return direct_rag.stream(request.text, prompt, request.doc_type, request.topic)
+    return _anythingllm_stream(_resolve_workspace(request), prompt, session_id)
+
+
+async def _stream_events(
+    scope: str,
+    request: RAGQueryRequest,
+    prompt: str,
+    session_id: Optional[str],
+    vector: Optional[np.ndarray],
+    deadline: Optional[float],
+    releaser: _SlotReleaser,
+) -> AsyncIterator[str]:
+    """
+    Переводит поток генерации в компактный SSE-поток backend.
+
+    Слот очереди удерживается на все время генерации и освобождается
+    по ее окончании (или при отключении клиента). При отключении клиента
+    Starlette отменяет поток, и соединение с upstream закрывается.
+
+    Формат событий:
+        {"type": "chunk", "text": "..."} — очередной фрагмент ответа;
+        {"type": "done", "sources": [...]} — генерация завершена;
+        {"type": "error", "detail": "..."} — ошибка, поток закрывается.
+    """
+    try:
+        async for event in _upstream_events(scope, request, prompt, session_id, vector, deadline):
+            yield event
+    except (asyncio.CancelledError, GeneratorExit):
+        REQUESTS_CANCELLED.labels("disconnect").inc()
+        raise
+    finally:
+        await releaser()
+
+
+async def _upstream_events(
+    scope: str,
+    request: RAGQueryRequest,
+    prompt: str,
+    session_id: Optional[str],
+    vector: Optional[np.ndarray],
+    deadline: Optional[float],
+) -> AsyncIterator[str]:
+    """
+    Читает поток генерации, сохраняет полный ответ в кеш и в контекст диалога.
+
+    `vector` — эмбеддинг вопроса из семантического кеша (None, если он не использовался).
+    `deadline` — срок ответа по часам event loop: по его истечении генерация
+    прерывается и клиент получает событие ошибки.
+    """
+    sources: list = []
+    parts: list[str] = []
+    async for event in _before_deadline(_generation_stream(request, prompt, session_id), deadline):
+        if "error" in event:
+            yield _sse_event({"type": "error", "detail": event["error"]})
+            return
+        if event.get("sources"):
+            sources = event["sources"]
+        text = event.get("text")
+        if text:
+            parts.append(text)
+            yield _sse_event({"type": "chunk", "text": text})
+    if parts:
+        response = "".join(parts)
+        if _cacheable(request, prompt):
+            await response_cache.set(scope, prompt, {"response": response, "sources": sources})
+            semantic_cache.remember(scope, prompt, vector)
+        if _uses_context(request):
+            await conversation_store.append(request.user_id, request.text, response)
+    yield _sse_event({"type": "done", "sources": sources})
+
+
+@router.post("/query/stream")
+async def query_rag_stream(request: RAGQueryRequest, http_request: Request):
+    """
+    Потоковый вариант `/query`: отдает ответ по мере генерации (text/event-stream).
+
+    Позволяет клиенту показать первые токены сразу, не дожидаясь
+    окончания генерации всего ответа. Срок из заголовка `X-Request-Timeout`
+    ограничивает ожидание в очереди и генерацию.
+    """
+    _require_workspace({_mode(request)})
+
+    prompt, session_id = await _prompt(request)
+    scope = _cache_scope(request)
+    cached, vector = None, None
+    if _cacheable(request, prompt):
+        cached = await response_cache.get(scope, prompt)
+        if cached is None:
+            cached, vector = await semantic_cache.lookup(scope, prompt)
+    if cached is not None:
+        if _uses_context(request):
+            await conversation_store.append(request.user_id, request.text, cached["response"])
+        return StreamingResponse(_cached_events(cached), media_type="text/event-stream")
+
+    # Слот занимаем до начала ответа, чтобы при переполнении вернуть 429/503,
+    # а если срок ответа истек в очереди — 504
+    deadline = current_deadline()
+    try:
+        async with asyncio.timeout_at(deadline):
+            await admission_queue.acquire(_user_key(request, http_request))
+    except AdmissionRejected as e:
+        raise _rejection_to_http(e)
+    except TimeoutError:
+        raise _deadline_exceeded()
+
+    releaser = _SlotReleaser()
+    return StreamingResponse(
+        _stream_events(scope, request, prompt, session_id, vector, deadline, releaser),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Страховка на случай, если поток так и не был прочитан
+        background=BackgroundTask(releaser),
+    )
+
+
+@router.get("/search", response_model=SearchResponse)
+async def search_knowledge_base(
+    q: str = Query(..., min_length=1, description="Текст поискового запроса"),
+    type: Optional[Literal["theory", "practice", "extra"]] = Query(None, description="Фильтр по типу фрагмента"),
+    topic: Optional[str] = Query(None, description="Фильтр по теме фрагмента"),
+    limit: int = Query(5, ge=1, le=50),
+    mode: Literal["lexical", "semantic"] = Query("lexical", description="BM25 или поиск по эмбеддингам"),
+):
+    """
+    Поиск по базе знаний без обращения к AnythingLLM.
+
+    Выполняется в процессе backend по индексам, отображенным в память:
+    лексическому (BM25) или семантическому (IVF по эмбеддингам; эмбеддинг
+    запроса считает Ollama, его время входит в `took_ms`).
+    """
+    if not lexical_index.ready:
+        raise HTTPException(status_code=503, detail="Индекс базы знаний не загружен")
+    if mode == "semantic" and not semantic_index.ready:
+        raise HTTPException(status_code=503, detail="Семантический индекс базы знаний не загружен")
+
+    started = time.perf_counter()
+    if mode == "semantic":
+        vector = await embed_query(q)
+        if vector is None:
+            raise HTTPException(status_code=503, detail="Не удалось получить эмбеддинг запроса от Ollama")
+        hits = semantic_index.search(vector, top_k=limit, doc_type=type, topic=topic)
     else:
-        error_detail = result.get("error", "Неизвестная ошибка от AnythingLLM")
-        raise HTTPException(status_code=503, detail=error_detail) 
\ No newline at end of file
+        hits = lexical_index.search(q, top_k=limit, doc_type=type, topic=topic)
+    took_ms = (time.perf_counter() - started) * 1000
+    return {
+        "results": [
+            {"score": hit.score, "type": hit.type, "topic": hit.topic, "source": hit.source, "text": hit.text}
+            for hit in hits
+        ],
+        "took_ms": round(took_ms, 3),
+    }
+
+
+@router.get("/search/stats")
+async def search_stats():
+    """Возвращает размер индексов базы знаний и состояние семантического индекса."""
+    return {
+        "lexical": {"ready": lexical_index.ready, "documents": lexical_index.size},
+        "semantic": semantic_index.get_stats(),
+    }
+
+
+@router.get("/queue/stats")
+async def queue_stats():
+    """Возвращает глубину очереди к LLM, время ожидания и статистику объединения запросов."""
+    return {
+        **admission_queue.get_stats(),
+        "single_flight": {**single_flight.stats, "in_flight": single_flight.in_flight},
+    }
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Возвращает счетчики попаданий и промахов кеша ответов (и семантического кеша)."""
+    return {**response_cache.get_stats(), "semantic": semantic_cache.get_stats()}
+
+
+@router.post("/cache/invalidate")
+async def invalidate_cache():
+    """
+    Сбрасывает кеш ответов.
+
+    Вызывается после обновления базы знаний, чтобы не отдавать
+    ответы, построенные по устаревшим документам.
+    """
+    removed = await response_cache.invalidate()
+    semantic_cache.clear()
+    return {"status": "ok", "removed": removed}
+
+
+@router.get("/context/stats")
+async def context_stats():
+    """Возвращает размер хранилища контекстов диалогов в памяти воркера и счетчики вытеснения."""
+    return conversation_store.get_stats()
+
+
+@router.delete("/context/{user_id}")
+async def reset_context(user_id: str):
+    """Сбрасывает контекст диалога пользователя (например, по команде /start в боте)."""
+    await conversation_store.reset(user_id)
+    return {"status": "ok"}
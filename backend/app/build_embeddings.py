@@ -0,0 +1,47 @@
+"""
+Расчет эмбеддингов базы знаний и построение семантического индекса заранее.
+
+Без него индекс строится в фоне при первом старте backend после обновления
+базы знаний. Эмбеддинги хранятся по хешу текста, поэтому повторный запуск
+считает их только для новых и измененных фрагментов.
+
+Запуск из каталога backend:
+    python -m app.build_embeddings --kb data/knowledge_base.jsonl
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+from app.services.semantic_index import SemanticIndex
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Точка входа CLI."""
+    parser = argparse.ArgumentParser(description="Эмбеддинги базы знаний и семантический индекс")
+    parser.add_argument("--kb", type=Path, default=Path(settings.KNOWLEDGE_BASE_PATH), help="Файл knowledge_base.jsonl")
+    parser.add_argument("--index-dir", type=Path, default=Path(settings.SEMANTIC_INDEX_DIR), help="Каталог индекса")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", stream=sys.stdout)
+
+    if not args.kb.exists():
+        print(f"База знаний не найдена: {args.kb}", file=sys.stderr)
+        return 1
+
+    index = SemanticIndex(kb_path=args.kb, index_dir=args.index_dir)
+    started = time.perf_counter()
+    index.load_or_build()
+    if not index.ready:
+        return 1
+    stats = index.get_stats()
+    stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(stats, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,6 @@
 import os
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -14,11 +16,84 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str = "db"
     POSTGRES_PORT: int = 5432
     DATABASE_URL: str = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    DB_POOL_SIZE: int = 5
+
+    # Хранилище взаимодействий в PostgreSQL (бот присылает записи логов пачками)
+    INTERACTION_STORE_ENABLED: bool = True
+    INTERACTION_BATCH_SIZE: int = 1000 # Строк в одной вставке (COPY)
+    INTERACTION_FLUSH_INTERVAL: float = 1.0 # Секунды ожидания неполной пачки
+    INTERACTION_QUEUE_MAX_SIZE: int = 50000 # Записи сверх лимита отбрасываются (остаются в логах бота)
     
     # Ollama
     OLLAMA_BASE_URL: str = "http://ollama:11434"
     LLM_MODEL_NAME: str = "llama3.1:8b"
 
+    # Прогрев модели в Ollama и проверка готовности (/health/ready)
+    OLLAMA_WARMUP_ENABLED: bool = True
+    OLLAMA_KEEP_ALIVE: str = "30m" # Сколько Ollama держит модель в памяти после прогрева
+    OLLAMA_KEEPALIVE_INTERVAL: float = 120.0 # Секунды между пингами; меньше keep-alive AnythingLLM (5 мин)
+    OLLAMA_WARMUP_TIMEOUT: float = 300.0 # Загрузка модели на CPU может быть долгой
+    OLLAMA_WARMUP_RETRY_INTERVAL: float = 5.0 # Пауза между попытками, пока Ollama недоступна
+    OLLAMA_NUM_CTX: int = 0 # Как в AnythingLLM, иначе первый запрос перезагрузит модель; 0 — не передавать
+    READINESS_TIMEOUT: float = 2.0 # Таймаут проверки AnythingLLM и Ollama
+    READINESS_CACHE_TTL: float = 2.0 # Частые пробы не создают лишних запросов к сервисам
+
+    # Режим генерации: через AnythingLLM или напрямую в Ollama с поиском по локальному индексу.
+    # Запрос может выбрать режим сам (поле `mode`)
+    GENERATION_MODE: Literal["anythingllm", "direct"] = "anythingllm"
+    DIRECT_TOP_K: int = 4 # Фрагментов базы знаний в запросе к модели
+    DIRECT_MAX_CONTEXT_CHARS: int = 4000 # Предел суммарной длины фрагментов
+    DIRECT_SYSTEM_PROMPT: str = "" # Пусто — встроенный; должен быть неизменным, чтобы Ollama переиспользовала KV-кеш
+
+    # AnythingLLM
+    ANYTHINGLLM_API_URL: str = "http://anythingllm:3001"
+    ANYTHINGLLM_API_KEY: str = ""
+    ANYTHINGLLM_WORKSPACE_SLUG: str = ""
+    # Отдельные workspace с частью базы знаний для сужения поиска (JSON в .env),
+    # например {"theory": "mind-fix-theory"} и {"тревога": "mind-fix-anxiety"}.
+    # Тема точнее типа, поэтому проверяется первой; без совпадений — основной workspace
+    ANYTHINGLLM_TYPE_WORKSPACES: dict[str, str] = {}
+    ANYTHINGLLM_TOPIC_WORKSPACES: dict[str, str] = {}
+
+    # HTTP-клиент для AnythingLLM (один пул соединений на воркер)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0 # Секунды простоя до закрытия keep-alive соединения
+    HTTP2_ENABLED: bool = False
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 120.0 # Генерация ответа локальной моделью может быть долгой
+    HTTP_WRITE_TIMEOUT: float = 10.0
+    HTTP_POOL_TIMEOUT: float = 5.0
+
+    # Допуск запросов к LLM
+    LLM_MAX_CONCURRENCY: int = 2 # Сколько генераций Ollama выполняет одновременно
+    LLM_MAX_QUEUE: int = 50 # Общий предел очереди ожидания
+    LLM_MAX_QUEUE_PER_USER: int = 3
+
+    # Пакетные запросы (/query:batch) для офлайн-оценки моделей
+    BATCH_MAX_ITEMS: int = 1000
+    BATCH_MAX_CONCURRENCY: int = 2 # Не больше LLM_MAX_QUEUE_PER_USER, иначе часть запросов получит 429
+    BATCH_ADMISSION_RETRIES: int = 3 # Повторы элемента при переполненной очереди (с паузой Retry-After)
+
+    # Срок ответа, переданный клиентом в заголовке X-Request-Timeout (бот задает RAG_DEADLINE).
+    # По истечении срока или при отключении клиента генерация отменяется
+    REQUEST_MAX_TIMEOUT: float = 600.0 # Верхняя граница срока из заголовка
+
+    # Локальный лексический поиск (BM25) по базе знаний
+    KNOWLEDGE_BASE_PATH: str = "data/knowledge_base.jsonl"
+    BM25_INDEX_DIR: str = "rag_data/bm25"
+    BM25_K1: float = 1.5
+    BM25_B: float = 0.75
+
+    # Эмбеддинги (Ollama /api/embed) и семантический поиск по базе знаний
+    EMBEDDING_MODEL: str = "nomic-embed-text"
+    EMBEDDING_BATCH_SIZE: int = 64 # Фрагментов в одном запросе к Ollama
+    EMBEDDING_STORE_DIR: str = "rag_data/embeddings" # Векторы по хешу текста: при обновлении базы считаются только новые
+    SEMANTIC_INDEX_ENABLED: bool = False # Требует загруженной в Ollama модели EMBEDDING_MODEL
+    SEMANTIC_INDEX_DIR: str = "rag_data/semantic"
+    SEMANTIC_NPROBE: int = 8 # Сколько ближайших кластеров IVF просматривается при поиске
+    DIRECT_RETRIEVAL: Literal["lexical", "semantic"] = "lexical" # Поиск фрагментов в прямом режиме
+
     # ChromaDB
     CHROMA_HOST: str = "chromadb"
     CHROMA_PORT: int = 8000 # Внутренний порт ChromaDB
@@ -27,6 +102,30 @@ class Settings(BaseSettings):
     # Redis
     REDIS_HOST: str = "redis_cache"
     REDIS_PORT: int = 6379
+    REDIS_DB: int = 0
+    REDIS_SOCKET_TIMEOUT: float = 0.5 # Кеш не должен задерживать запрос при проблемах с Redis
+    REDIS_RETRY_INTERVAL: float = 10.0 # Пауза перед повторным обращением к Redis после сбоя
+
+    # Кеш ответов RAG
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL: int = 86400 # Секунды
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10000 # Ограничение размера в Redis
+    RESPONSE_CACHE_LOCAL_MAX_ENTRIES: int = 512 # LRU в памяти каждого воркера
+    RESPONSE_CACHE_LOCAL_TTL: float = 300.0
+    # Семантический кеш: ответ на похожий (а не только совпадающий) вопрос без контекста диалога
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92 # Косинусная близость эмбеддингов вопросов
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 10000 # Вопросов в памяти каждого воркера
+
+    # Контекст диалога пользователя (последние реплики + скользящая сводка)
+    CONTEXT_ENABLED: bool = True
+    CONTEXT_MAX_TOKENS: int = 1200 # Предел контекста в запросе к модели, независимо от длины сессии
+    CONTEXT_RECENT_TURNS: int = 4 # Сколько последних реплик передается дословно
+    CONTEXT_SUMMARY_MAX_TOKENS: int = 300 # Часть бюджета под сводку более ранних реплик
+    CONTEXT_CHARS_PER_TOKEN: float = 3.0 # Оценка для русского текста
+    CONTEXT_TTL: int = 3600 # Секунды неактивности до удаления контекста
+    CONTEXT_MAX_USERS: int = 10000 # Ограничения копий контекстов в памяти каждого воркера
+    CONTEXT_MAX_MEMORY_MB: float = 64.0
 
 
-settings = Settings() 
\ No newline at end of file
+settings = Settings()
@@ -0,0 +1,52 @@
+import asyncio
+import math
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from .config import settings
+
+# Заголовок, в котором бот и backend передают идентификатор запроса
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Заголовок с оставшимся сроком ответа на запрос в секундах (относительный,
+# чтобы не зависеть от расхождения часов между контейнерами)
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# Идентификатор текущего запроса; выставляется middleware в `app.main`
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Срок ответа на текущий запрос по часам event loop (`loop.time()`); None — без срока
+deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def new_request_id() -> str:
+    """Создает новый идентификатор запроса."""
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id() -> str:
+    """Возвращает идентификатор текущего запроса (или "-" вне запроса)."""
+    return request_id_var.get()
+
+
+def parse_deadline(value: Optional[str]) -> Optional[float]:
+    """
+    Переводит значение заголовка `X-Request-Timeout` в срок по часам event loop.
+
+    Срок ограничивается `REQUEST_MAX_TIMEOUT`; некорректное значение игнорируется.
+    """
+    if not value:
+        return None
+    try:
+        timeout = float(value)
+    except ValueError:
+        return None
+    if not math.isfinite(timeout):
+        return None
+    return asyncio.get_running_loop().time() + min(max(timeout, 0.0), settings.REQUEST_MAX_TIMEOUT)
+
+
+def current_deadline() -> Optional[float]:
+    """Возвращает срок ответа на текущий запрос (для `asyncio.timeout_at`) или None."""
+    return deadline_var.get()
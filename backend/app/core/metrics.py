@@ -0,0 +1,59 @@
+"""
+Метрики backend в формате Prometheus (отдаются на `/metrics`).
+
+Этапы обработки запроса:
+    backend_request_seconds — от получения запроса до начала ответа
+        (для потоковых эндпоинтов — до отправки заголовков);
+    backend_cache_lookup_seconds — поиск в кеше ответов (`semantic_*` —
+        поиск похожего вопроса в семантическом кеше, включая эмбеддинг запроса);
+    backend_queue_wait_seconds — ожидание слота в очереди к LLM;
+    backend_upstream_seconds — полный вызов AnythingLLM (поиск + генерация)
+        или Ollama в прямом режиме (операции `direct_*`), эмбеддинги запросов (`embed`);
+    backend_upstream_ttfb_seconds — время до первого фрагмента потока по режимам;
+    backend_direct_prompt_eval_tokens — токены запроса, которые Ollama
+        вычислила заново (без переиспользованного KV-кеша префикса);
+    backend_requests_cancelled_total — запросы, генерация которых отменена
+        по истечении срока ответа или из-за отключения клиента.
+"""
+from prometheus_client import Counter, Histogram
+
+# Границы корзин: от миллисекунд (кеш) до минут (генерация на CPU)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+REQUEST_SECONDS = Histogram(
+    "backend_request_seconds", "Время обработки HTTP-запроса backend",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+CACHE_LOOKUP_SECONDS = Histogram(
+    "backend_cache_lookup_seconds", "Время поиска в кеше ответов",
+    ["result"], buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "backend_queue_wait_seconds", "Время ожидания слота в очереди к LLM",
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "backend_admission_rejected_total", "Запросы, отклоненные очередью к LLM",
+    ["status"],
+)
+UPSTREAM_SECONDS = Histogram(
+    "backend_upstream_seconds", "Длительность вызова AnythingLLM или Ollama",
+    ["operation", "outcome"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_TTFB_SECONDS = Histogram(
+    "backend_upstream_ttfb_seconds", "Время до первого фрагмента ответа модели",
+    ["mode"], buckets=LATENCY_BUCKETS,
+)
+PROMPT_EVAL_TOKENS = Histogram(
+    "backend_direct_prompt_eval_tokens", "Токены запроса, вычисленные Ollama без KV-кеша",
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192),
+)
+REQUESTS_CANCELLED = Counter(
+    "backend_requests_cancelled_total", "Запросы, отмененные до окончания генерации",
+    ["reason"],
+)
+RESPONSE_CHARS = Histogram(
+    "backend_response_chars", "Длина ответа модели в символах",
+    ["operation"], buckets=SIZE_BUCKETS,
+)
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import time
+import httpx
+from typing import AsyncIterator, Optional
+
+from .config import settings
+from .context import REQUEST_ID_HEADER, current_request_id
+from .metrics import PROMPT_EVAL_TOKENS, RESPONSE_CHARS, UPSTREAM_SECONDS, UPSTREAM_TTFB_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class OllamaClient:
+    """
+    Асинхронный клиент API Ollama: генерация в прямом режиме, эмбеддинги
+    запросов и прогрев модели (`app.services.model_warmup`).
+
+    Как и клиент AnythingLLM, использует один долгоживущий `httpx.AsyncClient`
+    с пулом соединений, который открывается при старте приложения.
+    """
+    def __init__(self, base_url: str, model: str):
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Создает HTTP-клиент с пулом соединений по настройкам из `Settings`."""
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            read=settings.HTTP_READ_TIMEOUT,
+            write=settings.HTTP_WRITE_TIMEOUT,
+            pool=settings.HTTP_POOL_TIMEOUT,
+        )
+        return httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=timeout)
+
+    async def start(self) -> None:
+        """Открывает общий пул соединений. Повторный вызов ничего не делает."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+
+    async def close(self) -> None:
+        """Закрывает пул соединений и освобождает сокеты."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Возвращает общий HTTP-клиент, создавая его лениво вне lifespan приложения."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    def _payload(self, messages: list[dict], stream: bool) -> dict:
+        """
+        Тело запроса к `/api/chat`.
+
+        `keep_alive` и `num_ctx` совпадают с прогревом модели: при других
+        параметрах контекста Ollama перезагрузила бы модель.
+        """
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+        }
+        if settings.OLLAMA_NUM_CTX:
+            payload["options"] = {"num_ctx": settings.OLLAMA_NUM_CTX}
+        return payload
+
+    async def load_model(self, timeout: float) -> None:
+        """
+        Загружает модель в память Ollama или продлевает ее keep-alive.
+
+        Пустой запрос к `/api/generate` ничего не генерирует.
+
+        Raises:
+            httpx.HTTPError: Ollama недоступна или вернула ошибку.
+        """
+        payload = {"model": self.model, "prompt": "", "keep_alive": settings.OLLAMA_KEEP_ALIVE}
+        if settings.OLLAMA_NUM_CTX:
+            payload["options"] = {"num_ctx": settings.OLLAMA_NUM_CTX}
+        response = await self.client.post(
+            "/api/generate", json=payload, timeout=httpx.Timeout(timeout, connect=settings.HTTP_CONNECT_TIMEOUT)
+        )
+        response.raise_for_status()
+
+    async def running_models(self, timeout: float) -> list[dict]:
+        """
+        Возвращает модели, загруженные сейчас в память Ollama (`/api/ps`).
+
+        Raises:
+            httpx.HTTPError: Ollama недоступна или вернула ошибку.
+            ValueError: Ответ не является JSON.
+        """
+        response = await self.client.get("/api/ps", timeout=timeout)
+        response.raise_for_status()
+        return response.json().get("models") or []
+
+    async def chat(self, messages: list[dict]) -> dict:
+        """
+        Генерирует ответ модели на список сообщений.
+
+        Args:
+            messages: Сообщения чата (`role`, `content`).
+
+        Returns:
+            Ответ Ollama (`message.content`, счетчики токенов) или `{"error": ...}`.
+        """
+        request_id = current_request_id()
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            response = await self.client.post(
+                "/api/chat", json=self._payload(messages, stream=False), headers={REQUEST_ID_HEADER: request_id}
+            )
+            response.raise_for_status()
+            result = response.json()
+            RESPONSE_CHARS.labels("direct_chat").observe(len(result.get("message", {}).get("content") or ""))
+            if "prompt_eval_count" in result:
+                PROMPT_EVAL_TOKENS.observe(result["prompt_eval_count"])
+            return result
+        except httpx.HTTPStatusError as e:
+            outcome = "http_error"
+            logger.error(f"[{request_id}] Ошибка API Ollama: {e.response.status_code} - {e.response.text}")
+            return {"error": f"Ошибка API Ollama: {e.response.status_code}"}
+        except asyncio.CancelledError:
+            # Клиент отключился или истек срок ответа: соединение с upstream закрывается
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "connection_error"
+            logger.error(f"[{request_id}] Ошибка подключения к Ollama: {e}")
+            return {"error": "Не удалось подключиться к Ollama."}
+        finally:
+            UPSTREAM_SECONDS.labels("direct_chat", outcome).observe(time.perf_counter() - started)
+
+    async def stream_chat(self, messages: list[dict]) -> AsyncIterator[dict]:
+        """
+        Потоковая генерация ответа через `/api/chat` (NDJSON).
+
+        Yields:
+            События Ollama (`message.content` очередного фрагмента, `done`
+            в последнем). При ошибке выдается одно событие `{"error": "..."}`.
+        """
+        request_id = current_request_id()
+        started = time.perf_counter()
+        outcome = "ok"
+        first_chunk = True
+        chars = 0
+        try:
+            async with self.client.stream(
+                "POST", "/api/chat", json=self._payload(messages, stream=True), headers={REQUEST_ID_HEADER: request_id}
+            ) as response:
+                if response.is_error:
+                    outcome = "http_error"
+                    body = await response.aread()
+                    logger.error(f"[{request_id}] Ошибка API Ollama: {response.status_code} - {body.decode(errors='replace')}")
+                    yield {"error": f"Ошибка API Ollama: {response.status_code}"}
+                    return
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if event.get("error"):
+                        outcome = "http_error"
+                        logger.error(f"[{request_id}] Ошибка генерации Ollama: {event['error']}")
+                        yield {"error": f"Ошибка генерации Ollama: {event['error']}"}
+                        return
+                    text = event.get("message", {}).get("content")
+                    if text:
+                        chars += len(text)
+                        if first_chunk:
+                            first_chunk = False
+                            UPSTREAM_TTFB_SECONDS.labels("direct").observe(time.perf_counter() - started)
+                    yield event
+                    if event.get("done"):
+                        if "prompt_eval_count" in event:
+                            PROMPT_EVAL_TOKENS.observe(event["prompt_eval_count"])
+                        return
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "connection_error"
+            logger.error(f"[{request_id}] Ошибка подключения к Ollama: {e}")
+            yield {"error": "Не удалось подключиться к Ollama."}
+        finally:
+            UPSTREAM_SECONDS.labels("direct_stream", outcome).observe(time.perf_counter() - started)
+            if outcome == "ok":
+                RESPONSE_CHARS.labels("direct_stream").observe(chars)
+
+    async def embed(self, texts: list[str], model: str) -> dict:
+        """
+        Считает эмбеддинги текстов через `/api/embed` (одним запросом на пачку).
+
+        Args:
+            texts: Тексты пачки.
+            model: Модель эмбеддингов.
+
+        Returns:
+            Ответ Ollama (`embeddings` — векторы в порядке текстов) или `{"error": ...}`.
+        """
+        request_id = current_request_id()
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            response = await self.client.post(
+                "/api/embed",
+                json={"model": model, "input": texts, "keep_alive": settings.OLLAMA_KEEP_ALIVE},
+                headers={REQUEST_ID_HEADER: request_id},
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            outcome = "http_error"
+            logger.error(f"[{request_id}] Ошибка API эмбеддингов Ollama: {e.response.status_code} - {e.response.text}")
+            return {"error": f"Ошибка API Ollama: {e.response.status_code}"}
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "connection_error"
+            logger.error(f"[{request_id}] Ошибка подключения к Ollama: {e}")
+            return {"error": "Не удалось подключиться к Ollama."}
+        finally:
+            UPSTREAM_SECONDS.labels("embed", outcome).observe(time.perf_counter() - started)
+
+# Инициализируем клиент с настройками
+ollama_client = OllamaClient(
+    base_url=settings.OLLAMA_BASE_URL,
+    model=settings.LLM_MODEL_NAME
+)
@@ -1,11 +1,23 @@
+import asyncio
+import json
+import logging
+import time
 import httpx
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from .config import settings
+from .context import REQUEST_ID_HEADER, current_request_id
+from .metrics import RESPONSE_CHARS, UPSTREAM_SECONDS, UPSTREAM_TTFB_SECONDS
+
+logger = logging.getLogger(__name__)
 
 class AnythingLLMClient:
     """
     Асинхронный клиент для взаимодействия с API AnythingLLM.
+
+    Использует один долгоживущий `httpx.AsyncClient` с пулом соединений,
+    который создается при старте приложения (`start`) и закрывается
+    при его остановке (`close`).
     """
     def __init__(self, api_url: str, api_key: str):
         self.api_url = api_url.rstrip('/')
@@ -14,41 +26,187 @@ class AnythingLLMClient:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Создает HTTP-клиент с пулом соединений по настройкам из `Settings`."""
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            read=settings.HTTP_READ_TIMEOUT,
+            write=settings.HTTP_WRITE_TIMEOUT,
+            pool=settings.HTTP_POOL_TIMEOUT,
+        )
+        return httpx.AsyncClient(
+            base_url=self.api_url,
+            headers=self.headers,
+            limits=limits,
+            timeout=timeout,
+            http2=settings.HTTP2_ENABLED,
+        )
+
+    async def start(self) -> None:
+        """Открывает общий пул соединений. Повторный вызов ничего не делает."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
 
-    async def query_workspace(self, workspace_slug: str, query: str) -> dict:
+    async def close(self) -> None:
+        """Закрывает пул соединений и освобождает сокеты."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Возвращает общий HTTP-клиент.
+
+        Если `start` еще не вызывался (например, вне lifespan приложения),
+        клиент создается лениво при первом обращении.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def ping(self, timeout: float) -> bool:
+        """Проверяет, что AnythingLLM доступен и ключ API задан (`/api/ping`)."""
+        if not self.api_key:
+            return False
+        try:
+            response = await self.client.get("/api/ping", timeout=timeout)
+        except httpx.HTTPError:
+            return False
+        return response.status_code == 200
+
+    async def query_workspace(self, workspace_slug: str, query: str, session_id: Optional[str] = None) -> dict:
         """
         Отправляет запрос в конкретное рабочее пространство (workspace) AnythingLLM.
 
         Args:
             workspace_slug: URL-slug рабочего пространства.
             query: Текст запроса от пользователя.
+            session_id: Идентификатор сессии AnythingLLM; история чата
+                берется только из сообщений этой сессии.
 
         Returns:
             Словарь с ответом от AnythingLLM.
         """
         if not self.api_key:
             return {"error": "API ключ для AnythingLLM не предоставлен."}
-        
-        url = f"{self.api_url}/api/v1/workspace/{workspace_slug}/chat"
+
+        url = f"/api/v1/workspace/{workspace_slug}/chat"
         payload = {
             "message": query,
             "mode": "chat" # Используем режим чата для получения прямого ответа
         }
+        if session_id:
+            payload["sessionId"] = session_id
 
+        request_id = current_request_id()
+        started = time.perf_counter()
+        outcome = "ok"
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=self.headers, json=payload, timeout=120)
-                response.raise_for_status() # Вызовет исключение для статусов 4xx/5xx
-                return response.json()
+            response = await self.client.post(url, json=payload, headers={REQUEST_ID_HEADER: request_id})
+            response.raise_for_status() # Вызовет исключение для статусов 4xx/5xx
+            result = response.json()
+            RESPONSE_CHARS.labels("chat").observe(len(result.get("textResponse") or ""))
+            return result
         except httpx.HTTPStatusError as e:
-            print(f"Ошибка API AnythingLLM: {e.response.status_code} - {e.response.text}")
+            outcome = "http_error"
+            logger.error(f"[{request_id}] Ошибка API AnythingLLM: {e.response.status_code} - {e.response.text}")
             return {"error": f"Ошибка API AnythingLLM: {e.response.status_code}"}
+        except asyncio.CancelledError:
+            # Клиент отключился или истек срок ответа: соединение с upstream закрывается
+            outcome = "cancelled"
+            raise
         except Exception as e:
-            print(f"Ошибка подключения к AnythingLLM: {e}")
+            outcome = "connection_error"
+            logger.error(f"[{request_id}] Ошибка подключения к AnythingLLM: {e}")
             return {"error": "Не удалось подключиться к сервису AnythingLLM."}
+        finally:
+            UPSTREAM_SECONDS.labels("chat", outcome).observe(time.perf_counter() - started)
+
+    async def stream_workspace(self, workspace_slug: str, query: str, session_id: Optional[str] = None) -> AsyncIterator[dict]:
+        """
+        Запрашивает потоковую генерацию ответа через stream-chat API AnythingLLM.
+
+        Args:
+            workspace_slug: URL-slug рабочего пространства.
+            query: Текст запроса от пользователя.
+            session_id: Идентификатор сессии AnythingLLM; история чата
+                берется только из сообщений этой сессии.
+
+        Yields:
+            События SSE от AnythingLLM в виде словарей (`textResponseChunk`,
+            `finalizeResponseStream`, `abort`). При ошибке выдается одно событие
+            вида `{"error": "..."}`.
+        """
+        if not self.api_key:
+            yield {"error": "API ключ для AnythingLLM не предоставлен."}
+            return
+
+        url = f"/api/v1/workspace/{workspace_slug}/stream-chat"
+        payload = {
+            "message": query,
+            "mode": "chat"
+        }
+        if session_id:
+            payload["sessionId"] = session_id
+
+        request_id = current_request_id()
+        started = time.perf_counter()
+        outcome = "ok"
+        first_chunk = True
+        chars = 0
+        try:
+            async with self.client.stream("POST", url, json=payload, headers={REQUEST_ID_HEADER: request_id}) as response:
+                if response.is_error:
+                    outcome = "http_error"
+                    body = await response.aread()
+                    logger.error(f"[{request_id}] Ошибка API AnythingLLM: {response.status_code} - {body.decode(errors='replace')}")
+                    yield {"error": f"Ошибка API AnythingLLM: {response.status_code}"}
+                    return
+                async for line in response.aiter_lines():
+                    # Формат SSE: строки вида "data: {...}", события разделены пустой строкой
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if not data:
+                        continue
+                    try:
+                        event = json.loads(data)
+                    except json.JSONDecodeError:
+                        continue
+                    text = event.get("textResponse")
+                    if text:
+                        chars += len(text)
+                        if first_chunk:
+                            first_chunk = False
+                            UPSTREAM_TTFB_SECONDS.labels("anythingllm").observe(time.perf_counter() - started)
+                    yield event
+                    if event.get("type") == "abort":
+                        outcome = "aborted"
+                        return
+                    if event.get("close"):
+                        return
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "connection_error"
+            logger.error(f"[{request_id}] Ошибка подключения к AnythingLLM: {e}")
+            yield {"error": "Не удалось подключиться к сервису AnythingLLM."}
+        finally:
+            UPSTREAM_SECONDS.labels("stream", outcome).observe(time.perf_counter() - started)
+            if outcome == "ok":
+                RESPONSE_CHARS.labels("stream").observe(chars)
 
 # Инициализируем клиент с настройками
 anything_llm_client = AnythingLLMClient(
     api_url=settings.ANYTHINGLLM_API_URL,
     api_key=settings.ANYTHINGLLM_API_KEY
-) 
\ No newline at end of file
+)
@@ -0,0 +1,154 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+# Токены: последовательности букв и цифр (кириллица и латиница)
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+
+RUSSIAN_STOPWORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по
+только ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если
+уже или ни быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей
+может они тут где есть надо ней для мы тебя их чем была сам чтоб без будто чего раз
+тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом
+один почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец
+два об другой хоть после над больше тот через эти нас про всего них какая много разве
+три эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой им более
+всегда конечно всю между это такое такая такие какое очень
+""".split())
+
+_VOWELS = "аеиоуыэюя"
+
+_PERFECTIVE_GERUND_1 = ("вшись", "вши", "в")
+_PERFECTIVE_GERUND_2 = ("ывшись", "ившись", "ывши", "ивши", "ыв", "ив")
+_REFLEXIVE = ("ся", "сь")
+_ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый",
+    "ой", "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+_PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+_VERB_1 = (
+    "ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны",
+    "ть", "й", "л", "н",
+)
+_VERB_2 = (
+    "ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует",
+    "уют", "ены", "ить", "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят",
+    "ит", "ыт", "ую", "ю",
+)
+_NOUN = (
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии",
+    "ей", "ой", "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья",
+    "а", "е", "и", "й", "о", "у", "ы", "ь", "ю", "я",
+)
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+
+def _regions(word: str) -> tuple[int, int]:
+    """Возвращает начало областей RV и R2 алгоритма Snowball."""
+    rv = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start: int) -> int:
+        for i in range(start + 1, len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    return rv, next_region(r1)
+
+
+def _strip(rv: str, endings: tuple[str, ...], after_a: bool = False, default: Optional[str] = None) -> Optional[str]:
+    """
+    Удаляет первое подходящее окончание из `rv`.
+
+    Args:
+        rv: Часть слова в области RV.
+        endings: Окончания, упорядоченные от длинных к коротким.
+        after_a: Окончание должно следовать за "а" или "я" (группа 1 в Snowball).
+        default: Значение, возвращаемое, если окончание не найдено.
+
+    Returns:
+        Строка без окончания или `default`, если окончание не найдено.
+    """
+    for ending in endings:
+        if rv.endswith(ending):
+            stem = rv[: -len(ending)]
+            if after_a and not stem.endswith(("а", "я")):
+                continue
+            return stem
+    return default
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """
+    Облегченная реализация стеммера Snowball для русского языка.
+
+    Приводит словоформы к общей основе: "тревоги", "тревогой" и "тревога"
+    дают одну и ту же основу "тревог".
+    """
+    if len(word) < 3 or not any(ch in _VOWELS for ch in word):
+        return word
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастия, иначе возвратные окончания и прилагательные/глаголы/существительные
+    gerund = _strip(rv, _PERFECTIVE_GERUND_1, after_a=True)
+    if gerund is None:
+        gerund = _strip(rv, _PERFECTIVE_GERUND_2)
+    if gerund is not None:
+        rv = gerund
+    else:
+        rv = _strip(rv, _REFLEXIVE, default=rv)
+        adjective = _strip(rv, _ADJECTIVE)
+        if adjective is not None:
+            participle = _strip(adjective, _PARTICIPLE_1, after_a=True)
+            rv = participle if participle is not None else _strip(adjective, _PARTICIPLE_2, default=adjective)
+        else:
+            verb = _strip(rv, _VERB_1, after_a=True)
+            if verb is None:
+                verb = _strip(rv, _VERB_2)
+            rv = verb if verb is not None else _strip(rv, _NOUN, default=rv)
+
+    # Шаг 2: конечное "и"
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные суффиксы в области R2
+    for ending in _DERIVATIONAL:
+        if rv.endswith(ending) and rv_start + len(rv) - len(ending) >= r2_start:
+            rv = rv[: -len(ending)]
+            break
+
+    # Шаг 4: превосходная степень, удвоенное "н" и мягкий знак
+    rv = _strip(rv, _SUPERLATIVE, default=rv)
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    elif rv.endswith("ь"):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def tokenize(text: str, stopwords: frozenset = RUSSIAN_STOPWORDS) -> list[str]:
+    """
+    Разбивает текст на нормализованные токены для лексического поиска.
+
+    Текст приводится к нижнему регистру, "ё" заменяется на "е",
+    стоп-слова отбрасываются, остальные слова приводятся к основе.
+
+    Args:
+        text: Исходный текст.
+        stopwords: Множество слов, которые не индексируются.
+
+    Returns:
+        Список основ слов в порядке появления.
+    """
+    words = _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+    return [stem(word) for word in words if word not in stopwords]
@@ -1 +1,3 @@
- 
\ No newline at end of file
+from .interaction import Interaction, UserSession
+
+__all__ = ["Interaction", "UserSession"]
@@ -0,0 +1,47 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, DateTime, Identity, Index, String, Text, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class Interaction(Base):
+    """
+    Вопрос пользователя и ответ бота.
+
+    `record_id` вычисляется из содержимого записи лога, поэтому повторная
+    загрузка тех же логов (импорт после потоковой записи) не создает дублей.
+    """
+    __tablename__ = "interactions"
+    __table_args__ = (
+        Index("ix_interactions_user_id_timestamp", "user_id", "timestamp"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    record_id: Mapped[uuid.UUID] = mapped_column(Uuid, unique=True)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, index=True)
+    user_id: Mapped[int] = mapped_column(BigInteger)
+    username: Mapped[Optional[str]] = mapped_column(String(255))
+    query: Mapped[str] = mapped_column(Text)
+    response: Mapped[str] = mapped_column(Text)
+    doc_type: Mapped[Optional[str]] = mapped_column(String(32))
+    query_length: Mapped[int]
+    response_length: Mapped[int]
+
+
+class UserSession(Base):
+    """Событие сессии пользователя (команды /start, /help и т.п.)."""
+    __tablename__ = "user_sessions"
+    __table_args__ = (
+        Index("ix_user_sessions_user_id_timestamp", "user_id", "timestamp"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    record_id: Mapped[uuid.UUID] = mapped_column(Uuid, unique=True)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, index=True)
+    user_id: Mapped[int] = mapped_column(BigInteger)
+    username: Mapped[Optional[str]] = mapped_column(String(255))
+    action: Mapped[str] = mapped_column(String(64))
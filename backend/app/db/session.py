@@ -0,0 +1,18 @@
+from sqlalchemy import create_engine
+
+from app.core.config import settings
+from app.db.base import Base
+
+# Соединение устанавливается при первом обращении, а не при импорте
+engine = create_engine(
+    settings.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    pool_pre_ping=True,
+)
+
+
+def init_db() -> None:
+    """Создает недостающие таблицы и индексы (существующие не изменяются)."""
+    from app.db import models  # noqa: F401 — регистрирует модели в метаданных
+
+    Base.metadata.create_all(engine)
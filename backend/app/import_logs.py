@@ -0,0 +1,91 @@
+"""
+Импорт логов бота (`interactions_*.jsonl[.gz]`, `sessions_*.jsonl[.gz]`) в PostgreSQL.
+
+Загружает историю, накопленную до появления базы (или пропущенную, пока
+база была недоступна). Повторный запуск безопасен: идентификатор записи
+вычисляется по ее содержимому, и уже загруженные записи пропускаются.
+
+Запуск из каталога backend:
+    python -m app.import_logs --log-dir ../telegram_bot/logs
+"""
+import argparse
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from app.db.session import init_db
+from app.services.interaction_store import write_records
+
+KINDS = ("interactions", "sessions")
+
+
+def iter_records(path: Path) -> Iterator[dict]:
+    """Читает записи из файла лога (обычного или сжатого), пропуская поврежденные строки."""
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def import_logs(log_dir: Path, batch_size: int) -> dict[str, int]:
+    """
+    Загружает все файлы логов из `log_dir` пачками по `batch_size` записей.
+
+    Returns:
+        Суммарные счетчики: вставлено, дублей, некорректных записей.
+    """
+    totals = {"interactions": 0, "sessions": 0, "duplicates": 0, "invalid": 0}
+    for kind in KINDS:
+        for path in sorted(log_dir.glob(f"{kind}_*.jsonl*")):
+            batch: list[dict] = []
+            for record in iter_records(path):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    _write(kind, batch, totals)
+                    batch = []
+            if batch:
+                _write(kind, batch, totals)
+            print(f"{path.name}: готово", file=sys.stderr)
+    return totals
+
+
+def _write(kind: str, batch: list[dict], totals: dict[str, int]) -> None:
+    """Записывает пачку одного вида и добавляет ее счетчики к итогам."""
+    if kind == "interactions":
+        result = write_records(batch, [])
+    else:
+        result = write_records([], batch)
+    for key, value in result.items():
+        totals[key] += value
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Точка входа CLI."""
+    parser = argparse.ArgumentParser(description="Импорт логов бота в PostgreSQL")
+    parser.add_argument("--log-dir", type=Path, default=Path("../telegram_bot/logs"), help="Папка с логами бота")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Записей в одной вставке")
+    args = parser.parse_args(argv)
+
+    if not args.log_dir.exists():
+        print(f"Папка с логами не найдена: {args.log_dir}", file=sys.stderr)
+        return 1
+
+    init_db()
+    started = time.perf_counter()
+    totals = import_logs(args.log_dir, args.batch_size)
+    totals["elapsed_s"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(totals, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,122 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+
+from app.api.v1.endpoints.health import router as health_router
+from app.api.v1.endpoints.interactions import router as interactions_router
 from app.api.v1.endpoints.rag import router as rag_router
+from app.core.context import DEADLINE_HEADER, REQUEST_ID_HEADER, deadline_var, new_request_id, parse_deadline, request_id_var
+from app.core.metrics import REQUEST_SECONDS
+from app.core.ollama import ollama_client
+from app.core.rag import anything_llm_client
+from app.services.cache import response_cache
+from app.services.conversation import conversation_store
+from app.services.interaction_store import interaction_writer
+from app.services.lexical_index import lexical_index
+from app.services.model_warmup import model_warmer
+from app.services.semantic_index import semantic_index
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Управляет жизненным циклом общих ресурсов воркера.
+
+    Открывает пулы HTTP-соединений к AnythingLLM и Ollama и соединения с Redis,
+    загружает локальные поисковые индексы (семантический — в фоне), запускает фоновую запись
+    взаимодействий в PostgreSQL и прогрев модели в Ollama при старте
+    и закрывает ресурсы при остановке приложения.
+    """
+    await anything_llm_client.start()
+    await ollama_client.start()
+    await model_warmer.start()
+    await response_cache.start()
+    await conversation_store.start()
+    await interaction_writer.start()
+    # Построение индекса (если он устарел) не должно блокировать event loop
+    await asyncio.to_thread(lexical_index.load_or_build)
+    await semantic_index.start()
+    try:
+        yield
+    finally:
+        lexical_index.close()
+        await interaction_writer.stop()
+        await conversation_store.close()
+        await response_cache.close()
+        await model_warmer.close()
+        await ollama_client.close()
+        await anything_llm_client.close()
 
-# Контекст Lifespan больше не нужен, т.к. клиент AnythingLLM
-# не требует сложной инициализации при старте.
 
 app = FastAPI(
     title="Mind-Fix API",
     description="API для проекта ИИ-психотерапевта Mind-Fix",
     version="0.1.0",
-    # lifespan=lifespan # Убрали
+    lifespan=lifespan
 )
 
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """
+    Выставляет идентификатор и срок ответа запроса и измеряет время обработки.
+
+    Идентификатор берется из заголовка `X-Request-ID` (его передает бот)
+    или создается заново; он возвращается в ответе и передается в AnythingLLM.
+    Срок ответа берется из заголовка `X-Request-Timeout` (см. `current_deadline`).
+    """
+    request_id = request.headers.get(REQUEST_ID_HEADER) or new_request_id()
+    token = request_id_var.set(request_id)
+    deadline_token = deadline_var.set(parse_deadline(request.headers.get(DEADLINE_HEADER)))
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    finally:
+        # Шаблон пути вместо фактического URL, чтобы не плодить метки
+        route = request.scope.get("route")
+        REQUEST_SECONDS.labels(
+            route.path if route is not None else "unmatched", request.method, str(status)
+        ).observe(time.perf_counter() - started)
+        deadline_var.reset(deadline_token)
+        request_id_var.reset(token)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Метрики в формате Prometheus.
+
+    Под Gunicorn с несколькими воркерами (задан `PROMETHEUS_MULTIPROC_DIR`)
+    метрики собираются со всех воркеров, а не только с ответившего.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/")
 async def read_root():
     """
     Корневой эндпоинт для проверки работоспособности API.
+
+    Сообщает только, что процесс запущен; готовность к запросам
+    (AnythingLLM и загруженная модель) показывает `/health/ready`.
     """
     return {"status": "API is running"}
 
 # Подключаем роутеры
+app.include_router(health_router, prefix="/health", tags=["Health"])
 app.include_router(rag_router, prefix="/api/v1/rag", tags=["RAG"])
+app.include_router(interactions_router, prefix="/api/v1/interactions", tags=["Interactions"])
 
 # В будущем здесь будут подключаться роутеры
 # from .api.v1.endpoints import chat
-# app.include_router(chat.router, prefix="/api/v1") 
\ No newline at end of file
+# app.include_router(chat.router, prefix="/api/v1")
@@ -0,0 +1,239 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from app.core.config import settings
+from app.core.metrics import ADMISSION_REJECTED, QUEUE_WAIT_SECONDS
+
+
+class AdmissionRejected(Exception):
+    """
+    Запрос отклонен до обращения к LLM из-за переполнения очереди.
+
+    Attributes:
+        status_code: HTTP-статус для ответа клиенту (429 или 503).
+        retry_after: Рекомендуемая пауза перед повтором, в секундах.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class SingleFlight:
+    """
+    Объединяет одинаковые одновременные запросы в один вызов к upstream.
+
+    Первый запрос с данным ключом запускает вызов, остальные ждут его результат.
+    Вызов выполняется в отдельной задаче, поэтому отмена одного ожидающего
+    не прерывает генерацию для остальных. Когда результат больше никто
+    не ждет (все клиенты отключились или их срок истек), вызов отменяется,
+    чтобы не тратить модель на ответ, который никто не прочитает.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "abandoned": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет `fn` или присоединяется к уже идущему вызову с тем же ключом.
+
+        Args:
+            key: Ключ идентичности запроса.
+            fn: Фабрика корутины, выполняющей запрос.
+
+        Returns:
+            Результат общего вызова.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                self.stats["abandoned"] += 1
+                task.cancel()
+                # Новый запрос с тем же ключом не должен присоединиться к отмененному вызову
+                if self._calls.get(key) is task:
+                    del self._calls[key]
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        """Удаляет завершенный вызов и помечает его исключение как обработанное."""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    @property
+    def in_flight(self) -> int:
+        """Количество уникальных вызовов, выполняющихся прямо сейчас."""
+        return len(self._calls)
+
+
+class FairAdmissionQueue:
+    """
+    Ограничитель параллельных генераций со справедливой очередью по пользователям.
+
+    Одновременно к LLM допускается не более `max_concurrent` запросов.
+    Остальные ждут в очередях отдельных пользователей, а освободившийся слот
+    отдается пользователям по кругу (round-robin), так что один активный
+    пользователь не может вытеснить остальных. При переполнении общей очереди
+    или очереди пользователя запрос сразу отклоняется с подсказкой Retry-After.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_queue_per_user: int):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self._active = 0
+        self._queued = 0
+        self._waiters: "OrderedDict[str, deque[asyncio.Future]]" = OrderedDict()
+        # Скользящие средние для отчетов и оценки Retry-After
+        self._avg_wait = 0.0
+        self._avg_service = 0.0
+        self._max_wait = 0.0
+        self.stats = {"admitted": 0, "rejected_user": 0, "rejected_full": 0}
+
+    def _retry_after(self) -> int:
+        """Оценивает, через сколько секунд освободится место в очереди."""
+        service = self._avg_service or 1.0
+        return max(1, math.ceil(service * (self._queued + 1) / self.max_concurrent))
+
+    def _record(self, attr: str, value: float, alpha: float = 0.2) -> None:
+        """Обновляет экспоненциальное скользящее среднее."""
+        current = getattr(self, attr)
+        setattr(self, attr, value if current == 0.0 else (1 - alpha) * current + alpha * value)
+
+    async def acquire(self, user_key: str) -> float:
+        """
+        Занимает слот генерации, при необходимости ожидая в очереди.
+
+        Args:
+            user_key: Идентификатор пользователя для справедливого распределения.
+
+        Returns:
+            Время ожидания в очереди, в секундах.
+
+        Raises:
+            AdmissionRejected: Очередь пользователя или общая очередь заполнена.
+        """
+        if self._active < self.max_concurrent and self._queued == 0:
+            self._active += 1
+            self.stats["admitted"] += 1
+            QUEUE_WAIT_SECONDS.observe(0.0)
+            return 0.0
+
+        queue = self._waiters.get(user_key)
+        if queue is not None and len(queue) >= self.max_queue_per_user:
+            self.stats["rejected_user"] += 1
+            ADMISSION_REJECTED.labels("429").inc()
+            raise AdmissionRejected(429, "Слишком много запросов от пользователя", self._retry_after())
+        if self._queued >= self.max_queue:
+            self.stats["rejected_full"] += 1
+            ADMISSION_REJECTED.labels("503").inc()
+            raise AdmissionRejected(503, "Очередь к модели переполнена", self._retry_after())
+
+        if queue is None:
+            queue = self._waiters[user_key] = deque()
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        self._queued += 1
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже был передан нам: возвращаем его следующему в очереди
+                self.release()
+            else:
+                self._remove_waiter(user_key, future)
+            raise
+
+        waited = time.monotonic() - started
+        self._record("_avg_wait", waited)
+        self._max_wait = max(self._max_wait, waited)
+        self.stats["admitted"] += 1
+        QUEUE_WAIT_SECONDS.observe(waited)
+        return waited
+
+    def _remove_waiter(self, user_key: str, future: asyncio.Future) -> None:
+        """Убирает отмененное ожидание из очереди пользователя."""
+        queue = self._waiters.get(user_key)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        self._queued -= 1
+        if not queue:
+            del self._waiters[user_key]
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        """
+        Освобождает слот и передает его следующему пользователю по кругу.
+
+        Args:
+            service_time: Длительность завершенной генерации для оценки Retry-After.
+        """
+        if service_time is not None:
+            self._record("_avg_service", service_time)
+        while self._waiters:
+            user_key, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._waiters.move_to_end(user_key)
+            else:
+                del self._waiters[user_key]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, user_key: str) -> AsyncIterator[float]:
+        """Контекстный менеджер: занимает слот и гарантированно освобождает его."""
+        waited = await self.acquire(user_key)
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - started)
+
+    def get_stats(self) -> dict:
+        """Возвращает глубину очереди и статистику ожидания."""
+        return {
+            **self.stats,
+            "active": self._active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self._queued,
+            "users_waiting": len(self._waiters),
+            "avg_wait_seconds": round(self._avg_wait, 3),
+            "max_wait_seconds": round(self._max_wait, 3),
+            "avg_service_seconds": round(self._avg_service, 3),
+        }
+
+
+single_flight = SingleFlight()
+admission_queue = FairAdmissionQueue(
+    max_concurrent=settings.LLM_MAX_CONCURRENCY,
+    max_queue=settings.LLM_MAX_QUEUE,
+    max_queue_per_user=settings.LLM_MAX_QUEUE_PER_USER,
+)
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+
+from app.core.config import settings
+from app.core.metrics import CACHE_LOOKUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Приводит запрос к канонической форме для ключа кеша.
+
+    Регистр, пунктуация и лишние пробелы не влияют на результат,
+    поэтому "Что такое невроз?" и "что  такое невроз" дают один ключ.
+    """
+    text = query.lower().replace("ё", "е")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class LocalLRUCache:
+    """Небольшой LRU-кеш в памяти процесса с ограничением по размеру и TTL."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Возвращает значение или None, если ключ отсутствует или устарел."""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Сохраняет значение, вытесняя самые давно использованные записи."""
+        if self.max_entries <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Удаляет все записи."""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ResponseCache:
+    """
+    Двухуровневый кеш ответов RAG: LRU в памяти воркера перед общим Redis.
+
+    Ключ строится из нормализованного запроса, slug рабочего пространства
+    и имени модели. В Redis записи живут `RESPONSE_CACHE_TTL` секунд, а их
+    количество ограничено `RESPONSE_CACHE_MAX_ENTRIES`: индекс ключей хранится
+    в sorted set по времени последнего обращения, лишние записи вытесняются.
+    Недоступность Redis не ломает запросы: кеш просто считается промахом,
+    а обращения к Redis приостанавливаются на `REDIS_RETRY_INTERVAL` секунд.
+    """
+
+    KEY_PREFIX = "mindfix:rag:response:"
+    INDEX_KEY = "mindfix:rag:response-index"
+
+    def __init__(self):
+        self.enabled = settings.RESPONSE_CACHE_ENABLED
+        self.ttl = settings.RESPONSE_CACHE_TTL
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.local = LocalLRUCache(
+            max_entries=settings.RESPONSE_CACHE_LOCAL_MAX_ENTRIES,
+            ttl=settings.RESPONSE_CACHE_LOCAL_TTL,
+        )
+        self._redis: Optional[redis.Redis] = None
+        self._redis_down_until = 0.0
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "errors": 0}
+
+    async def start(self) -> None:
+        """Создает пул соединений к Redis."""
+        if self.enabled and self._redis is None:
+            self._redis = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                # Повторы делает сам кеш: при сбое он временно обходит Redis
+                retry=Retry(NoBackoff(), 0),
+            )
+
+    async def close(self) -> None:
+        """Закрывает соединения с Redis."""
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def _redis_available(self) -> bool:
+        """Проверяет, можно ли сейчас обращаться к Redis."""
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, action: str, error: Exception) -> None:
+        """Учитывает ошибку Redis и временно отключает второй уровень кеша."""
+        self.stats["errors"] += 1
+        self._redis_down_until = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+        logger.warning(f"Ошибка {action} кеша ответов в Redis: {error}")
+
+    def make_key(self, workspace_slug: str, query: str, model_name: Optional[str] = None) -> str:
+        """Строит ключ кеша для запроса."""
+        model_name = model_name or settings.LLM_MODEL_NAME
+        raw = "\x1f".join((workspace_slug, model_name, normalize_query(query)))
+        return self.KEY_PREFIX + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, workspace_slug: str, query: str, model_name: Optional[str] = None) -> Optional[dict]:
+        """
+        Ищет сохраненный ответ сначала в памяти процесса, затем в Redis.
+
+        Returns:
+            Словарь ответа (`response`, `sources`) или None при промахе.
+        """
+        if not self.enabled:
+            return None
+        key = self.make_key(workspace_slug, query, model_name)
+        started = time.perf_counter()
+
+        value = self.local.get(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            CACHE_LOOKUP_SECONDS.labels("local_hit").observe(time.perf_counter() - started)
+            return value
+
+        if self._redis_available():
+            try:
+                raw = await self._redis.get(key)
+                if raw is not None:
+                    value = json.loads(raw)
+                    # Обновляем время обращения для LRU-вытеснения в Redis
+                    await self._redis.zadd(self.INDEX_KEY, {key: time.time()})
+                    self.local.set(key, value)
+                    self.stats["redis_hits"] += 1
+                    CACHE_LOOKUP_SECONDS.labels("redis_hit").observe(time.perf_counter() - started)
+                    return value
+            except (redis.RedisError, OSError, ValueError) as e:
+                self._redis_failed("чтения", e)
+
+        self.stats["misses"] += 1
+        CACHE_LOOKUP_SECONDS.labels("miss").observe(time.perf_counter() - started)
+        return None
+
+    async def set(self, workspace_slug: str, query: str, value: dict, model_name: Optional[str] = None) -> None:
+        """Сохраняет ответ в оба уровня кеша."""
+        if not self.enabled:
+            return
+        key = self.make_key(workspace_slug, query, model_name)
+        self.local.set(key, value)
+
+        if not self._redis_available():
+            return
+        now = time.time()
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+                pipe.zadd(self.INDEX_KEY, {key: now})
+                # Записи старше TTL уже удалены Redis, чистим их из индекса
+                pipe.zremrangebyscore(self.INDEX_KEY, "-inf", now - self.ttl)
+                pipe.zcard(self.INDEX_KEY)
+                *_, size = await pipe.execute()
+            excess = size - self.max_entries
+            if excess > 0:
+                evicted = await self._redis.zpopmin(self.INDEX_KEY, excess)
+                if evicted:
+                    await self._redis.delete(*(member for member, _ in evicted))
+        except (redis.RedisError, OSError) as e:
+            self._redis_failed("записи", e)
+
+    async def invalidate(self) -> int:
+        """
+        Сбрасывает кеш, например после обновления базы знаний.
+
+        Локальные уровни других воркеров устаревают сами
+        в течение `RESPONSE_CACHE_LOCAL_TTL`.
+
+        Returns:
+            Количество удаленных записей в Redis.
+        """
+        self.local.clear()
+        if self._redis is None:
+            return 0
+        removed = 0
+        try:
+            keys = await self._redis.zrange(self.INDEX_KEY, 0, -1)
+            for start in range(0, len(keys), 500):
+                removed += await self._redis.delete(*keys[start:start + 500])
+            await self._redis.delete(self.INDEX_KEY)
+        except (redis.RedisError, OSError) as e:
+            self._redis_failed("сброса", e)
+        return removed
+
+    def get_stats(self) -> dict:
+        """Возвращает счетчики попаданий и промахов кеша."""
+        hits = self.stats["local_hits"] + self.stats["redis_hits"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": hits / total if total else 0.0,
+            "local_size": len(self.local),
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценивает число токенов в тексте по среднему числу символов на токен."""
+    return math.ceil(len(text) / settings.CONTEXT_CHARS_PER_TOKEN)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Обрезает текст до бюджета токенов (по оценке `estimate_tokens`)."""
+    max_chars = int(max_tokens * settings.CONTEXT_CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 1)].rstrip() + "…"
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    """Возвращает первое предложение текста, не длиннее `max_chars`."""
+    text = " ".join(text.split())
+    sentence = _SENTENCE_END_RE.split(text, maxsplit=1)[0]
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars - 1].rstrip() + "…"
+    return sentence
+
+
+@dataclass
+class Conversation:
+    """
+    Сжатый контекст диалога пользователя.
+
+    Последние реплики хранятся дословно, более ранние сворачиваются
+    в короткие строки сводки. Размер контекста не превышает
+    `CONTEXT_MAX_TOKENS` независимо от длины сессии.
+    """
+    summary: list[str] = field(default_factory=list)
+    turns: list[list[str]] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    def _turns_tokens(self) -> int:
+        return sum(estimate_tokens(query) + estimate_tokens(answer) for query, answer in self.turns)
+
+    def _summary_tokens(self) -> int:
+        return sum(estimate_tokens(line) for line in self.summary)
+
+    def add_turn(self, query: str, answer: str) -> None:
+        """Добавляет реплику и сворачивает старые реплики, чтобы уложиться в бюджет."""
+        # Одна реплика не может занять больше бюджета, оставшегося после сводки
+        turn_budget = max(1, settings.CONTEXT_MAX_TOKENS - settings.CONTEXT_SUMMARY_MAX_TOKENS)
+        query = _truncate(query, turn_budget // 3)
+        answer = _truncate(answer, turn_budget - estimate_tokens(query))
+        self.turns.append([query, answer])
+
+        while self.turns and (
+            len(self.turns) > settings.CONTEXT_RECENT_TURNS
+            or (len(self.turns) > 1 and self._turns_tokens() + self._summary_tokens() > settings.CONTEXT_MAX_TOKENS)
+        ):
+            old_query, old_answer = self.turns.pop(0)
+            self.summary.append(f"— {_first_sentence(old_query, 160)} → {_first_sentence(old_answer, 160)}")
+            # Сводка скользящая: самые старые строки вытесняются
+            while self.summary and self._summary_tokens() > settings.CONTEXT_SUMMARY_MAX_TOKENS:
+                self.summary.pop(0)
+
+    def build_prompt(self, query: str) -> str:
+        """Собирает запрос к модели: сводка, последние реплики и текущий вопрос."""
+        if self.is_empty:
+            return query
+        parts = []
+        if self.summary:
+            parts.append("Ранее в разговоре (кратко):\n" + "\n".join(self.summary))
+        if self.turns:
+            lines = []
+            for old_query, old_answer in self.turns:
+                lines.append(f"Пользователь: {old_query}")
+                lines.append(f"Ассистент: {old_answer}")
+            parts.append("Последние сообщения:\n" + "\n".join(lines))
+        parts.append(f"Текущий вопрос пользователя: {query}")
+        return "\n\n".join(parts)
+
+    def size_bytes(self) -> int:
+        """Приблизительный объем памяти, занимаемый текстами контекста."""
+        return sum(sys.getsizeof(line) for line in self.summary) + sum(
+            sys.getsizeof(query) + sys.getsizeof(answer) for query, answer in self.turns
+        )
+
+    def to_json(self) -> str:
+        return json.dumps({"summary": self.summary, "turns": self.turns}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "Conversation":
+        data = json.loads(raw)
+        return cls(summary=data.get("summary", []), turns=data.get("turns", []))
+
+
+class ConversationStore:
+    """
+    Хранилище контекстов диалогов с ограничением памяти.
+
+    Основное хранилище — Redis (общий для всех воркеров Gunicorn), записи
+    живут `CONTEXT_TTL` секунд с последнего сообщения. Копии контекстов
+    держатся в LRU в памяти воркера с тем же TTL, ограничением числа
+    пользователей и объема памяти; при недоступности Redis используется
+    только она, а обращения к Redis приостанавливаются на `REDIS_RETRY_INTERVAL`.
+    """
+
+    KEY_PREFIX = "mindfix:rag:context:"
+
+    def __init__(self):
+        self.enabled = settings.CONTEXT_ENABLED
+        self.ttl = settings.CONTEXT_TTL
+        self.max_users = settings.CONTEXT_MAX_USERS
+        self.max_bytes = int(settings.CONTEXT_MAX_MEMORY_MB * 1024 * 1024)
+        # user_key -> (время истечения, контекст, размер в байтах)
+        self._local: "OrderedDict[str, tuple[float, Conversation, int]]" = OrderedDict()
+        self._local_bytes = 0
+        self._redis: Optional[redis.Redis] = None
+        self._redis_down_until = 0.0
+        self.stats = {"evicted_lru": 0, "evicted_ttl": 0, "errors": 0}
+
+    async def start(self) -> None:
+        """Создает пул соединений к Redis."""
+        if self.enabled and self._redis is None:
+            self._redis = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                retry=Retry(NoBackoff(), 0),
+            )
+
+    async def close(self) -> None:
+        """Закрывает соединения с Redis."""
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def _redis_available(self) -> bool:
+        """Проверяет, можно ли сейчас обращаться к Redis."""
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, action: str, error: Exception) -> None:
+        """Учитывает ошибку Redis и временно переходит на память воркера."""
+        self.stats["errors"] += 1
+        self._redis_down_until = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+        logger.warning(f"Ошибка {action} контекста диалога в Redis: {error}")
+
+    def _key(self, user_key: str) -> str:
+        return self.KEY_PREFIX + hashlib.sha256(user_key.encode("utf-8")).hexdigest()
+
+    def _local_pop(self, user_key: str) -> None:
+        item = self._local.pop(user_key, None)
+        if item is not None:
+            self._local_bytes -= item[2]
+
+    def _local_get(self, user_key: str) -> Optional[Conversation]:
+        """Возвращает локальную копию контекста, удаляя устаревшую."""
+        item = self._local.get(user_key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            self._local_pop(user_key)
+            self.stats["evicted_ttl"] += 1
+            return None
+        self._local.move_to_end(user_key)
+        return item[1]
+
+    def _local_set(self, user_key: str, conversation: Conversation) -> None:
+        """Сохраняет локальную копию и вытесняет давно неактивных пользователей сверх лимитов."""
+        self._local_pop(user_key)
+        size = conversation.size_bytes()
+        self._local[user_key] = (time.monotonic() + self.ttl, conversation, size)
+        self._local_bytes += size
+        while self._local and (len(self._local) > self.max_users or self._local_bytes > self.max_bytes):
+            _, (_, _, evicted_size) = self._local.popitem(last=False)
+            self._local_bytes -= evicted_size
+            self.stats["evicted_lru"] += 1
+
+    async def get(self, user_key: str) -> Conversation:
+        """Возвращает контекст пользователя (пустой, если его нет или он истек)."""
+        if not self.enabled:
+            return Conversation()
+        if self._redis_available():
+            try:
+                raw = await self._redis.get(self._key(user_key))
+                conversation = Conversation.from_json(raw) if raw is not None else Conversation()
+                self._local_set(user_key, conversation)
+                return conversation
+            except (redis.RedisError, OSError, ValueError) as e:
+                self._redis_failed("чтения", e)
+        return self._local_get(user_key) or Conversation()
+
+    async def append(self, user_key: str, query: str, answer: str) -> None:
+        """Добавляет завершенную реплику в контекст пользователя."""
+        if not self.enabled:
+            return
+        conversation = await self.get(user_key)
+        conversation.add_turn(query, answer)
+        self._local_set(user_key, conversation)
+        if self._redis_available():
+            try:
+                await self._redis.set(self._key(user_key), conversation.to_json(), ex=self.ttl)
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed("записи", e)
+
+    async def reset(self, user_key: str) -> None:
+        """Удаляет контекст пользователя (например, при начале новой сессии)."""
+        self._local_pop(user_key)
+        if self._redis_available():
+            try:
+                await self._redis.delete(self._key(user_key))
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed("удаления", e)
+
+    def get_stats(self) -> dict:
+        """Возвращает размер локального хранилища и счетчики вытеснения."""
+        return {
+            **self.stats,
+            "local_users": len(self._local),
+            "local_bytes": self._local_bytes,
+        }
+
+
+conversation_store = ConversationStore()
@@ -0,0 +1,129 @@
+import logging
+from typing import AsyncIterator, Optional
+
+from app.core.config import settings
+from app.core.ollama import ollama_client
+from app.services.embeddings import embed_query
+from app.services.lexical_index import SearchHit, lexical_index
+from app.services.semantic_index import semantic_index
+
+logger = logging.getLogger(__name__)
+
+# Неизменный префикс каждого запроса: Ollama переиспользует его KV-кеш,
+# поэтому изменяемые части (фрагменты базы, контекст, вопрос) идут после него
+SYSTEM_PROMPT = (
+    "Ты — ИИ-ассистент проекта Mind-Fix, помогающий людям разобраться в своем "
+    "психологическом состоянии на основе интегративной теории неврозов (ИТН). "
+    "Отвечай на русском языке, спокойно и поддерживающе, без диагнозов и назначения лекарств. "
+    "Опирайся на фрагменты базы знаний из сообщения пользователя; если в них нет ответа, "
+    "скажи об этом и ответь кратко из общих знаний. При признаках угрозы жизни "
+    "советуй немедленно обратиться к специалисту или в экстренные службы."
+)
+
+
+class DirectRAG:
+    """
+    Прямой режим генерации: поиск по локальному индексу и запрос в Ollama.
+
+    В отличие от пути через AnythingLLM, запрос проходит один сетевой
+    переход, а промпт полностью собирается в backend: неизменный
+    системный префикс, затем найденные фрагменты базы знаний и вопрос
+    (с контекстом диалога, если он ведется).
+    """
+
+    def __init__(self):
+        self.system_prompt = settings.DIRECT_SYSTEM_PROMPT or SYSTEM_PROMPT
+        self.top_k = settings.DIRECT_TOP_K
+        self.max_context_chars = settings.DIRECT_MAX_CONTEXT_CHARS
+
+    def cache_scope(self, doc_type: Optional[str], topic: Optional[str]) -> str:
+        """Область кеша ответов: модель и фильтры поиска, от которых зависит ответ."""
+        return f"direct:{ollama_client.model}:{topic or ''}:{doc_type or ''}"
+
+    async def retrieve(self, query: str, doc_type: Optional[str], topic: Optional[str]) -> list[SearchHit]:
+        """
+        Ищет фрагменты базы знаний для вопроса.
+
+        При `DIRECT_RETRIEVAL=semantic` поиск идет по эмбеддингам, а пока
+        семантический индекс не готов или Ollama не посчитала эмбеддинг
+        запроса — по BM25. Фильтры применяются в том же порядке, что и выбор
+        workspace AnythingLLM: сначала тема, затем тип; если с фильтром
+        ничего не найдено — без него.
+        """
+        if not lexical_index.ready:
+            logger.warning("Индекс базы знаний не загружен, ответ генерируется без фрагментов")
+            return []
+        search = lambda **filters: lexical_index.search(query, top_k=self.top_k, **filters)
+        if settings.DIRECT_RETRIEVAL == "semantic" and semantic_index.ready:
+            vector = await embed_query(query)
+            if vector is not None:
+                search = lambda **filters: semantic_index.search(vector, top_k=self.top_k, **filters)
+        for filters in ({"topic": topic}, {"doc_type": doc_type}, {}):
+            if filters and not any(filters.values()):
+                continue
+            hits = search(**filters)
+            if hits:
+                return hits
+        return []
+
+    def build_messages(self, prompt: str, hits: list[SearchHit]) -> list[dict]:
+        """Собирает сообщения чата: системный префикс, затем фрагменты базы и вопрос."""
+        parts, used = [], 0
+        for number, hit in enumerate(hits, start=1):
+            if used + len(hit.text) > self.max_context_chars and parts:
+                break
+            parts.append(f"[{number}] {hit.text}")
+            used += len(hit.text)
+        content = prompt
+        if parts:
+            content = "Фрагменты базы знаний:\n\n" + "\n\n".join(parts) + f"\n\nВопрос: {prompt}"
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": content},
+        ]
+
+    @staticmethod
+    def _sources(hits: list[SearchHit]) -> list[dict]:
+        """Источники ответа в виде, близком к `sourceDocuments` AnythingLLM."""
+        return [
+            {"title": hit.source, "type": hit.type, "topic": hit.topic, "score": hit.score, "text": hit.text}
+            for hit in hits
+        ]
+
+    async def answer(self, query: str, prompt: str, doc_type: Optional[str], topic: Optional[str]) -> dict:
+        """
+        Генерирует ответ целиком.
+
+        Args:
+            query: Исходный вопрос пользователя (по нему идет поиск).
+            prompt: Вопрос с контекстом диалога (передается модели).
+
+        Returns:
+            Словарь {"response", "sources"} или {"error": ...}.
+        """
+        hits = await self.retrieve(query, doc_type, topic)
+        result = await ollama_client.chat(self.build_messages(prompt, hits))
+        if "error" in result:
+            return {"error": result["error"]}
+        return {"response": result.get("message", {}).get("content") or "Ответ не найден.", "sources": self._sources(hits)}
+
+    async def stream(self, query: str, prompt: str, doc_type: Optional[str], topic: Optional[str]) -> AsyncIterator[dict]:
+        """
+        Генерирует ответ потоком.
+
+        Yields:
+            `{"sources": [...]}` первым событием, затем `{"text": ...}` по фрагментам
+            ответа; при ошибке — одно событие `{"error": ...}`.
+        """
+        hits = await self.retrieve(query, doc_type, topic)
+        yield {"sources": self._sources(hits)}
+        async for event in ollama_client.stream_chat(self.build_messages(prompt, hits)):
+            if event.get("error"):
+                yield {"error": event["error"]}
+                return
+            text = event.get("message", {}).get("content")
+            if text:
+                yield {"text": text}
+
+
+direct_rag = DirectRAG()
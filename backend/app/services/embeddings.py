@@ -0,0 +1,150 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+import httpx
+import numpy as np
+
+from app.core.config import settings
+from app.core.ollama import ollama_client
+
+logger = logging.getLogger(__name__)
+
+
+def text_key(text: str) -> str:
+    """Ключ эмбеддинга — хеш текста: одинаковые фрагменты не пересчитываются."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Нормирует векторы по строкам: косинусная близость сводится к скалярному произведению."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def embed_texts(client: httpx.Client, texts: list[str]) -> np.ndarray:
+    """
+    Считает эмбеддинги пачки текстов через `/api/embed` Ollama (блокирующий вызов).
+
+    Raises:
+        httpx.HTTPError: Ollama недоступна или вернула ошибку.
+    """
+    response = client.post("/api/embed", json={"model": settings.EMBEDDING_MODEL, "input": texts})
+    response.raise_for_status()
+    return normalize(response.json()["embeddings"])
+
+
+async def embed_query(text: str) -> Optional[np.ndarray]:
+    """Нормированный эмбеддинг запроса пользователя; None, если Ollama не ответила."""
+    result = await ollama_client.embed([text], settings.EMBEDDING_MODEL)
+    if "error" in result or not result.get("embeddings"):
+        return None
+    return normalize(result["embeddings"][0])
+
+
+class EmbeddingStore:
+    """
+    Хранилище эмбеддингов с адресацией по содержимому.
+
+    Векторы дописываются в конец файла `vectors.f32` (матрица float32,
+    открывается через mmap), а их ключи — в `keys.txt` в том же порядке.
+    Повторная сборка считает эмбеддинги только для новых текстов.
+    Запись защищена файловой блокировкой, поэтому воркеры, стартующие
+    одновременно, не считают одни и те же эмбеддинги.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.dim: Optional[int] = None
+        self.rows: dict[str, int] = {}
+        self.vectors: Optional[np.ndarray] = None
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Исключительная блокировка хранилища между процессами."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        """Читает ключи и отображает матрицу векторов в память."""
+        meta_path = self.directory / "meta.json"
+        if not meta_path.exists():
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+        with open(self.directory / "keys.txt", "r", encoding="utf-8") as f:
+            keys = f.read().split()
+        # После сбоя при дописывании учитываются только строки, у которых есть и ключ, и вектор
+        count = min(len(keys), os.path.getsize(self.directory / "vectors.f32") // (4 * self.dim))
+        self.rows = {key: row for row, key in enumerate(keys[:count])}
+        self.vectors = (
+            np.memmap(self.directory / "vectors.f32", dtype=np.float32, mode="r", shape=(count, self.dim))
+            if count else np.empty((0, self.dim), dtype=np.float32)
+        )
+
+    def open(self) -> None:
+        """Открывает хранилище для чтения."""
+        self._load()
+
+    def add_missing(self, texts: list[str], batch_size: int) -> int:
+        """
+        Считает и сохраняет эмбеддинги текстов, которых еще нет в хранилище.
+
+        Returns:
+            Число посчитанных эмбеддингов.
+
+        Raises:
+            httpx.HTTPError: Ollama недоступна (уже посчитанные пачки сохраняются).
+        """
+        added = 0
+        with self._locked():
+            self._load()
+            missing = list({text_key(text): text for text in texts if text_key(text) not in self.rows}.items())
+            if missing:
+                logger.info(f"Расчет эмбеддингов ({settings.EMBEDDING_MODEL}): {len(missing)} новых фрагментов")
+                timeout = httpx.Timeout(settings.OLLAMA_WARMUP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+                with httpx.Client(base_url=settings.OLLAMA_BASE_URL, timeout=timeout) as client:
+                    for start in range(0, len(missing), batch_size):
+                        batch = missing[start:start + batch_size]
+                        vectors = embed_texts(client, [text for _, text in batch])
+                        self._append([key for key, _ in batch], vectors)
+                        added += len(batch)
+            self._load()
+        return added
+
+    def _append(self, keys: list[str], vectors: np.ndarray) -> None:
+        """Дописывает пачку: сначала векторы, затем ключи (ключ без вектора при сбое отбрасывается)."""
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            with open(self.directory / "meta.json", "w", encoding="utf-8") as f:
+                json.dump({"model": settings.EMBEDDING_MODEL, "dim": self.dim}, f)
+            open(self.directory / "keys.txt", "a").close()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Размерность эмбеддингов {vectors.shape[1]} не совпадает с хранилищем ({self.dim})")
+        with open(self.directory / "vectors.f32", "ab") as f:
+            f.write(vectors.astype(np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.directory / "keys.txt", "a", encoding="utf-8") as f:
+            f.write("".join(f"{key}\n" for key in keys))
+
+    def lookup(self, texts: list[str]) -> np.ndarray:
+        """Номера строк матрицы для текстов (-1, если эмбеддинга нет)."""
+        return np.array([self.rows.get(text_key(text), -1) for text in texts], dtype=np.int64)
+
+
+def model_store_dir() -> Path:
+    """Каталог хранилища для текущей модели эмбеддингов (у разных моделей разные пространства)."""
+    slug = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in settings.EMBEDDING_MODEL)
+    return Path(settings.EMBEDDING_STORE_DIR) / slug
@@ -0,0 +1,261 @@
+import asyncio
+import io
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+from app.core.config import settings
+from app.db.session import engine, init_db
+
+logger = logging.getLogger(__name__)
+
+# Пространство имен для идентификаторов записей (uuid5 от содержимого записи лога)
+RECORD_NAMESPACE = uuid.UUID("6f0c5b1e-2f4a-4c8e-9d57-3a1f0e6b9c21")
+
+INTERACTION_COLUMNS = (
+    "record_id", "timestamp", "user_id", "username", "query", "response",
+    "doc_type", "query_length", "response_length",
+)
+SESSION_COLUMNS = ("record_id", "timestamp", "user_id", "username", "action")
+
+
+def record_id(record: dict[str, Any]) -> uuid.UUID:
+    """
+    Вычисляет идентификатор записи лога по ее содержимому.
+
+    Одна и та же запись, пришедшая от бота и загруженная импортом из файла,
+    получает один идентификатор, и повторная вставка пропускается.
+    """
+    return uuid.uuid5(RECORD_NAMESPACE, json.dumps(record, ensure_ascii=False, sort_keys=True))
+
+
+def interaction_row(record: dict[str, Any]) -> tuple:
+    """Преобразует запись лога взаимодействия в строку таблицы `interactions`."""
+    query = record.get("query") or ""
+    response = record.get("response") or ""
+    return (
+        record_id(record),
+        datetime.fromisoformat(record["timestamp"]),
+        int(record["user_id"]),
+        record.get("username"),
+        query,
+        response,
+        record.get("doc_type"),
+        int(record.get("query_length", len(query))),
+        int(record.get("response_length", len(response))),
+    )
+
+
+def session_row(record: dict[str, Any]) -> tuple:
+    """Преобразует запись лога сессии в строку таблицы `user_sessions`."""
+    return (
+        record_id(record),
+        datetime.fromisoformat(record["timestamp"]),
+        int(record["user_id"]),
+        record.get("username"),
+        str(record["action"]),
+    )
+
+
+def _copy_value(value: Any) -> str:
+    """Форматирует значение для COPY в текстовом формате PostgreSQL."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(connection, table: str, columns: tuple[str, ...], rows: list[tuple]) -> int:
+    """
+    Вставляет строки одной командой COPY, пропуская уже существующие записи.
+
+    COPY не поддерживает ON CONFLICT, поэтому строки сначала копируются
+    во временную таблицу, а затем переносятся в основную одним INSERT.
+
+    Args:
+        connection: Соединение psycopg2 (транзакцию фиксирует вызывающий код).
+
+    Returns:
+        Число вставленных строк (без дублей).
+    """
+    if not rows:
+        return 0
+    column_list = ", ".join(columns)
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMP TABLE staging_{table} ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {table} WITH NO DATA"
+        )
+        cursor.copy_expert(f"COPY staging_{table} ({column_list}) FROM STDIN", buffer)
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM staging_{table} "
+            f"ON CONFLICT (record_id) DO NOTHING"
+        )
+        return cursor.rowcount
+
+
+def _rows(records: Iterable[dict], convert) -> tuple[list[tuple], int]:
+    """Преобразует записи в строки таблицы, пропуская некорректные."""
+    rows, invalid = [], 0
+    for record in records:
+        try:
+            rows.append(convert(record))
+        except (KeyError, TypeError, ValueError):
+            invalid += 1
+    return rows, invalid
+
+
+def write_records(interactions: list[dict], sessions: list[dict]) -> dict[str, int]:
+    """
+    Записывает пачку записей логов в PostgreSQL в одной транзакции (блокирующий вызов).
+
+    Returns:
+        Счетчики: вставлено взаимодействий и сессий, пропущено дублей и некорректных записей.
+    """
+    interaction_rows, invalid_interactions = _rows(interactions, interaction_row)
+    session_rows, invalid_sessions = _rows(sessions, session_row)
+    connection = engine.raw_connection()
+    try:
+        inserted_interactions = copy_rows(connection, "interactions", INTERACTION_COLUMNS, interaction_rows)
+        inserted_sessions = copy_rows(connection, "user_sessions", SESSION_COLUMNS, session_rows)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return {
+        "interactions": inserted_interactions,
+        "sessions": inserted_sessions,
+        "duplicates": len(interaction_rows) + len(session_rows) - inserted_interactions - inserted_sessions,
+        "invalid": invalid_interactions + invalid_sessions,
+    }
+
+
+class InteractionWriter:
+    """
+    Фоновая запись взаимодействий в PostgreSQL пачками.
+
+    Записи кладутся в ограниченную очередь в памяти и пишутся фоновой задачей
+    пачками до `INTERACTION_BATCH_SIZE` строк (одна команда COPY на таблицу),
+    не дожидаясь базы в обработчике запроса. Если пачку записать не удалось,
+    она отбрасывается: исходные записи остаются в логах бота и догружаются
+    импортом (`python -m app.import_logs`).
+    """
+
+    def __init__(self):
+        self.enabled = settings.INTERACTION_STORE_ENABLED
+        self.batch_size = settings.INTERACTION_BATCH_SIZE
+        self.flush_interval = settings.INTERACTION_FLUSH_INTERVAL
+        self.queue_size = settings.INTERACTION_QUEUE_MAX_SIZE
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._schema_ready = False
+        self.stats = {"written": 0, "duplicates": 0, "invalid": 0, "dropped": 0, "failed": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._writer_task is not None
+
+    async def start(self) -> None:
+        """Запускает фоновую запись."""
+        if not self.enabled or self._writer_task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._writer_task = asyncio.create_task(self._run_writer())
+
+    async def stop(self) -> None:
+        """Дописывает накопленные записи и останавливает фоновую запись."""
+        if self._writer_task is None:
+            return
+        # Сигнал остановки ставим в очередь, чтобы он обработался после всех записей
+        await self._queue.put(None)
+        await self._writer_task
+        self._writer_task = None
+        self._queue = None
+
+    def enqueue(self, kind: str, records: list[dict]) -> int:
+        """
+        Ставит записи в очередь на запись.
+
+        Args:
+            kind: "interactions" или "sessions".
+
+        Returns:
+            Число принятых записей (остальные отброшены из-за переполнения очереди).
+        """
+        accepted = 0
+        for record in records:
+            try:
+                self._queue.put_nowait((kind, record))
+            except asyncio.QueueFull:
+                self.stats["dropped"] += len(records) - accepted
+                break
+            accepted += 1
+        return accepted
+
+    async def _run_writer(self) -> None:
+        """Фоновая задача: собирает записи в пачки и передает их на запись в поток."""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await asyncio.to_thread(self._write_batch, batch)
+
+    def _write_batch(self, batch: list[tuple[str, dict]]) -> None:
+        """Записывает пачку в базу (выполняется в потоке)."""
+        interactions = [record for kind, record in batch if kind == "interactions"]
+        sessions = [record for kind, record in batch if kind == "sessions"]
+        try:
+            if not self._schema_ready:
+                init_db()
+                self._schema_ready = True
+            result = write_records(interactions, sessions)
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logger.error(f"Не удалось записать пачку взаимодействий ({len(batch)} записей) в PostgreSQL: {e}")
+            return
+        self.stats["written"] += result["interactions"] + result["sessions"]
+        self.stats["duplicates"] += result["duplicates"]
+        self.stats["invalid"] += result["invalid"]
+
+    def get_stats(self) -> dict:
+        """Возвращает счетчики записи и текущую длину очереди."""
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+interaction_writer = InteractionWriter()
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.text import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файлов индекса: при изменении токенизации или схемы индекс пересобирается
+INDEX_FORMAT_VERSION = 1
+
+
+@dataclass
+class SearchHit:
+    """Один результат лексического поиска по базе знаний."""
+    doc_id: int
+    score: float
+    type: Optional[str]
+    topic: Optional[str]
+    source: Optional[str]
+    text: str
+
+
+def _fingerprint(path: Path) -> str:
+    """Вычисляет отпечаток содержимого базы знаний и параметров индекса."""
+    digest = hashlib.sha256()
+    digest.update(f"v{INDEX_FORMAT_VERSION}:k1={settings.BM25_K1}:b={settings.BM25_B}:".encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def build_index(kb_path: Path, out_dir: Path) -> None:
+    """
+    Строит BM25-индекс по `knowledge_base.jsonl` и сохраняет его в `out_dir`.
+
+    Индекс хранится в "term-major" CSR-формате: для каждого термина подряд
+    лежат номера документов и уже посчитанные BM25-веса. Поиск сводится
+    к сложению нескольких срезов массивов, а сами массивы открываются
+    через mmap и разделяются между воркерами через page cache.
+
+    Файлы:
+        indptr.npy, doc_ids.npy, weights.npy — постинги терминов;
+        type_codes.npy, topic_codes.npy — коды фильтров по документам;
+        offsets.npy, docs.jsonl — байтовые смещения и исходные записи;
+        meta.json — словарь терминов и справочники фильтров.
+    """
+    k1, b = settings.BM25_K1, settings.BM25_B
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    vocab: dict[str, int] = {}
+    types: dict[Optional[str], int] = {}
+    topics: dict[Optional[str], int] = {}
+    term_ids: list[np.ndarray] = []
+    doc_lengths: list[int] = []
+    type_codes: list[int] = []
+    topic_codes: list[int] = []
+    offsets: list[int] = []
+
+    with open(kb_path, "r", encoding="utf-8") as src, open(out_dir / "docs.jsonl", "wb") as docs:
+        for line in src:
+            try:
+                chunk = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            text = chunk.get("text") or ""
+            tokens = tokenize(text)
+            ids = np.fromiter((vocab.setdefault(t, len(vocab)) for t in tokens), dtype=np.int32, count=len(tokens))
+            term_ids.append(ids)
+            doc_lengths.append(len(tokens))
+            type_codes.append(types.setdefault(chunk.get("type"), len(types)))
+            topic_codes.append(topics.setdefault(chunk.get("topic"), len(topics)))
+            offsets.append(docs.tell())
+            docs.write(json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n")
+        offsets.append(docs.tell())
+
+    n_docs = len(term_ids)
+    n_terms = len(vocab)
+    # Пары (термин, документ) с частотами: уникализируем совместный ключ
+    doc_index = np.repeat(np.arange(n_docs, dtype=np.int64), [len(ids) for ids in term_ids])
+    all_terms = np.concatenate(term_ids).astype(np.int64) if n_docs else np.empty(0, dtype=np.int64)
+    pair_keys, tf = np.unique(all_terms * max(n_docs, 1) + doc_index, return_counts=True)
+    pair_terms = pair_keys // max(n_docs, 1)
+    pair_docs = pair_keys % max(n_docs, 1)
+
+    lengths = np.asarray(doc_lengths, dtype=np.float32)
+    avg_len = float(lengths.mean()) if n_docs and lengths.mean() > 0 else 1.0
+    df = np.bincount(pair_terms, minlength=n_terms).astype(np.float32)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+    norm = k1 * (1.0 - b + b * lengths[pair_docs] / avg_len)
+    weights = idf[pair_terms] * tf * (k1 + 1.0) / (tf + norm)
+
+    indptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(df.astype(np.int64), out=indptr[1:])
+
+    np.save(out_dir / "indptr.npy", indptr)
+    np.save(out_dir / "doc_ids.npy", pair_docs.astype(np.int32))
+    np.save(out_dir / "weights.npy", weights.astype(np.float32))
+    np.save(out_dir / "type_codes.npy", np.asarray(type_codes, dtype=np.int16))
+    np.save(out_dir / "topic_codes.npy", np.asarray(topic_codes, dtype=np.int16))
+    np.save(out_dir / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+    meta = {
+        "version": INDEX_FORMAT_VERSION,
+        "n_docs": n_docs,
+        "vocab": vocab,
+        "types": [t for t, _ in sorted(types.items(), key=lambda item: item[1])],
+        "topics": [t for t, _ in sorted(topics.items(), key=lambda item: item[1])],
+    }
+    with open(out_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+class LexicalIndex:
+    """
+    BM25-поиск по `knowledge_base.jsonl` внутри процесса backend.
+
+    Индекс строится один раз на версию базы знаний и хранится на диске
+    в каталоге `<BM25_INDEX_DIR>/<отпечаток>`; воркеры открывают файлы
+    через mmap и не разбирают JSONL при старте.
+    """
+
+    def __init__(self, kb_path: Path, index_dir: Path):
+        self.kb_path = kb_path
+        self.index_dir = index_dir
+        self.path: Optional[Path] = None
+        self._vocab: dict[str, int] = {}
+        self._types: list[Optional[str]] = []
+        self._topics: list[Optional[str]] = []
+        self._docs_file = None
+        self._docs: Optional[mmap.mmap] = None
+
+    @property
+    def ready(self) -> bool:
+        """Индекс загружен и готов к поиску."""
+        return self.path is not None
+
+    @property
+    def size(self) -> int:
+        """Количество документов в индексе."""
+        return len(self._type_codes) if self.ready else 0
+
+    def load_or_build(self) -> None:
+        """
+        Открывает индекс для текущей версии базы знаний, при необходимости строя его.
+
+        Построение идет во временный каталог с последующим атомарным
+        переименованием, поэтому несколько воркеров могут стартовать одновременно.
+        """
+        if not self.kb_path.exists():
+            logger.warning(f"База знаний не найдена: {self.kb_path}, лексический поиск отключен")
+            return
+        target = self.index_dir / _fingerprint(self.kb_path)
+        if not (target / "meta.json").exists():
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            tmp_dir = Path(tempfile.mkdtemp(prefix=".build-", dir=self.index_dir))
+            try:
+                build_index(self.kb_path, tmp_dir)
+                os.rename(tmp_dir, target)
+                logger.info(f"Построен BM25-индекс базы знаний: {target}")
+            except OSError:
+                # Индекс уже построил другой воркер
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            self._remove_stale(keep=target.name)
+        self._open(target)
+
+    def _remove_stale(self, keep: str) -> None:
+        """Удаляет индексы прежних версий базы знаний."""
+        for path in self.index_dir.iterdir():
+            if path.is_dir() and path.name != keep and not path.name.startswith("."):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _open(self, path: Path) -> None:
+        """Открывает файлы индекса в режиме mmap."""
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self._vocab = meta["vocab"]
+        self._types = meta["types"]
+        self._topics = meta["topics"]
+        self._indptr = np.load(path / "indptr.npy", mmap_mode="r")
+        self._doc_ids = np.load(path / "doc_ids.npy", mmap_mode="r")
+        self._weights = np.load(path / "weights.npy", mmap_mode="r")
+        self._type_codes = np.load(path / "type_codes.npy", mmap_mode="r")
+        self._topic_codes = np.load(path / "topic_codes.npy", mmap_mode="r")
+        self._offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.close()
+        self._docs_file = open(path / "docs.jsonl", "rb")
+        self._docs = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+
+    def close(self) -> None:
+        """Закрывает отображенный в память файл документов."""
+        if self._docs is not None:
+            self._docs.close()
+            self._docs = None
+        if self._docs_file is not None:
+            self._docs_file.close()
+            self._docs_file = None
+
+    def document(self, doc_id: int) -> dict:
+        """Читает исходную запись базы знаний по номеру документа."""
+        start, end = int(self._offsets[doc_id]), int(self._offsets[doc_id + 1])
+        return json.loads(self._docs[start:end])
+
+    def filter_mask(self, doc_type: Optional[str], topic: Optional[str]) -> Optional[np.ndarray]:
+        """Строит маску документов по фильтрам; None — фильтров нет."""
+        mask = None
+        for value, names, codes in ((doc_type, self._types, self._type_codes), (topic, self._topics, self._topic_codes)):
+            if value is None:
+                continue
+            code = names.index(value) if value in names else -1
+            condition = codes == code
+            mask = condition if mask is None else mask & condition
+        return mask
+
+    def search(self, query: str, top_k: int = 5, doc_type: Optional[str] = None, topic: Optional[str] = None) -> list[SearchHit]:
+        """
+        Ищет фрагменты базы знаний, наиболее релевантные запросу по BM25.
+
+        Args:
+            query: Текст запроса.
+            top_k: Максимальное количество результатов.
+            doc_type: Фильтр по типу фрагмента (`theory`, `practice`, `extra`).
+            topic: Фильтр по теме фрагмента.
+
+        Returns:
+            Список результатов, отсортированный по убыванию релевантности.
+        """
+        if not self.ready:
+            return []
+        term_ids = {self._vocab[t] for t in tokenize(query) if t in self._vocab}
+        if not term_ids:
+            return []
+
+        scores = np.zeros(len(self._type_codes), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self._indptr[term_id], self._indptr[term_id + 1]
+            # Постинги одного термина не содержат повторов документов
+            scores[self._doc_ids[start:end]] += self._weights[start:end]
+
+        mask = self.filter_mask(doc_type, topic)
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        candidates = np.flatnonzero(scores)
+        if candidates.size == 0:
+            return []
+        if candidates.size > top_k:
+            top = np.argpartition(scores[candidates], -top_k)[-top_k:]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        hits = []
+        for doc_id in candidates:
+            chunk = self.document(int(doc_id))
+            hits.append(SearchHit(
+                doc_id=int(doc_id),
+                score=float(scores[doc_id]),
+                type=chunk.get("type"),
+                topic=chunk.get("topic"),
+                source=chunk.get("source"),
+                text=chunk.get("text", ""),
+            ))
+        return hits
+
+
+lexical_index = LexicalIndex(
+    kb_path=Path(settings.KNOWLEDGE_BASE_PATH),
+    index_dir=Path(settings.BM25_INDEX_DIR),
+)
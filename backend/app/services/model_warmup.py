@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.ollama import ollama_client
+from app.core.rag import anything_llm_client
+
+logger = logging.getLogger(__name__)
+
+
+class ModelWarmer:
+    """
+    Прогрев модели в Ollama и проверка готовности сервиса.
+
+    После перезапуска или простоя Ollama выгружает модель, и первый
+    пользователь ждет ее загрузки. Фоновая задача загружает
+    `LLM_MODEL_NAME` при старте (пустой запрос к `/api/generate`) и затем
+    повторяет его каждые `OLLAMA_KEEPALIVE_INTERVAL` секунд, продлевая
+    время жизни модели в памяти. Повтор безопасен и ничего не генерирует.
+
+    Каждый воркер Gunicorn прогревает модель сам: одновременные запросы
+    на загрузку одной модели Ollama объединяет. Запросы идут через общий
+    пул соединений `ollama_client`.
+    """
+
+    def __init__(self):
+        self.enabled = settings.OLLAMA_WARMUP_ENABLED
+        # Ollama показывает модели с тегом; без тега подразумевается latest
+        model = settings.LLM_MODEL_NAME
+        self.model = model if ":" in model else f"{model}:latest"
+        self.loaded_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._readiness: Optional[tuple[float, dict[str, bool]]] = None
+        self._readiness_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Запускает прогрев в фоне, не задерживая старт приложения."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._keep_warm())
+
+    async def close(self) -> None:
+        """Останавливает прогрев (пул соединений закрывает `ollama_client`)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _keep_warm(self) -> None:
+        """Фоновая задача: загружает модель до успеха, затем периодически продлевает keep-alive."""
+        while True:
+            started = time.perf_counter()
+            try:
+                await ollama_client.load_model(settings.OLLAMA_WARMUP_TIMEOUT)
+            except httpx.HTTPError as e:
+                logger.warning(f"Не удалось загрузить модель {self.model} в Ollama: {e!r}")
+                await asyncio.sleep(settings.OLLAMA_WARMUP_RETRY_INTERVAL)
+                continue
+            if self.loaded_at is None:
+                logger.info(f"Модель {self.model} загружена в Ollama за {time.perf_counter() - started:.1f} с")
+            self.loaded_at = time.time()
+            await asyncio.sleep(settings.OLLAMA_KEEPALIVE_INTERVAL)
+
+    async def model_loaded(self) -> bool:
+        """Проверяет по `/api/ps`, что модель сейчас находится в памяти Ollama."""
+        try:
+            models = await ollama_client.running_models(settings.READINESS_TIMEOUT)
+        except (httpx.HTTPError, ValueError):
+            return False
+        return any(self.model in (entry.get("name"), entry.get("model")) for entry in models)
+
+    async def readiness(self) -> dict[str, bool]:
+        """
+        Проверяет готовность обслуживать запросы.
+
+        Результат переиспользуется `READINESS_CACHE_TTL` секунд, поэтому
+        частые пробы оркестратора не нагружают AnythingLLM и Ollama.
+
+        Returns:
+            Результаты проверок по сервисам: `anythingllm` (если он основной
+            путь генерации) и, если прогрев включен, `model` (модель загружена в Ollama).
+        """
+        async with self._readiness_lock:
+            now = time.monotonic()
+            if self._readiness is not None and now - self._readiness[0] < settings.READINESS_CACHE_TTL:
+                return self._readiness[1]
+            checks = {}
+            if settings.GENERATION_MODE == "anythingllm":
+                checks["anythingllm"] = anything_llm_client.ping(settings.READINESS_TIMEOUT)
+            if self.enabled:
+                checks["model"] = self.model_loaded()
+            results = dict(zip(checks, await asyncio.gather(*checks.values())))
+            self._readiness = (time.monotonic(), results)
+            return results
+
+    def get_stats(self) -> dict:
+        """Возвращает состояние прогрева."""
+        return {
+            "enabled": self.enabled,
+            "model": self.model,
+            "loaded_at": self.loaded_at,
+        }
+
+
+model_warmer = ModelWarmer()
@@ -0,0 +1,125 @@
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import CACHE_LOOKUP_SECONDS
+from app.services.cache import response_cache
+from app.services.embeddings import embed_query
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Семантический кеш ответов: ответ на ранее заданный похожий вопрос.
+
+    Точный кеш (`ResponseCache`) находит только вопросы, совпадающие после
+    нормализации. Этот кеш хранит эмбеддинги последних
+    `SEMANTIC_CACHE_MAX_ENTRIES` вопросов в кольцевом буфере в памяти
+    воркера и при промахе точного кеша ищет вопрос той же области
+    (workspace или модель с фильтрами) с косинусной близостью не ниже
+    `SEMANTIC_CACHE_THRESHOLD`. Сам ответ по-прежнему берется из
+    `ResponseCache` по найденному вопросу, поэтому TTL, ограничение размера
+    и сброс кеша действуют на оба уровня одинаково.
+
+    Буфер ограничен, поэтому поиск в нем полный (одно матричное
+    умножение), без приближенного индекса.
+    """
+
+    def __init__(self):
+        self.enabled = settings.SEMANTIC_CACHE_ENABLED and settings.RESPONSE_CACHE_ENABLED
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD
+        self.max_entries = settings.SEMANTIC_CACHE_MAX_ENTRIES
+        self._vectors: Optional[np.ndarray] = None
+        self._scope_codes = np.full(self.max_entries, -1, dtype=np.int32)
+        self._scopes: dict[str, int] = {}
+        self._entries: list[Optional[tuple[str, str]]] = [None] * self.max_entries
+        self._slots: dict[str, int] = {}
+        self._next = 0
+        self._count = 0
+        self.stats = {"hits": 0, "misses": 0, "errors": 0}
+
+    def _nearest(self, scope: str, vector: np.ndarray) -> Optional[str]:
+        """Ближайший сохраненный вопрос той же области с близостью не ниже порога."""
+        code = self._scopes.get(scope)
+        if code is None or self._vectors is None or len(vector) != self._vectors.shape[1]:
+            return None
+        similarity = self._vectors[:self._count] @ vector
+        similarity[self._scope_codes[:self._count] != code] = -1.0
+        best = int(np.argmax(similarity))
+        if similarity[best] < self.threshold:
+            return None
+        return self._entries[best][1]
+
+    async def lookup(self, scope: str, query: str) -> tuple[Optional[dict], Optional[np.ndarray]]:
+        """
+        Ищет ответ на похожий вопрос.
+
+        Returns:
+            Ответ (или None при промахе) и эмбеддинг запроса — его нужно
+            передать в `remember` после генерации, чтобы не считать повторно.
+        """
+        if not self.enabled:
+            return None, None
+        started = time.perf_counter()
+        vector = await embed_query(query)
+        if vector is None:
+            self.stats["errors"] += 1
+            return None, None
+        match = self._nearest(scope, vector)
+        if match is not None:
+            cached = await response_cache.get(scope, match)
+            if cached is not None:
+                self.stats["hits"] += 1
+                CACHE_LOOKUP_SECONDS.labels("semantic_hit").observe(time.perf_counter() - started)
+                return cached, vector
+        self.stats["misses"] += 1
+        CACHE_LOOKUP_SECONDS.labels("semantic_miss").observe(time.perf_counter() - started)
+        return None, vector
+
+    def remember(self, scope: str, query: str, vector: Optional[np.ndarray]) -> None:
+        """Запоминает вопрос, ответ на который сохранен в кеше ответов, вытесняя самый старый."""
+        if not self.enabled or vector is None or self.max_entries <= 0:
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+        elif len(vector) != self._vectors.shape[1]:
+            return
+        key = response_cache.make_key(scope, query)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._next
+            self._next = (self._next + 1) % self.max_entries
+            self._count = min(self._count + 1, self.max_entries)
+            evicted = self._entries[slot]
+            if evicted is not None:
+                self._slots.pop(response_cache.make_key(*evicted), None)
+            self._slots[key] = slot
+        self._vectors[slot] = vector
+        self._scope_codes[slot] = self._scopes.setdefault(scope, len(self._scopes))
+        self._entries[slot] = (scope, query)
+
+    def clear(self) -> None:
+        """Удаляет все записи (вместе со сбросом кеша ответов)."""
+        self._scope_codes.fill(-1)
+        self._scopes.clear()
+        self._entries = [None] * self.max_entries
+        self._slots.clear()
+        self._next = 0
+        self._count = 0
+
+    def get_stats(self) -> dict:
+        """Возвращает счетчики попаданий и промахов семантического кеша."""
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "hit_ratio": self.stats["hits"] / total if total else 0.0,
+            "size": self._count,
+        }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import numpy as np
+
+from app.core.config import settings
+from app.services.embeddings import EmbeddingStore, model_store_dir, normalize
+from app.services.lexical_index import SearchHit, lexical_index
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файлов индекса: при изменении схемы индекс пересобирается
+INDEX_FORMAT_VERSION = 1
+# Сколько векторов на кластер используется при обучении центроидов
+TRAIN_POINTS_PER_LIST = 256
+KMEANS_ITERATIONS = 10
+ASSIGN_CHUNK_SIZE = 8192
+
+
+def _fingerprint(path: Path) -> str:
+    """Вычисляет отпечаток содержимого базы знаний, модели эмбеддингов и параметров индекса."""
+    digest = hashlib.sha256()
+    digest.update(f"v{INDEX_FORMAT_VERSION}:model={settings.EMBEDDING_MODEL}:".encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _read_texts(kb_path: Path) -> list[str]:
+    """Тексты фрагментов базы знаний в порядке номеров документов лексического индекса."""
+    texts = []
+    with open(kb_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                chunk = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            texts.append(chunk.get("text") or "")
+    return texts
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Номер ближайшего центроида для каждого вектора."""
+    return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+
+def train_centroids(sample: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Обучает центроиды кластеров сферическим k-means на выборке нормированных векторов."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = _nearest(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        # Пустой кластер сохраняет прежний центроид
+        filled = np.bincount(assign, minlength=nlist) > 0
+        centroids[filled] = normalize(sums[filled])
+    return centroids
+
+
+def build_index(kb_path: Path, store: EmbeddingStore, out_dir: Path) -> None:
+    """
+    Строит IVF-индекс эмбеддингов фрагментов `knowledge_base.jsonl` и сохраняет его в `out_dir`.
+
+    Недостающие эмбеддинги сначала считаются и дописываются в хранилище.
+    Векторы делятся на `sqrt(N)` кластеров; поиск просматривает только
+    несколько ближайших к запросу кластеров. Сами векторы в индекс
+    не копируются: он ссылается на строки матрицы хранилища.
+
+    Файлы:
+        centroids.npy — центроиды кластеров;
+        indptr.npy, list_ids.npy — номера документов по кластерам;
+        doc_rows.npy — строка матрицы хранилища для каждого документа;
+        meta.json — модель, размерность и число документов.
+
+    Raises:
+        httpx.HTTPError: Ollama недоступна.
+    """
+    texts = _read_texts(kb_path)
+    store.add_missing(texts, settings.EMBEDDING_BATCH_SIZE)
+    doc_rows = store.lookup(texts)
+    n_docs = len(doc_rows)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    nlist = max(1, int(np.sqrt(n_docs)))
+    if n_docs:
+        rng = np.random.default_rng(0)
+        sample_rows = rng.choice(doc_rows, min(n_docs, nlist * TRAIN_POINTS_PER_LIST), replace=False)
+        centroids = train_centroids(store.vectors[np.sort(sample_rows)], nlist)
+        # Назначение кластеров по частям, чтобы не копировать в память всю матрицу
+        assign = np.concatenate([
+            _nearest(store.vectors[doc_rows[start:start + ASSIGN_CHUNK_SIZE]], centroids)
+            for start in range(0, n_docs, ASSIGN_CHUNK_SIZE)
+        ])
+    else:
+        centroids = np.zeros((1, store.dim or 1), dtype=np.float32)
+        assign = np.empty(0, dtype=np.int32)
+
+    indptr = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assign, minlength=nlist), out=indptr[1:])
+
+    np.save(out_dir / "centroids.npy", centroids.astype(np.float32))
+    np.save(out_dir / "indptr.npy", indptr)
+    np.save(out_dir / "list_ids.npy", np.argsort(assign, kind="stable").astype(np.int32))
+    np.save(out_dir / "doc_rows.npy", doc_rows)
+    meta = {
+        "version": INDEX_FORMAT_VERSION,
+        "model": settings.EMBEDDING_MODEL,
+        "dim": store.dim,
+        "n_docs": n_docs,
+        "nlist": nlist,
+    }
+    with open(out_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+class SemanticIndex:
+    """
+    Семантический поиск по `knowledge_base.jsonl` внутри процесса backend.
+
+    Эмбеддинги фрагментов берутся из `EmbeddingStore`, поверх них строится
+    приближенный индекс IVF (инвертированные списки по кластерам k-means).
+    Как и лексический индекс, он хранится в каталоге
+    `<SEMANTIC_INDEX_DIR>/<отпечаток>` и открывается через mmap. Номера
+    документов совпадают с лексическим индексом, из которого читаются
+    сами фрагменты и фильтры по типу и теме.
+    """
+
+    def __init__(self, kb_path: Path, index_dir: Path):
+        self.enabled = settings.SEMANTIC_INDEX_ENABLED
+        self.kb_path = kb_path
+        self.index_dir = index_dir
+        self.store = EmbeddingStore(model_store_dir())
+        self.path: Optional[Path] = None
+        self.nprobe = settings.SEMANTIC_NPROBE
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """Индекс загружен и готов к поиску."""
+        return self.path is not None
+
+    @property
+    def size(self) -> int:
+        """Количество документов в индексе."""
+        return len(self._doc_rows) if self.ready else 0
+
+    async def start(self) -> None:
+        """
+        Загружает индекс в фоне, не задерживая старт приложения.
+
+        Первый расчет эмбеддингов всей базы знаний может занять минуты;
+        до его окончания поиск идет по лексическому индексу.
+        """
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(asyncio.to_thread(self.load_or_build))
+
+    def load_or_build(self) -> None:
+        """
+        Открывает индекс для текущей версии базы знаний, при необходимости строя его.
+
+        Построение идет во временный каталог с последующим атомарным
+        переименованием; расчет эмбеддингов защищен блокировкой хранилища,
+        поэтому воркеры, стартующие одновременно, не считают их повторно.
+        """
+        if not self.kb_path.exists():
+            logger.warning(f"База знаний не найдена: {self.kb_path}, семантический поиск отключен")
+            return
+        target = self.index_dir / _fingerprint(self.kb_path)
+        if not (target / "meta.json").exists():
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            tmp_dir = Path(tempfile.mkdtemp(prefix=".build-", dir=self.index_dir))
+            try:
+                build_index(self.kb_path, self.store, tmp_dir)
+                os.rename(tmp_dir, target)
+                logger.info(f"Построен семантический индекс базы знаний: {target}")
+            except httpx.HTTPError as e:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                logger.warning(f"Не удалось посчитать эмбеддинги базы знаний, семантический поиск отключен: {e!r}")
+                return
+            except OSError:
+                # Индекс уже построил другой воркер
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            self._remove_stale(keep=target.name)
+        self.store.open()
+        self._open(target)
+
+    def _remove_stale(self, keep: str) -> None:
+        """Удаляет индексы прежних версий базы знаний (эмбеддинги в хранилище остаются)."""
+        for path in self.index_dir.iterdir():
+            if path.is_dir() and path.name != keep and not path.name.startswith("."):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _open(self, path: Path) -> None:
+        """Открывает файлы индекса в режиме mmap."""
+        self._centroids = np.load(path / "centroids.npy")
+        self._indptr = np.load(path / "indptr.npy", mmap_mode="r")
+        self._list_ids = np.load(path / "list_ids.npy", mmap_mode="r")
+        self._doc_rows = np.load(path / "doc_rows.npy", mmap_mode="r")
+        self.path = path
+
+    def _candidates(self, vector: np.ndarray, mask: Optional[np.ndarray], top_k: int) -> np.ndarray:
+        """Документы из `nprobe` ближайших кластеров, прошедшие фильтр."""
+        probe = np.argsort(-(self._centroids @ vector))[:self.nprobe]
+        ids = np.concatenate([self._list_ids[self._indptr[i]:self._indptr[i + 1]] for i in probe])
+        if mask is None:
+            return ids
+        ids = ids[mask[ids]]
+        # Фильтр оставляет малую часть базы: если в ближайших кластерах ее почти нет, проверяем ее целиком
+        return ids if len(ids) >= top_k else np.flatnonzero(mask)
+
+    def search(self, vector: np.ndarray, top_k: int = 5, doc_type: Optional[str] = None, topic: Optional[str] = None) -> list[SearchHit]:
+        """
+        Ищет фрагменты базы знаний, ближайшие к эмбеддингу запроса.
+
+        Args:
+            vector: Нормированный эмбеддинг запроса (`embed_query`).
+            top_k: Максимальное количество результатов.
+            doc_type: Фильтр по типу фрагмента (`theory`, `practice`, `extra`).
+            topic: Фильтр по теме фрагмента.
+
+        Returns:
+            Список результатов, отсортированный по убыванию косинусной близости.
+        """
+        # Фрагменты и фильтры читаются из лексического индекса той же версии базы знаний
+        if not self.ready or lexical_index.size != self.size:
+            return []
+        candidates = self._candidates(vector, lexical_index.filter_mask(doc_type, topic), top_k)
+        if candidates.size == 0:
+            return []
+        scores = self.store.vectors[np.asarray(self._doc_rows)[candidates]] @ vector
+        if candidates.size > top_k:
+            top = np.argpartition(scores, -top_k)[-top_k:]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+
+        hits = []
+        for doc_id, score in zip(candidates[order], scores[order]):
+            chunk = lexical_index.document(int(doc_id))
+            hits.append(SearchHit(
+                doc_id=int(doc_id),
+                score=float(score),
+                type=chunk.get("type"),
+                topic=chunk.get("topic"),
+                source=chunk.get("source"),
+                text=chunk.get("text", ""),
+            ))
+        return hits
+
+    def get_stats(self) -> dict:
+        """Возвращает состояние индекса."""
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "model": settings.EMBEDDING_MODEL,
+            "documents": self.size,
+            "lists": len(self._centroids) if self.ready else 0,
+            "nprobe": self.nprobe,
+            "stored_embeddings": len(self.store.rows),
+        }
+
+
+semantic_index = SemanticIndex(
+    kb_path=Path(settings.KNOWLEDGE_BASE_PATH),
+    index_dir=Path(settings.SEMANTIC_INDEX_DIR),
+)
@@ -0,0 +1,168 @@
+"""
+Локальная замена API AnythingLLM для нагрузочных тестов.
+
+Отвечает на `POST /api/v1/workspace/{slug}/chat` и `.../stream-chat`,
+а также на chat API Ollama (`POST /api/chat`, для прямого режима backend)
+с задержкой из заданного распределения и с заданной долей ошибок,
+не требуя Ollama и GPU.
+
+Отдельный запуск:
+    python benchmarks/anythingllm_stub.py --port 3901 --latency lognormal:1.5,0.4 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Callable
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Разбирает описание распределения задержки (в секундах).
+
+    Форматы:
+        fixed:1.0 — постоянная задержка;
+        uniform:0.5,2.0 — равномерно от 0.5 до 2.0;
+        exp:1.0 — экспоненциальное со средним 1.0;
+        lognormal:1.5,0.4 — логнормальное с медианой 1.5 и sigma 0.4.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",")] if args else []
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "exp" and len(values) == 1:
+        return lambda: random.expovariate(1 / values[0])
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+
+@dataclass
+class StubConfig:
+    """Поведение заглушки."""
+    latency: Callable[[], float] = field(default_factory=lambda: parse_latency("fixed:0.5"))
+    error_rate: float = 0.0
+    error_status: int = 500
+    stream_chunks: int = 20
+    response_chars: int = 600
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    """Создает приложение заглушки; счетчики вызовов доступны в `app.state.stats`."""
+    app = FastAPI(title="AnythingLLM stub")
+    app.state.stats = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def _begin() -> bool:
+        stats = app.state.stats
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        failed = random.random() < config.error_rate
+        stats["errors"] += failed
+        return failed
+
+    def _answer(message: str) -> str:
+        text = f"Ответ на: {message} "
+        return (text * (config.response_chars // len(text) + 1))[:config.response_chars]
+
+    @app.post("/api/v1/workspace/{slug}/chat")
+    async def chat(slug: str, request: Request):
+        body = await request.json()
+        failed = _begin()
+        try:
+            await asyncio.sleep(config.latency())
+            if failed:
+                return JSONResponse({"error": "stub failure"}, status_code=config.error_status)
+            return {"textResponse": _answer(body.get("message", "")), "sources": [], "type": "textResponse"}
+        finally:
+            app.state.stats["in_flight"] -= 1
+
+    @app.post("/api/v1/workspace/{slug}/stream-chat")
+    async def stream_chat(slug: str, request: Request):
+        body = await request.json()
+        failed = _begin()
+        if failed:
+            app.state.stats["in_flight"] -= 1
+            return JSONResponse({"error": "stub failure"}, status_code=config.error_status)
+
+        async def events():
+            try:
+                answer = _answer(body.get("message", ""))
+                step = max(1, len(answer) // config.stream_chunks)
+                delay = config.latency() / config.stream_chunks
+                for start in range(0, len(answer), step):
+                    await asyncio.sleep(delay)
+                    chunk = {"type": "textResponseChunk", "textResponse": answer[start:start + step], "close": False}
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                yield f"data: {json.dumps({'type': 'finalizeResponseStream', 'close': True, 'sources': []})}\n\n"
+            finally:
+                app.state.stats["in_flight"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/api/chat")
+    async def ollama_chat(request: Request):
+        # Chat API Ollama для прямого режима backend (GENERATION_MODE=direct)
+        body = await request.json()
+        message = body["messages"][-1]["content"] if body.get("messages") else ""
+        failed = _begin()
+        if failed:
+            app.state.stats["in_flight"] -= 1
+            return JSONResponse({"error": "stub failure"}, status_code=config.error_status)
+        answer = _answer(message)
+        if not body.get("stream", True):
+            try:
+                await asyncio.sleep(config.latency())
+                return {"message": {"role": "assistant", "content": answer}, "done": True}
+            finally:
+                app.state.stats["in_flight"] -= 1
+
+        async def events():
+            try:
+                step = max(1, len(answer) // config.stream_chunks)
+                delay = config.latency() / config.stream_chunks
+                for start in range(0, len(answer), step):
+                    await asyncio.sleep(delay)
+                    chunk = {"message": {"role": "assistant", "content": answer[start:start + step]}, "done": False}
+                    yield json.dumps(chunk, ensure_ascii=False) + "\n"
+                yield json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}) + "\n"
+            finally:
+                app.state.stats["in_flight"] -= 1
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"online": True}
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+def main() -> None:
+    """Точка входа CLI."""
+    parser = argparse.ArgumentParser(description="Заглушка API AnythingLLM")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3901)
+    parser.add_argument("--latency", default="fixed:0.5", help="Распределение задержки, например lognormal:1.5,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов с ошибкой (0..1)")
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+    config = StubConfig(latency=parse_latency(args.latency), error_rate=args.error_rate, error_status=args.error_status)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Нагрузочный тест backend с заглушкой AnythingLLM.
+
+Поднимает заглушку (`anythingllm_stub.py`) и backend (`uvicorn app.main:app`)
+на свободных портах, затем воспроизводит запросы из логов бота
+(`telegram_bot/logs/interactions_*.jsonl[.gz]`) с заданной частотой
+(открытая модель нагрузки: запросы отправляются по расписанию,
+не дожидаясь ответов на предыдущие). Результат — JSON с перцентилями
+задержки, пропускной способностью и долей ошибок, который удобно
+сравнивать между коммитами.
+
+Запуск из корня проекта:
+    python benchmarks/load_test.py --rps 20 --duration 30 --latency lognormal:1.0,0.3 --output bench.json
+
+Сравнение путей генерации (через AnythingLLM и напрямую в Ollama) при той
+же задержке модели — два запуска с разным `--mode`:
+    python benchmarks/load_test.py --mode anythingllm --output bench_anythingllm.json
+    python benchmarks/load_test.py --mode direct --output bench_direct.json
+
+Для уже запущенного backend (заглушка и backend не поднимаются):
+    python benchmarks/load_test.py --backend-url http://localhost:8000 --rps 5
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import uvicorn
+
+from anythingllm_stub import StubConfig, create_app, parse_latency
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_QUERIES = ["Что такое невроз?", "Как справиться с тревогой?", "Техники для снижения стресса"]
+
+
+def load_queries(log_dir: Path) -> list[str]:
+    """Читает тексты запросов из логов взаимодействий бота."""
+    queries = []
+    for path in sorted(log_dir.glob("interactions_*.jsonl*")):
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    query = json.loads(line).get("query")
+                except json.JSONDecodeError:
+                    continue
+                if query:
+                    queries.append(query)
+    return queries
+
+
+def free_port() -> int:
+    """Возвращает свободный TCP-порт на localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], q: float) -> Optional[float]:
+    """Перцентиль по методу ближайшего ранга (значения должны быть отсортированы)."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return round(sorted_values[rank], 2)
+
+
+def latency_summary(values_ms: list[float]) -> dict:
+    """Сводка по задержкам в миллисекундах."""
+    values = sorted(values_ms)
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": round(statistics.fmean(values), 2) if values else None,
+        "max": round(values[-1], 2) if values else None,
+    }
+
+
+def git_revision() -> Optional[str]:
+    """Текущий коммит (для сравнения результатов между коммитами)."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StubServer:
+    """Заглушка AnythingLLM в фоновом потоке."""
+
+    def __init__(self, config: StubConfig, port: int):
+        self.app = create_app(config)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def start_backend(port: int, stub_url: str, index_dir: Path, extra_env: dict) -> subprocess.Popen:
+    """
+    Запускает backend в отдельном процессе, направив его на заглушку.
+
+    Backend работает из каталога `backend`, поэтому путь к базе знаний
+    передается абсолютным: иначе прямой режим генерирует ответы без
+    фрагментов. Индексы строятся во временном каталоге `index_dir`.
+    """
+    env = {
+        **os.environ,
+        "ANYTHINGLLM_API_URL": stub_url,
+        "ANYTHINGLLM_API_KEY": "bench",
+        "ANYTHINGLLM_WORKSPACE_SLUG": "bench",
+        # Заглушка отвечает и за chat API Ollama (прямой режим); прогрев модели не нужен
+        "OLLAMA_BASE_URL": stub_url,
+        "OLLAMA_WARMUP_ENABLED": "false",
+        "KNOWLEDGE_BASE_PATH": str(PROJECT_ROOT / "data" / "knowledge_base.jsonl"),
+        "BM25_INDEX_DIR": str(index_dir / "bm25"),
+        "EMBEDDING_STORE_DIR": str(index_dir / "embeddings"),
+        "SEMANTIC_INDEX_DIR": str(index_dir / "semantic"),
+        **extra_env,
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT / "backend",
+        env=env,
+    )
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> None:
+    """Ждет, пока backend не станет готов принимать запросы."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Backend не ответил за {timeout} с: {url}")
+
+
+async def send_query(client: httpx.AsyncClient, endpoint: str, text: str, user_id: str, mode: Optional[str]) -> dict:
+    """Отправляет один запрос и измеряет задержку (для потока — и время до первого фрагмента)."""
+    payload = {"text": text, "user_id": user_id}
+    if mode:
+        payload["mode"] = mode
+    started = time.perf_counter()
+    result = {"status": None, "error": None, "ttfb_ms": None}
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", "/api/v1/rag/query/stream", json=payload) as response:
+                result["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    if line.startswith("data:"):
+                        if result["ttfb_ms"] is None:
+                            result["ttfb_ms"] = (time.perf_counter() - started) * 1000
+                        if '"type": "error"' in line:
+                            result["error"] = "stream error event"
+        else:
+            response = await client.post("/api/v1/rag/query", json=payload)
+            result["status"] = response.status_code
+        if result["status"] != 200 and result["error"] is None:
+            result["error"] = f"HTTP {result['status']}"
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+    result["latency_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+async def run_load(
+    backend_url: str,
+    queries: list[str],
+    rps: float,
+    duration: float,
+    endpoint: str,
+    users: int,
+    cache_bust: bool,
+    timeout: float,
+    mode: Optional[str] = None,
+) -> dict:
+    """
+    Отправляет запросы по расписанию с частотой `rps` в течение `duration` секунд.
+
+    Интервалы между запросами экспоненциальные (пуассоновский поток),
+    поэтому задержка ответа не снижает фактическую нагрузку.
+    """
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=backend_url, timeout=timeout, limits=limits) as client:
+        tasks = []
+        started = time.perf_counter()
+        next_at = started
+        index = 0
+        while next_at - started < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text = queries[index % len(queries)]
+            if cache_bust:
+                text = f"{text} [{uuid.uuid4().hex[:8]}]"
+            tasks.append(asyncio.create_task(send_query(client, endpoint, text, f"bench-{index % users}", mode)))
+            index += 1
+            next_at += random.expovariate(rps)
+        results = await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r["error"] is None]
+    errors: dict[str, int] = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    report = {
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": round((len(results) - len(ok)) / len(results), 4) if results else 0.0,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "offered_rps": rps,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary([r["latency_ms"] for r in ok]),
+    }
+    if endpoint == "stream":
+        report["ttfb_ms"] = latency_summary([r["ttfb_ms"] for r in ok if r["ttfb_ms"] is not None])
+    return report
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Нагрузочный тест backend с заглушкой AnythingLLM")
+    parser.add_argument("--backend-url", default=None, help="Адрес запущенного backend (по умолчанию поднимается локально)")
+    parser.add_argument("--log-dir", type=Path, default=PROJECT_ROOT / "telegram_bot" / "logs", help="Логи бота с запросами")
+    parser.add_argument("--rps", type=float, default=10.0, help="Целевая частота запросов")
+    parser.add_argument("--duration", type=float, default=30.0, help="Длительность подачи нагрузки, с")
+    parser.add_argument("--endpoint", choices=["query", "stream"], default="query")
+    parser.add_argument("--mode", choices=["anythingllm", "direct"], default=None, help="Путь генерации (по умолчанию — GENERATION_MODE backend)")
+    parser.add_argument("--users", type=int, default=50, help="Число разных user_id в запросах")
+    parser.add_argument("--cache-bust", action="store_true", help="Делать запросы уникальными, чтобы обойти кеш ответов")
+    parser.add_argument("--timeout", type=float, default=130.0, help="Таймаут одного запроса, с")
+    parser.add_argument("--latency", default="lognormal:1.0,0.3", help="Задержка заглушки (fixed:1, uniform:a,b, exp:m, lognormal:med,sigma)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ошибок заглушки (0..1)")
+    parser.add_argument("--backend-env", action="append", default=[], metavar="KEY=VALUE", help="Переменные окружения для backend")
+    parser.add_argument("--output", type=Path, default=None, help="Куда записать JSON-отчет (по умолчанию stdout)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed генератора случайных чисел")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Точка входа CLI."""
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    queries = load_queries(args.log_dir) if args.log_dir.exists() else []
+    if not queries:
+        print(f"В {args.log_dir} нет запросов, используются встроенные примеры", file=sys.stderr)
+        queries = DEFAULT_QUERIES
+
+    stub = backend = index_dir = None
+    backend_url = args.backend_url
+    try:
+        if backend_url is None:
+            stub_config = StubConfig(latency=parse_latency(args.latency), error_rate=args.error_rate)
+            stub = StubServer(stub_config, free_port())
+            stub.start()
+            port = free_port()
+            extra_env = dict(item.split("=", 1) for item in args.backend_env)
+            index_dir = Path(tempfile.mkdtemp(prefix="bench-index-"))
+            backend = start_backend(port, f"http://127.0.0.1:{stub.server.config.port}", index_dir, extra_env)
+            backend_url = f"http://127.0.0.1:{port}"
+            asyncio.run(wait_ready(backend_url + "/health/ready"))
+
+        report = asyncio.run(run_load(
+            backend_url, queries, args.rps, args.duration, args.endpoint, args.users, args.cache_bust, args.timeout, args.mode
+        ))
+    finally:
+        if backend is not None:
+            backend.terminate()
+            backend.wait(timeout=10)
+        if stub is not None:
+            stub.stop()
+        if index_dir is not None:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+    report = {
+        "revision": git_revision(),
+        "config": {
+            "endpoint": args.endpoint,
+            "mode": args.mode,
+            "rps": args.rps,
+            "duration_s": args.duration,
+            "users": args.users,
+            "cache_bust": args.cache_bust,
+            "stub_latency": args.latency if args.backend_url is None else None,
+            "stub_error_rate": args.error_rate if args.backend_url is None else None,
+            "queries": len(queries),
+        },
+        **report,
+    }
+    if stub is not None:
+        report["upstream"] = dict(stub.app.state.stats)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Сборка `knowledge_base.jsonl` из исходных материалов в `data/`.
+
+Каждый источник (.docx, выгрузка Telegram `result.json`, диалоги .json, .txt)
+разбивается на блоки `KnowledgeChunk` в отдельном процессе. Результат по
+источнику кешируется по хешу содержимого, поэтому повторный запуск
+обрабатывает только изменившиеся файлы, а итоговый файл лишь пересобирается
+из готовых частей и атомарно заменяется.
+
+Запуск из корня проекта:
+    python rag_pipeline/build_knowledge_base.py
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from classify import classify_topic, classify_type
+from parsers import SUPPORTED_SUFFIXES, extract_chunks
+
+logger = logging.getLogger(__name__)
+
+# Версия логики разбиения и классификации: при изменении все источники обрабатываются заново
+PIPELINE_VERSION = 1
+
+
+def file_sha256(path: Path) -> str:
+    """Вычисляет SHA-256 содержимого файла, читая его блоками."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def atomic_write_lines(target: Path, parts: list[Path]) -> None:
+    """
+    Склеивает файлы `parts` в `target` через временный файл и os.replace.
+
+    Читатели видят либо старую, либо новую версию файла целиком.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{target.name}.", dir=target.parent)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for part in parts:
+                with open(part, "rb") as f:
+                    while block := f.read(1 << 20):
+                        out.write(block)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_name, target)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def process_source(path: Path, chunks_path: Path, chunk_size: int) -> int:
+    """
+    Разбивает один источник на блоки и записывает их в `chunks_path` (JSONL).
+
+    Выполняется в процессе-воркере.
+
+    Returns:
+        Количество записанных блоков.
+    """
+    count = 0
+    tmp_path = chunks_path.with_name(chunks_path.name + f".{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for text in extract_chunks(path, chunk_size):
+            chunk = {
+                "type": classify_type(text),
+                "topic": classify_topic(text),
+                "source": path.name,
+                "text": text,
+            }
+            out.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            count += 1
+    os.replace(tmp_path, chunks_path)
+    return count
+
+
+def load_manifest(path: Path) -> dict:
+    """Читает манифест предыдущей сборки; при отсутствии возвращает пустой."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"sources": {}}
+
+
+def save_manifest(path: Path, manifest: dict) -> None:
+    """Атомарно сохраняет манифест сборки."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def discover_sources(data_dir: Path, output: Path) -> list[Path]:
+    """Находит поддерживаемые исходные файлы в `data_dir`."""
+    sources = []
+    for path in sorted(data_dir.iterdir()):
+        if not path.is_file() or path.name.startswith((".", "~$")):
+            continue
+        if path.suffix.lower() in SUPPORTED_SUFFIXES and path.resolve() != output.resolve():
+            sources.append(path)
+    return sources
+
+
+def build(data_dir: Path, output: Path, cache_dir: Path, chunk_size: int, workers: Optional[int], force: bool) -> dict:
+    """
+    Инкрементально собирает базу знаний.
+
+    Args:
+        data_dir: Папка с исходными материалами.
+        output: Путь к итоговому `knowledge_base.jsonl`.
+        cache_dir: Папка для манифеста и блоков отдельных источников.
+        chunk_size: Целевой размер блока в символах.
+        workers: Число процессов для разбора источников (None — по числу CPU).
+        force: Обработать все источники заново, игнорируя манифест.
+
+    Returns:
+        Сводка сборки: обработанные и пропущенные источники, число блоков.
+    """
+    chunks_dir = cache_dir / "chunks"
+    chunks_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = cache_dir / "manifest.json"
+    manifest = load_manifest(manifest_path)
+    previous = manifest.get("sources", {})
+    params_key = f"v{PIPELINE_VERSION}-c{chunk_size}"
+
+    sources = discover_sources(data_dir, output)
+    entries: dict[str, dict] = {}
+    pending: list[tuple[Path, Path]] = []
+    for path in sources:
+        digest = file_sha256(path)
+        chunks_path = chunks_dir / f"{digest[:32]}-{params_key}.jsonl"
+        entry = {"sha256": digest, "params": params_key, "chunks_file": chunks_path.name}
+        old = previous.get(path.name)
+        if not force and old and old.get("sha256") == digest and old.get("params") == params_key and chunks_path.exists():
+            entry["chunks"] = old.get("chunks", 0)
+        else:
+            pending.append((path, chunks_path))
+        entries[path.name] = entry
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                path.name: pool.submit(process_source, path, chunks_path, chunk_size)
+                for path, chunks_path in pending
+            }
+            for name, future in futures.items():
+                entries[name]["chunks"] = future.result()
+                logger.info(f"Обработан источник {name}: {entries[name]['chunks']} блоков")
+
+    # Итоговый файл собирается из готовых частей в стабильном порядке источников
+    atomic_write_lines(output, [chunks_dir / entries[path.name]["chunks_file"] for path in sources])
+
+    used = {entry["chunks_file"] for entry in entries.values()}
+    for stale in chunks_dir.glob("*.jsonl"):
+        if stale.name not in used:
+            stale.unlink(missing_ok=True)
+    save_manifest(manifest_path, {"version": PIPELINE_VERSION, "sources": entries})
+
+    return {
+        "processed": [path.name for path, _ in pending],
+        "skipped": [name for name in entries if name not in {path.name for path, _ in pending}],
+        "chunks": sum(entry["chunks"] for entry in entries.values()),
+    }
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Сборка knowledge_base.jsonl из материалов в data/")
+    parser.add_argument("--data-dir", type=Path, default=Path("data"), help="Папка с исходными материалами")
+    parser.add_argument("--output", type=Path, default=Path("data/knowledge_base.jsonl"), help="Итоговый JSONL-файл")
+    parser.add_argument("--cache-dir", type=Path, default=Path("rag_data/pipeline"), help="Папка манифеста и промежуточных блоков")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Целевой размер блока в символах")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию — по числу CPU)")
+    parser.add_argument("--force", action="store_true", help="Пересобрать все источники, игнорируя манифест")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Точка входа CLI."""
+    args = parse_args(argv)
+    if not args.data_dir.is_dir():
+        logger.error(f"Папка с данными не найдена: {args.data_dir}. Запускайте скрипт из корня проекта.")
+        return 1
+
+    started = time.perf_counter()
+    summary = build(args.data_dir, args.output, args.cache_dir, args.chunk_size, args.workers, args.force)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Готово за {elapsed:.2f} с: обработано {len(summary['processed'])}, "
+        f"пропущено без изменений {len(summary['skipped'])}, всего блоков {summary['chunks']} -> {args.output}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format="%(message)s")
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import re
+from typing import Iterable, Iterator
+
+# Граница предложения: знак конца предложения, за которым следует пробел
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _split_long(paragraph: str, chunk_size: int) -> Iterator[str]:
+    """Делит слишком длинный абзац по предложениям, а при необходимости — жестко."""
+    buffer = ""
+    for sentence in _SENTENCE_END_RE.split(paragraph):
+        while len(sentence) > chunk_size:
+            if buffer:
+                yield buffer
+                buffer = ""
+            yield sentence[:chunk_size]
+            sentence = sentence[chunk_size:]
+        if buffer and len(buffer) + 1 + len(sentence) > chunk_size:
+            yield buffer
+            buffer = sentence
+        else:
+            buffer = f"{buffer} {sentence}" if buffer else sentence
+    if buffer:
+        yield buffer
+
+
+def chunk_paragraphs(paragraphs: Iterable[str], chunk_size: int = 1000, min_chunk_size: int = 20) -> Iterator[str]:
+    """
+    Собирает абзацы в смысловые блоки размером около `chunk_size` символов.
+
+    Работает потоково: в памяти держится только текущий блок, поэтому
+    подходит для больших источников вроде выгрузки Telegram-канала.
+
+    Args:
+        paragraphs: Итератор абзацев исходного документа.
+        chunk_size: Целевой максимальный размер блока в символах.
+        min_chunk_size: Блоки короче этого значения отбрасываются.
+
+    Yields:
+        Текст очередного блока.
+    """
+    buffer: list[str] = []
+    size = 0
+    for paragraph in paragraphs:
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = [paragraph] if len(paragraph) <= chunk_size else list(_split_long(paragraph, chunk_size))
+        for piece in pieces:
+            if buffer and size + len(piece) + 1 > chunk_size:
+                text = "\n".join(buffer)
+                if len(text) >= min_chunk_size:
+                    yield text
+                buffer, size = [], 0
+            buffer.append(piece)
+            size += len(piece) + 1
+    if buffer:
+        text = "\n".join(buffer)
+        if len(text) >= min_chunk_size:
+            yield text
@@ -0,0 +1,56 @@
+import re
+from typing import Optional
+
+# Темы и характерные для них основы слов (сопоставляются с началом слова)
+TOPIC_KEYWORDS: dict[str, tuple[str, ...]] = {
+    "тревога": ("тревог", "тревож", "страх", "паник", "беспоко"),
+    "невроз": ("невроз", "невротич", "итн"),
+    "депрессия": ("депресс", "апати", "тоск"),
+    "стресс": ("стресс", "выгоран", "напряжен"),
+    "отношения": ("отношени", "партнер", "партнёр", "брак", "развод"),
+    "самооценка": ("самооценк", "неуверенност"),
+    "прокрастинация": ("прокрастин", "откладыва", "лень"),
+}
+
+THEORY_MARKERS = ("теори", "определени", "концепци", "понятие", "является", "означает", "принцип", "механизм")
+PRACTICE_MARKERS = ("упражнени", "техник", "шаг", "попробуйте", "практик", "клиент", "пациент", "сесси", "рекоменд", "алгоритм")
+
+_WORD_RE = re.compile(r"[а-яёa-z]+")
+
+
+def _count(words: list[str], stems: tuple[str, ...]) -> int:
+    """Считает слова, начинающиеся с одной из основ."""
+    return sum(1 for word in words if word.startswith(stems))
+
+
+def classify_topic(text: str) -> Optional[str]:
+    """
+    Определяет тему блока по ключевым словам.
+
+    Returns:
+        Тема с наибольшим числом совпадений или None, если совпадений нет.
+    """
+    words = _WORD_RE.findall(text.lower())
+    best, best_score = None, 0
+    for topic, stems in TOPIC_KEYWORDS.items():
+        score = _count(words, stems)
+        if score > best_score:
+            best, best_score = topic, score
+    return best
+
+
+def classify_type(text: str) -> str:
+    """
+    Определяет тип блока: `theory`, `practice` или `extra`.
+
+    Короткие реплики считаются `extra`, остальное классифицируется
+    по преобладанию теоретических или практических маркеров.
+    """
+    if len(text) < 200:
+        return "extra"
+    words = _WORD_RE.findall(text.lower())
+    theory = _count(words, THEORY_MARKERS)
+    practice = _count(words, PRACTICE_MARKERS)
+    if theory == 0 and practice == 0:
+        return "extra"
+    return "theory" if theory > practice else "practice"
@@ -0,0 +1,347 @@
+"""
+Экспорт датасета для дообучения модели в chat-формате JSONL.
+
+Источники читаются потоково: логи бота (`interactions_*.jsonl[.gz]`),
+диалоги в формате списка сообщений (`practice_example.json`) и выгрузка
+Telegram (`result.json`, пары «сообщение — ответ на него»). Пары проходят
+фильтры по дате, типу и длине, а почти дубли отбрасываются по MinHash/LSH:
+сигнатуры считаются пачками в пуле процессов, индекс полос занимает
+фиксированный объем памяти. Из нескольких почти одинаковых пар остается
+первая встреченная.
+
+Каждая строка результата:
+    {"messages": [{"role": "user", "content": ...}, {"role": "assistant", "content": ...}]}
+
+Запуск из корня проекта:
+    python rag_pipeline/export_dataset.py telegram_bot/logs data/practice_example.json data/result.json \\
+        --output rag_data/finetune.jsonl --since 2024-01-01 --doc-type practice
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import ijson
+import numpy as np
+
+from minhash import LshIndex, MinHasher
+from parsers import flatten_telegram_text, is_telegram_export
+
+logger = logging.getLogger(__name__)
+
+# Служебные ответы бота (ошибки, перегрузка, ограничение частоты, прерванный ответ) не попадают в датасет
+SERVICE_REPLY_PREFIXES = ("❌", "⏳", "🌐", "🔧", "⏹")
+# Сколько последних сообщений выгрузки Telegram помнится для поиска ответов на них
+REPLY_WINDOW = 10000
+
+
+class Pair(NamedTuple):
+    """Пара «вопрос — ответ» из источника."""
+    prompt: str
+    answer: str
+    day: Optional[date]
+    doc_type: Optional[str]
+
+
+@dataclass
+class Filters:
+    """Условия отбора пар."""
+    since: Optional[date] = None
+    until: Optional[date] = None
+    doc_types: Optional[frozenset[str]] = None
+    min_chars: int = 5
+    max_chars: Optional[int] = None
+
+    def accepts(self, pair: Pair) -> bool:
+        """Проверяет, подходит ли пара под все условия."""
+        if self.since is not None or self.until is not None:
+            if pair.day is None:
+                return False
+            if self.since is not None and pair.day < self.since:
+                return False
+            if self.until is not None and pair.day > self.until:
+                return False
+        if self.doc_types is not None and pair.doc_type not in self.doc_types:
+            return False
+        if len(pair.prompt) < self.min_chars or len(pair.answer) < self.min_chars:
+            return False
+        if self.max_chars is not None and len(pair.prompt) + len(pair.answer) > self.max_chars:
+            return False
+        return True
+
+
+def _day(value: Optional[str]) -> Optional[date]:
+    """Дата из ISO-строки времени (None, если ее нет или она некорректна)."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_log_pairs(path: Path) -> Iterator[Pair]:
+    """Читает пары из лога взаимодействий бота (обычного или сжатого), пропуская служебные ответы."""
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            prompt = (record.get("query") or "").strip()
+            answer = (record.get("response") or "").strip()
+            if answer.startswith(SERVICE_REPLY_PREFIXES):
+                continue
+            yield Pair(prompt, answer, _day(record.get("timestamp")), record.get("doc_type"))
+
+
+def iter_dialogue_pairs(path: Path) -> Iterator[Pair]:
+    """
+    Читает пары из диалога в формате списка сообщений (как `practice_example.json`).
+
+    Первый автор диалога считается пользователем, второй — ассистентом;
+    подряд идущие реплики одного автора склеиваются.
+    """
+    user = None
+    prompt: list[str] = []
+    answer: list[str] = []
+    day = None
+    with open(path, "rb") as f:
+        for message in ijson.items(f, "item"):
+            text = flatten_telegram_text(message.get("text", "")).strip()
+            if not text:
+                continue
+            author = message.get("from")
+            if user is None:
+                user = author
+            if author == user:
+                if answer:
+                    yield Pair("\n".join(prompt), "\n".join(answer), day, None)
+                    prompt, answer = [], []
+                if not prompt:
+                    day = _day(message.get("date"))
+                prompt.append(text)
+            elif prompt:
+                answer.append(text)
+    if prompt and answer:
+        yield Pair("\n".join(prompt), "\n".join(answer), day, None)
+
+
+def iter_telegram_pairs(path: Path) -> Iterator[Pair]:
+    """
+    Читает пары из выгрузки Telegram: сообщение и ответ на него (`reply_to_message_id`).
+
+    Помнятся только последние `REPLY_WINDOW` сообщений, поэтому ответы
+    на более старые сообщения пропускаются, а память не зависит от размера выгрузки.
+    """
+    recent: OrderedDict[int, str] = OrderedDict()
+    with open(path, "rb") as f:
+        for message in ijson.items(f, "messages.item"):
+            if message.get("type") != "message":
+                continue
+            text = flatten_telegram_text(message.get("text", "")).strip()
+            if not text:
+                continue
+            original = recent.get(message.get("reply_to_message_id"))
+            if original is not None:
+                yield Pair(original, text, _day(message.get("date")), None)
+            recent[message.get("id")] = text
+            if len(recent) > REPLY_WINDOW:
+                recent.popitem(last=False)
+
+
+def iter_source_pairs(source: Path) -> Iterator[Pair]:
+    """
+    Выбирает способ чтения по виду источника.
+
+    Папка — логи бота `interactions_*.jsonl[.gz]`; .jsonl[.gz] — один лог;
+    .json — выгрузка Telegram или диалог.
+    """
+    if source.is_dir():
+        for path in sorted(source.glob("interactions_*.jsonl*")):
+            yield from iter_log_pairs(path)
+    elif source.name.endswith((".jsonl", ".jsonl.gz")):
+        yield from iter_log_pairs(source)
+    elif source.suffix == ".json":
+        if is_telegram_export(source):
+            yield from iter_telegram_pairs(source)
+        else:
+            yield from iter_dialogue_pairs(source)
+    else:
+        raise ValueError(f"Неподдерживаемый источник: {source}")
+
+
+def _batched(pairs: Iterable[Pair], size: int) -> Iterator[list[Pair]]:
+    """Делит поток пар на пачки по `size`."""
+    iterator = iter(pairs)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Хешер в процессе-воркере (создается один раз при запуске процесса)
+_hasher: Optional[MinHasher] = None
+
+
+def _init_worker(num_perm: int, bands: int, seed: int) -> None:
+    """Инициализирует хешер в процессе-воркере."""
+    global _hasher
+    _hasher = MinHasher(num_perm=num_perm, bands=bands, seed=seed)
+
+
+def _band_keys(texts: list[str]) -> np.ndarray:
+    """Ключи полос LSH для пачки текстов (выполняется в процессе-воркере)."""
+    keys = np.empty((len(texts), _hasher.bands), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        keys[i] = _hasher.band_keys(text)
+    return keys
+
+
+def chat_record(pair: Pair, system_prompt: Optional[str]) -> dict:
+    """Пара в chat-формате для дообучения."""
+    messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    messages.append({"role": "user", "content": pair.prompt})
+    messages.append({"role": "assistant", "content": pair.answer})
+    return {"messages": messages}
+
+
+def export(
+    sources: list[Path],
+    output: Path,
+    filters: Filters,
+    system_prompt: Optional[str] = None,
+    workers: Optional[int] = None,
+    batch_size: int = 2000,
+    num_perm: int = 128,
+    bands: int = 16,
+    index_memory_mb: float = 128.0,
+) -> Counter:
+    """
+    Экспортирует отобранные пары без почти дублей в `output`.
+
+    В обработке одновременно не больше двух пачек на воркер, поэтому
+    потребление памяти не зависит от объема источников.
+
+    Args:
+        sources: Папки с логами бота и файлы источников.
+        filters: Условия отбора пар.
+        system_prompt: Системное сообщение в начале каждого диалога.
+        workers: Число процессов для расчета сигнатур (None — по числу CPU).
+        batch_size: Пар в одной пачке для воркера.
+        num_perm: Длина MinHash-сигнатуры.
+        bands: Число полос LSH (определяет порог сходства).
+        index_memory_mb: Память под индекс полос.
+
+    Returns:
+        Счетчики: прочитано, отброшено фильтрами, почти дублей, записано.
+    """
+    stats = Counter()
+    workers = workers or os.cpu_count() or 1
+    index = LshIndex(index_memory_mb)
+
+    def selected() -> Iterator[Pair]:
+        for source in sources:
+            for pair in iter_source_pairs(source):
+                stats["read"] += 1
+                if filters.accepts(pair):
+                    yield pair
+                else:
+                    stats["filtered"] += 1
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output.with_name(output.name + f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as out, ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(num_perm, bands, 1)
+        ) as pool:
+            in_flight: deque[tuple[list[Pair], Future]] = deque()
+
+            def write_next() -> None:
+                # Пачки записываются в порядке чтения, поэтому из дублей остается первый
+                batch, future = in_flight.popleft()
+                is_new = index.add_new(future.result())
+                for pair, new in zip(batch, is_new):
+                    if new:
+                        out.write(json.dumps(chat_record(pair, system_prompt), ensure_ascii=False) + "\n")
+                stats["written"] += int(is_new.sum())
+                stats["duplicates"] += len(batch) - int(is_new.sum())
+
+            for batch in _batched(selected(), batch_size):
+                texts = [f"{pair.prompt}\n{pair.answer}" for pair in batch]
+                in_flight.append((batch, pool.submit(_band_keys, texts)))
+                if len(in_flight) >= 2 * workers:
+                    write_next()
+            while in_flight:
+                write_next()
+        os.replace(tmp_path, output)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return stats
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Экспорт датасета для дообучения в chat-формате JSONL")
+    parser.add_argument("sources", type=Path, nargs="+", help="Папки с логами бота и файлы .jsonl[.gz]/.json")
+    parser.add_argument("--output", type=Path, default=Path("rag_data/finetune.jsonl"), help="Итоговый JSONL-файл")
+    parser.add_argument("--since", type=date.fromisoformat, default=None, help="Не раньше даты (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat, default=None, help="Не позже даты (YYYY-MM-DD)")
+    parser.add_argument("--doc-type", action="append", default=None, help="Тип запроса из логов (можно несколько)")
+    parser.add_argument("--min-chars", type=int, default=5, help="Минимальная длина вопроса и ответа")
+    parser.add_argument("--max-chars", type=int, default=None, help="Максимальная длина пары")
+    parser.add_argument("--system-prompt", default=None, help="Системное сообщение для каждого диалога")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию — по числу CPU)")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Пар в пачке для воркера")
+    parser.add_argument("--num-perm", type=int, default=128, help="Длина MinHash-сигнатуры")
+    parser.add_argument("--bands", type=int, default=16, help="Число полос LSH (больше полос — ниже порог сходства)")
+    parser.add_argument("--index-memory-mb", type=float, default=128.0, help="Память под индекс LSH")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Точка входа CLI."""
+    args = parse_args(argv)
+    missing = [str(source) for source in args.sources if not source.exists()]
+    if missing:
+        logger.error(f"Источники не найдены: {', '.join(missing)}")
+        return 1
+
+    filters = Filters(
+        since=args.since,
+        until=args.until,
+        doc_types=frozenset(args.doc_type) if args.doc_type else None,
+        min_chars=args.min_chars,
+        max_chars=args.max_chars,
+    )
+    started = time.perf_counter()
+    stats = export(
+        args.sources, args.output, filters,
+        system_prompt=args.system_prompt,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        num_perm=args.num_perm,
+        bands=args.bands,
+        index_memory_mb=args.index_memory_mb,
+    )
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Готово за {elapsed:.2f} с: прочитано {stats['read']}, отброшено фильтрами {stats['filtered']}, "
+        f"почти дублей {stats['duplicates']}, записано {stats['written']} -> {args.output}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format="%(message)s")
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import re
+import zlib
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[а-яёa-z0-9]+")
+
+_SHIFT = np.uint64(32)
+_LOW_BITS = np.uint64(0xFFFFFFFF)
+
+
+class MinHasher:
+    """
+    MinHash-сигнатуры текстов и ключи полос LSH.
+
+    Текст представляется множеством словесных n-грамм. Сигнатура из
+    `num_perm` значений делится на `bands` полос; тексты с совпадающей
+    хотя бы одной полосой считаются почти дублями. Порог сходства
+    по Жаккару примерно равен `(1 / bands) ** (1 / rows)`, где
+    `rows = num_perm / bands` (для 128 и 16 — около 0.7).
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm должно делиться на bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Перестановки — хеши вида (a * x + b) >> 32 по модулю 2^64 (multiply-shift)
+        self._a = rng.integers(1, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+        self._gram_mult = rng.integers(1, 1 << 63, size=shingle_size, dtype=np.uint64) | np.uint64(1)
+        # Свои множители у каждой полосы, чтобы одинаковые значения в разных полосах давали разные ключи
+        self._band_mult = rng.integers(1, 1 << 63, size=(bands, self.rows), dtype=np.uint64) | np.uint64(1)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """32-битные хеши различных словесных n-грамм текста."""
+        words = _TOKEN_RE.findall(text.lower())
+        if not words:
+            return np.empty(0, dtype=np.uint64)
+        word_hashes = np.fromiter(
+            (zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words)
+        )
+        n = min(self.shingle_size, len(words))
+        count = len(words) - n + 1
+        # Хеш n-граммы — линейная комбинация хешей слов (без склейки строк)
+        grams = np.zeros(count, dtype=np.uint64)
+        for i in range(n):
+            grams += word_hashes[i:i + count] * self._gram_mult[i]
+        return np.unique((grams >> _SHIFT) ^ (grams & _LOW_BITS))
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash-сигнатура текста (`num_perm` значений)."""
+        hashes = self.shingles(text)
+        if not hashes.size:
+            return np.full(self.num_perm, _LOW_BITS, dtype=np.uint64)
+        # Переполнение uint64 здесь ожидаемо: арифметика хешей идет по модулю 2^64
+        return ((np.outer(self._a, hashes) + self._b[:, None]) >> _SHIFT).min(axis=1)
+
+    def band_keys(self, text: str) -> np.ndarray:
+        """64-битные ключи полос сигнатуры (`bands` значений)."""
+        signature = self.signature(text).reshape(self.bands, self.rows)
+        return (signature * self._band_mult).sum(axis=1, dtype=np.uint64)
+
+
+class LshIndex:
+    """
+    Множество ключей полос LSH в фиксированном объеме памяти.
+
+    Ключи хранятся в фильтре Блума, поэтому память не растет с числом
+    записей. Ложные срабатывания отбрасывают уникальную запись как дубль;
+    их доля зависит от заполнения: примерно `(1 - exp(-k * n / m)) ** k`
+    на ключ, где n — число ключей, m — число бит, k — число хешей.
+    """
+
+    def __init__(self, memory_mb: float = 128.0, num_hashes: int = 4):
+        self.size = max(int(memory_mb * 8 * 1024 * 1024), 64)
+        self._size = np.uint64(self.size)
+        self._bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self._steps = np.arange(num_hashes, dtype=np.uint64)
+
+    def _positions(self, keys: np.ndarray) -> np.ndarray:
+        """Номера бит для каждого ключа (двойное хеширование), форма (ключи, хеши)."""
+        h1 = keys % self._size
+        h2 = ((keys >> np.uint64(32)) | np.uint64(1)) % self._size
+        return (h1[:, None] + self._steps * h2[:, None]) % self._size
+
+    def add_new(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Отбирает записи пачки, у которых ни один ключ полосы еще не встречался, и добавляет их ключи.
+
+        Записи проверяются по порядку: запись, совпавшая полосой с более
+        ранней новой записью той же пачки, тоже считается дублем.
+
+        Args:
+            keys: Ключи полос записей, форма (записи, полосы).
+
+        Returns:
+            Маска новых записей.
+        """
+        positions = self._positions(keys.reshape(-1)).reshape(*keys.shape, -1)
+        byte_index = positions >> np.uint64(3)
+        masks = np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8))
+        # Ключ уже есть в индексе, если установлены все его биты
+        seen = ((self._bits[byte_index] & masks) != 0).all(axis=2).any(axis=1)
+
+        is_new = np.zeros(len(keys), dtype=bool)
+        batch_keys: set[int] = set()
+        for i, row in enumerate(keys.tolist()):
+            if seen[i] or not batch_keys.isdisjoint(row):
+                continue
+            batch_keys.update(row)
+            is_new[i] = True
+        np.bitwise_or.at(self._bits, byte_index[is_new].reshape(-1), masks[is_new].reshape(-1))
+        return is_new
@@ -0,0 +1,90 @@
+from pathlib import Path
+from typing import Iterator, Union
+
+import ijson
+from docx import Document
+
+from chunking import chunk_paragraphs
+
+SUPPORTED_SUFFIXES = (".docx", ".json", ".txt")
+
+
+def flatten_telegram_text(text: Union[str, list]) -> str:
+    """Склеивает поле `text` сообщения Telegram (строка или список сущностей)."""
+    if isinstance(text, str):
+        return text
+    parts = []
+    for entity in text:
+        parts.append(entity if isinstance(entity, str) else entity.get("text", ""))
+    return "".join(parts)
+
+
+def iter_docx_paragraphs(path: Path) -> Iterator[str]:
+    """Возвращает абзацы документа .docx."""
+    for paragraph in Document(str(path)).paragraphs:
+        yield paragraph.text
+
+
+def iter_txt_paragraphs(path: Path) -> Iterator[str]:
+    """Построчно читает текстовый файл; пустые строки разделяют абзацы."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield line
+
+
+def is_telegram_export(path: Path) -> bool:
+    """Выгрузка канала Telegram — JSON-объект с полем `messages`."""
+    with open(path, "rb") as f:
+        head = f.read(4096).lstrip()
+    return head.startswith(b"{")
+
+
+def iter_telegram_paragraphs(path: Path) -> Iterator[str]:
+    """
+    Потоково читает выгрузку Telegram-канала (`result.json`).
+
+    Сообщения разбираются по одному через ijson, поэтому файл любого
+    размера не загружается в память целиком. Служебные сообщения пропускаются.
+    """
+    with open(path, "rb") as f:
+        for message in ijson.items(f, "messages.item"):
+            if message.get("type") != "message":
+                continue
+            text = flatten_telegram_text(message.get("text", ""))
+            for paragraph in text.split("\n"):
+                yield paragraph
+
+
+def iter_dialogue_messages(path: Path) -> Iterator[str]:
+    """Читает диалог в формате списка сообщений (как `practice_example.json`)."""
+    with open(path, "rb") as f:
+        for message in ijson.items(f, "item"):
+            text = flatten_telegram_text(message.get("text", "")).strip()
+            if text:
+                yield text
+
+
+def extract_chunks(path: Path, chunk_size: int) -> Iterator[str]:
+    """
+    Извлекает смысловые блоки из источника в зависимости от его формата.
+
+    Args:
+        path: Путь к исходному файлу в `data/`.
+        chunk_size: Целевой размер блока в символах.
+
+    Yields:
+        Текст очередного блока.
+    """
+    suffix = path.suffix.lower()
+    if suffix == ".docx":
+        yield from chunk_paragraphs(iter_docx_paragraphs(path), chunk_size)
+    elif suffix == ".txt":
+        yield from chunk_paragraphs(iter_txt_paragraphs(path), chunk_size)
+    elif suffix == ".json":
+        if is_telegram_export(path):
+            yield from chunk_paragraphs(iter_telegram_paragraphs(path), chunk_size)
+        else:
+            # Реплики диалога сохраняются отдельными блоками
+            yield from iter_dialogue_messages(path)
+    else:
+        raise ValueError(f"Неподдерживаемый формат источника: {path.name}")
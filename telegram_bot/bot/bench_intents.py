@@ -0,0 +1,106 @@
+"""
+Микробенчмарк классификации запросов на запросах из логов бота.
+
+Сравнивает прежнюю проверку списками (`any(word in text.lower() ...)`)
+с `KeywordIntentRouter` и показывает, насколько расходятся их doc_type.
+Для честного сравнения замеряется и проверка списками, дополненная
+определением темы по тем же основам, что у `KeywordIntentRouter`.
+
+Запуск из папки telegram_bot/bot:
+    python bench_intents.py --log-dir logs
+"""
+import argparse
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+from core.intents import DEFAULT_RULES, KeywordIntentRouter, load_rules
+
+THEORY_WORDS = ["теория", "концепция", "что такое", "объясни"]
+PRACTICE_WORDS = ["как", "помоги", "совет", "рекомендация", "техника"]
+
+
+def legacy_doc_type(text: str) -> Optional[str]:
+    """Прежняя классификация из handle_text_message."""
+    if any(word in text.lower() for word in THEORY_WORDS):
+        return "theory"
+    elif any(word in text.lower() for word in PRACTICE_WORDS):
+        return "practice"
+    return None
+
+
+def legacy_with_topic(text: str) -> tuple[Optional[str], Optional[str]]:
+    """Проверка списками, дополненная подсчетом основ тем (тот же объем работы, что у KeywordIntentRouter)."""
+    lowered = text.lower()
+    best, best_score = None, 0
+    for topic, stems in DEFAULT_RULES["topic"].items():
+        score = sum(lowered.count(stem) for stem in stems)
+        if score > best_score:
+            best, best_score = topic, score
+    return legacy_doc_type(text), best
+
+
+def load_queries(log_dir: Path) -> list[str]:
+    """Читает тексты запросов из interactions_*.jsonl и архивов .jsonl.gz."""
+    queries = []
+    for path in sorted(log_dir.glob("interactions_*.jsonl*")):
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    query = json.loads(line).get("query")
+                except json.JSONDecodeError:
+                    continue
+                if query:
+                    queries.append(query)
+    return queries
+
+
+def measure(fn, queries: list[str], repeat: int) -> float:
+    """Возвращает лучшее среднее время одного вызова в микросекундах."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for query in queries:
+            fn(query)
+        best = min(best, time.perf_counter() - started)
+    return best / len(queries) * 1e6
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Точка входа CLI."""
+    parser = argparse.ArgumentParser(description="Бенчмарк классификации запросов")
+    parser.add_argument("--log-dir", type=Path, default=Path("logs"), help="Папка с логами бота")
+    parser.add_argument("--rules", default=None, help="JSON с правилами (по умолчанию встроенные)")
+    parser.add_argument("--repeat", type=int, default=5, help="Число повторов замера")
+    args = parser.parse_args(argv)
+
+    queries = load_queries(args.log_dir)
+    if not queries:
+        print(f"В {args.log_dir} нет запросов для замера")
+        return 1
+
+    rules = load_rules(args.rules) if args.rules else DEFAULT_RULES
+    started = time.perf_counter()
+    router = KeywordIntentRouter(rules)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    legacy_us = measure(legacy_doc_type, queries, args.repeat)
+    legacy_topic_us = measure(legacy_with_topic, queries, args.repeat)
+    router_us = measure(router.classify, queries, args.repeat)
+    changed = sum(1 for query in queries if legacy_doc_type(query) != router.classify(query).doc_type)
+    with_topic = sum(1 for query in queries if router.classify(query).topic)
+
+    print(f"Запросов: {len(queries)}, компиляция правил: {compile_ms:.2f} мс")
+    print(f"Списки any():          {legacy_us:.2f} мкс/запрос (только doc_type)")
+    print(f"Списки any() + темы:   {legacy_topic_us:.2f} мкс/запрос (doc_type и тема)")
+    print(f"KeywordIntentRouter:   {router_us:.2f} мкс/запрос (doc_type и тема)")
+    print(f"doc_type отличается у {changed} запросов ({changed / len(queries):.1%}), тема найдена у {with_topic}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
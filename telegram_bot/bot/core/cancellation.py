@@ -0,0 +1,183 @@
+"""
+Отмена генерации ответа, когда пользователь прислал новое сообщение.
+
+Генерация ответа на сообщение выполняется через `GenerationRegistry.run`.
+Более новое сообщение того же чата отменяет ее: запрос к backend
+прерывается, backend видит отключение клиента и закрывает соединение
+с AnythingLLM или Ollama, и модель не тратит время на ответ, который
+пользователь уже не ждет.
+
+В режиме webhook с несколькими воркерами сообщение может прийти не в тот
+воркер, где идет генерация, поэтому отмена рассылается через Redis pub/sub.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from core.metrics import SUPERSEDED_GENERATIONS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Superseded(Exception):
+    """Генерация отменена: пользователь прислал более новое сообщение."""
+
+
+def is_question(text: Optional[str]) -> bool:
+    """Проверяет, что текст — новый вопрос к модели, а не команда бота."""
+    return bool(text) and not text.startswith("/")
+
+
+def update_question(update: dict) -> Optional[tuple[str, int]]:
+    """
+    Определяет, пришел ли в обновлении Telegram новый вопрос.
+
+    Returns:
+        Ключ чата и номер сообщения или None.
+    """
+    message = update.get("message")
+    if not message or not is_question(message.get("text")):
+        return None
+    return str(message["chat"]["id"]), message["message_id"]
+
+
+class GenerationRegistry:
+    """
+    Текущие генерации ответов по чатам (в памяти процесса).
+
+    Для каждого чата хранится задача генерации и номер сообщения, на которое
+    она отвечает. Отменяется только генерация для более раннего сообщения,
+    поэтому повторная или запоздавшая отмена не затронет ответ на новое.
+    """
+
+    def __init__(self):
+        self._running: dict[str, tuple[int, asyncio.Task]] = {}
+        self._superseded: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        """Запускает фоновые задачи хранилища (в памяти процесса их нет)."""
+
+    async def close(self) -> None:
+        """Останавливает фоновые задачи хранилища."""
+
+    async def run(self, key: str, message_id: int, awaitable: Awaitable[T]) -> T:
+        """
+        Выполняет генерацию ответа на сообщение `message_id` чата `key`.
+
+        Returns:
+            Результат `awaitable`.
+
+        Raises:
+            Superseded: В чат пришло более новое сообщение.
+        """
+        task = asyncio.ensure_future(awaitable)
+        self._running[key] = (message_id, task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task in self._superseded and not asyncio.current_task().cancelling():
+                raise Superseded() from None
+            raise
+        finally:
+            self._superseded.discard(task)
+            if self._running.get(key, (None, None))[1] is task:
+                del self._running[key]
+
+    def _cancel(self, key: str, message_id: int) -> None:
+        """Отменяет генерацию ответа на более раннее сообщение чата, если она идет в этом процессе."""
+        entry = self._running.get(key)
+        if entry is None or entry[0] >= message_id or entry[1].done():
+            return
+        self._superseded.add(entry[1])
+        entry[1].cancel()
+        SUPERSEDED_GENERATIONS.inc()
+
+    async def supersede(self, key: str, message_id: int) -> None:
+        """Отменяет генерацию ответа на сообщения чата `key`, пришедшие раньше `message_id`."""
+        self._cancel(key, message_id)
+
+
+class RedisGenerationRegistry(GenerationRegistry):
+    """
+    Генерации в памяти процесса, отмена — во всех воркерах через Redis pub/sub.
+
+    При ошибке Redis отмена срабатывает только в своем воркере: генерация
+    в другом воркере завершится как обычно.
+    """
+
+    CHANNEL = "mindfix:bot:supersede"
+
+    def __init__(self, redis: Redis, retry_interval: float = 5.0):
+        super().__init__()
+        self.redis = redis
+        self.retry_interval = retry_interval
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self) -> None:
+        """Принимает отмены от других воркеров, переподписываясь после ошибок Redis."""
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        data = json.loads(message["data"])
+                        self._cancel(data["key"], data["message_id"])
+            except (RedisError, OSError) as e:
+                logger.warning(f"Подписка на отмену генераций прервана: {e}")
+                await asyncio.sleep(self.retry_interval)
+
+    async def supersede(self, key: str, message_id: int) -> None:
+        self._cancel(key, message_id)
+        try:
+            await self.redis.publish(self.CHANNEL, json.dumps({"key": key, "message_id": message_id}))
+        except RedisError as e:
+            logger.warning(f"Не удалось разослать отмену генерации для чата {key}: {e}")
+
+
+class SupersedeMiddleware(BaseMiddleware):
+    """
+    Отменяет генерацию ответа при получении нового вопроса в том же чате.
+
+    Регистрируется как outer middleware: срабатывает сразу при получении
+    сообщения, до ограничения частоты и объединения сообщений. В режиме
+    webhook обновления чата обрабатываются по очереди, поэтому там отмена
+    вызывается еще раньше — при постановке обновления в очередь.
+    """
+
+    def __init__(self, registry: GenerationRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Message) and is_question(event.text):
+            await self.registry.supersede(str(event.chat.id), event.message_id)
+        return await handler(event, data)
+
+
+def create_registry(redis: Optional[Redis]) -> GenerationRegistry:
+    """Выбирает реестр генераций: с рассылкой отмен через Redis, если он настроен."""
+    return RedisGenerationRegistry(redis) if redis is not None else GenerationRegistry()
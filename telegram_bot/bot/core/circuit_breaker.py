@@ -0,0 +1,74 @@
+import time
+from enum import Enum
+
+
+class CircuitState(str, Enum):
+    """Состояния автоматического выключателя."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Простой автоматический выключатель (circuit breaker) для вызовов внешнего сервиса.
+
+    После `failure_threshold` неудач подряд переходит в состояние OPEN и в течение
+    `recovery_timeout` секунд сразу отклоняет вызовы. Затем пропускает один пробный
+    вызов (HALF_OPEN): при успехе цепь замыкается, при неудаче снова размыкается.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = CircuitState.CLOSED
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> CircuitState:
+        """Текущее состояние с учетом истечения `recovery_timeout`."""
+        if self._state is CircuitState.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = CircuitState.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Проверяет, можно ли сейчас обращаться к сервису.
+
+        Returns:
+            True, если вызов разрешен. В состоянии HALF_OPEN разрешается
+            только один пробный вызов одновременно.
+        """
+        state = self.state
+        if state is CircuitState.CLOSED:
+            return True
+        if state is CircuitState.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        """
+        Снимает пробный вызов, завершившийся без результата (например, отмененный).
+
+        Без этого цепь осталась бы в HALF_OPEN с занятым пробным вызовом
+        и отклоняла бы все запросы.
+        """
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        """Отмечает успешный вызов и замыкает цепь."""
+        self._failures = 0
+        self._trial_in_flight = False
+        self._state = CircuitState.CLOSED
+
+    def record_failure(self) -> None:
+        """Отмечает неудачный вызов и при необходимости размыкает цепь."""
+        self._failures += 1
+        self._trial_in_flight = False
+        if self._state is CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
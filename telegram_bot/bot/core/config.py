@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -12,8 +14,62 @@ class Settings(BaseSettings):
     # Telegram Bot
     TELEGRAM_BOT_TOKEN: str
 
+    # Режим получения обновлений: polling (один процесс) или webhook
+    # (несколько воркеров за reverse proxy с HTTPS)
+    BOT_MODE: Literal["polling", "webhook"] = "polling"
+    WEBHOOK_BASE_URL: Optional[str] = None # Публичный адрес, например https://bot.example.com
+    WEBHOOK_PATH: str = "/telegram/webhook"
+    WEBHOOK_SECRET: Optional[str] = None # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080 # Общий для всех воркеров (SO_REUSEPORT)
+    WEBHOOK_WORKERS: int = 1
+
+    # Redis: общее FSM-хранилище и очередность сообщений чата между воркерами
+    REDIS_URL: Optional[str] = None # Например redis://redis_cache:6379/1; обязателен при WEBHOOK_WORKERS > 1
+    CHAT_LOCK_TTL: float = 30.0 # Секунды; блокировка чата продлевается, пока идет обработка
+
     # API Backend
-    BACKEND_API_URL: str = "http://backend:8000/api/v1"
+    BACKEND_API_URL: str = "http://backend:8000" # Без префикса /api/v1: пути к API добавляет клиент
+
+    # Устойчивость клиента RAG API
+    RAG_CONNECT_TIMEOUT: float = 5.0
+    RAG_DEADLINE: float = 120.0 # Срок ответа на сообщение с учетом повторов; передается в backend (X-Request-Timeout)
+    RAG_MAX_RETRIES: int = 2
+    RAG_RETRY_BACKOFF_BASE: float = 0.5
+    RAG_RETRY_BACKOFF_MAX: float = 5.0
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_BREAKER_RECOVERY_TIMEOUT: float = 30.0
+
+    # Новое сообщение пользователя отменяет генерацию ответа на предыдущее (в боте, backend и Ollama)
+    SUPERSEDE_ENABLED: bool = True
+
+    # Потоковая выдача ответа
+    RAG_STREAMING_ENABLED: bool = True
+    STREAM_EDIT_INTERVAL: float = 1.5 # Минимальный интервал между edit_text (лимиты Telegram)
+
+    # Ограничение частоты запросов к модели (token bucket, с Redis — общее для воркеров)
+    THROTTLE_ENABLED: bool = True
+    THROTTLE_USER_RATE: float = 0.1 # Запросов в секунду на пользователя (6 в минуту)
+    THROTTLE_USER_BURST: int = 3
+    THROTTLE_GLOBAL_RATE: float = 2.0 # На всех пользователей вместе
+    THROTTLE_GLOBAL_BURST: int = 20
+    THROTTLE_MERGE_MAX: int = 5 # Сколько сообщений, пришедших во время генерации, объединяются в один вопрос
+
+    # Метрики Prometheus (0 — не запускать HTTP-сервер метрик)
+    METRICS_PORT: int = 9101
+
+    # Классификация запросов (doc_type и тема)
+    INTENT_RULES_PATH: Optional[str] = None # JSON с правилами; по умолчанию встроенные правила
+
+    # Логи взаимодействий
+    LOG_DIR: str = "logs"
+    LOG_QUEUE_MAX_SIZE: int = 10000 # Записи сверх лимита отбрасываются, а не блокируют бота
+    LOG_BATCH_SIZE: int = 500
+    LOG_FLUSH_INTERVAL: float = 1.0 # Секунды
+    LOG_FSYNC_POLICY: Literal["none", "batch"] = "batch"
+    LOG_GZIP_PAST_DAYS: bool = True
+    LOG_SHIP_TO_BACKEND: bool = True # Передавать записанные пачки в backend (PostgreSQL)
+    LOG_SHIP_TIMEOUT: float = 5.0
 
 
 # Создаем единственный экземпляр настроек,
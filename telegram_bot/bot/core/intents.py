@@ -0,0 +1,129 @@
+import json
+import logging
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+# Правила по умолчанию. Шаблон — основа слова или фраза: совпадение должно
+# начинаться с начала слова, а окончание может быть любым ("теори" -> теория,
+# теории, теорию). Порядок типов задает приоритет: выигрывает первый
+# совпавший тип, как в прежней цепочке if/elif.
+DEFAULT_RULES: dict = {
+    "doc_type": {
+        "theory": ["теори", "концепц", "что такое", "что значит", "объясн", "определени"],
+        "practice": ["как", "помоги", "помогите", "совет", "рекоменд", "техник", "упражнени", "что делать"],
+    },
+    # Темы и основы — как в rag_pipeline/classify.py; выигрывает тема с наибольшим числом совпадений
+    "topic": {
+        "тревога": ["тревог", "тревож", "страх", "паник", "беспоко"],
+        "невроз": ["невроз", "невротич", "итн"],
+        "депрессия": ["депресс", "апати", "тоск"],
+        "стресс": ["стресс", "выгоран", "напряжен"],
+        "отношения": ["отношени", "партнер", "брак", "развод"],
+        "самооценка": ["самооценк", "неуверенност"],
+        "прокрастинация": ["прокрастин", "откладыва", "лень"],
+    },
+}
+
+
+@dataclass
+class Intent:
+    """Результат классификации запроса."""
+    doc_type: Optional[str] = None
+    topic: Optional[str] = None
+
+
+class IntentEngine(Protocol):
+    """Интерфейс движка классификации намерений."""
+
+    def classify(self, text: str) -> Intent:
+        ...
+
+
+def normalize(text: str) -> str:
+    """Нормализует текст для сопоставления с шаблонами: нижний регистр, "ё" -> "е"."""
+    return text.lower().replace("ё", "е")
+
+
+def _compile_pattern(pattern: str) -> str:
+    """Переводит шаблон в регулярное выражение: слова фразы разделяются любыми не-буквами."""
+    return r"[\W_]+".join(re.escape(word) for word in normalize(pattern).split())
+
+
+class KeywordIntentRouter:
+    """
+    Классификатор doc_type и темы по основам слов и фразам.
+
+    Все шаблоны объединяются в одно регулярное выражение вида
+    `\\b(?:(?P<d0>теори|...)|(?P<t0>тревог|...)|...)`: альтернатива
+    с именованной группой на каждую метку. `finditer` проходит текст один
+    раз, но в каждой позиции начала слова `re` перебирает альтернативы
+    по очереди; это не автомат вроде Aho-Corasick.
+
+    Морфологического анализа нет. Шаблоны — вручную подобранные основы,
+    а окончание после основы может быть любым: "тревог" совпадет с "тревога",
+    но не с "тревожно" — для него в правилах есть отдельная основа "тревож".
+    Перед сопоставлением текст только переводится в нижний регистр
+    с заменой "ё" на "е" (`normalize`).
+    """
+
+    def __init__(self, rules: dict):
+        self.doc_types: list[str] = list(rules.get("doc_type", {}))
+        self.topics: list[str] = list(rules.get("topic", {}))
+        groups = []
+        for prefix, kind, labels in (("d", "doc_type", self.doc_types), ("t", "topic", self.topics)):
+            for index, label in enumerate(labels):
+                patterns = [_compile_pattern(p) for p in rules[kind][label] if p.strip()]
+                if patterns:
+                    # Длинные шаблоны раньше коротких: "что делать" важнее "что"
+                    alternatives = "|".join(sorted(patterns, key=len, reverse=True))
+                    groups.append(f"(?P<{prefix}{index}>{alternatives})")
+        self._regex = re.compile(r"\b(?:" + "|".join(groups) + ")") if groups else None
+
+    def classify(self, text: str) -> Intent:
+        """
+        Определяет тип запроса и тему.
+
+        Returns:
+            Intent с первым по приоритету совпавшим doc_type и темой
+            с наибольшим числом совпадений (None, если совпадений нет).
+        """
+        if self._regex is None:
+            return Intent()
+        best_type: Optional[int] = None
+        topic_scores = [0] * len(self.topics)
+        for match in self._regex.finditer(normalize(text)):
+            group = match.lastgroup
+            index = int(group[1:])
+            if group[0] == "d":
+                if best_type is None or index < best_type:
+                    best_type = index
+            else:
+                topic_scores[index] += 1
+
+        topic = None
+        if topic_scores and max(topic_scores) > 0:
+            topic = self.topics[topic_scores.index(max(topic_scores))]
+        return Intent(
+            doc_type=self.doc_types[best_type] if best_type is not None else None,
+            topic=topic,
+        )
+
+
+def load_rules(path: Optional[str]) -> dict:
+    """
+    Загружает правила из JSON-файла того же формата, что `DEFAULT_RULES`.
+
+    При отсутствии пути или ошибке чтения используются правила по умолчанию.
+    """
+    if not path:
+        return DEFAULT_RULES
+    try:
+        with open(Path(path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Не удалось загрузить правила намерений из {path}: {e}. Используются правила по умолчанию")
+        return DEFAULT_RULES
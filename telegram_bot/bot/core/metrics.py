@@ -0,0 +1,56 @@
+"""
+Метрики бота в формате Prometheus (отдаются на отдельном HTTP-порту).
+
+Этапы обработки сообщения:
+    bot_handler_seconds — обработка сообщения целиком (до отправки ответа);
+    bot_backend_request_seconds — одна попытка запроса к backend;
+    bot_backend_ttfb_seconds — время до первого фрагмента потокового ответа backend.
+"""
+import logging
+
+from prometheus_client import Counter, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время обработки сообщения пользователя",
+    ["mode"], buckets=LATENCY_BUCKETS,
+)
+BACKEND_REQUEST_SECONDS = Histogram(
+    "bot_backend_request_seconds", "Длительность одной попытки запроса к backend",
+    ["endpoint", "status"], buckets=LATENCY_BUCKETS,
+)
+BACKEND_TTFB_SECONDS = Histogram(
+    "bot_backend_ttfb_seconds", "Время до первого фрагмента потокового ответа backend",
+    buckets=LATENCY_BUCKETS,
+)
+BACKEND_RETRIES = Counter(
+    "bot_backend_retries_total", "Повторы запросов к backend после временных ошибок",
+    ["endpoint"],
+)
+CIRCUIT_REJECTED = Counter(
+    "bot_circuit_rejected_total", "Запросы, не отправленные из-за разомкнутого circuit breaker",
+)
+THROTTLED_MESSAGES = Counter(
+    "bot_throttled_messages_total", "Сообщения, отклоненные ограничением частоты запросов",
+    ["reason"],
+)
+SUPERSEDED_GENERATIONS = Counter(
+    "bot_superseded_generations_total", "Генерации ответов, отмененные новым сообщением пользователя",
+)
+MERGED_MESSAGES = Counter(
+    "bot_merged_messages_total", "Сообщения, объединенные с другими в один запрос к backend",
+)
+QUERY_CHARS = Histogram("bot_query_chars", "Длина запроса пользователя в символах", buckets=SIZE_BUCKETS)
+RESPONSE_CHARS = Histogram("bot_response_chars", "Длина ответа пользователю в символах", buckets=SIZE_BUCKETS)
+
+
+def start_metrics_server(port: int) -> None:
+    """Запускает HTTP-сервер `/metrics` в фоновом потоке (port=0 — не запускать)."""
+    if not port:
+        return
+    start_http_server(port)
+    logger.info(f"Метрики Prometheus доступны на порту {port}")
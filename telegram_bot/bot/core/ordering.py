@@ -0,0 +1,188 @@
+"""
+Последовательная обработка обновлений Telegram в пределах одного чата.
+
+В режиме webhook обновления одного пользователя могут прийти в разные
+воркеры (и в разные задачи одного воркера). Очередность сохраняется так:
+обновление кладется в очередь чата, а обрабатывает ее тот, кто первым
+захватил блокировку чата, — строго по одному обновлению в порядке поступления.
+Разные чаты обрабатываются параллельно.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+UpdateProcessor = Callable[[dict], Awaitable[Any]]
+
+# Снятие и продление блокировки только ее владельцем (по токену)
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+_EXTEND_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def chat_key(update: dict) -> Optional[str]:
+    """
+    Определяет чат (или пользователя), к которому относится обновление.
+
+    Returns:
+        Ключ для упорядочивания или None, если обновление не связано с чатом.
+    """
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return str(chat["id"])
+        user = event.get("from") or event.get("user")
+        if user:
+            return f"user:{user['id']}"
+    return None
+
+
+class _BaseSequencer(ABC):
+    """Общая часть: запуск обработки и ожидание незавершенных задач при остановке."""
+
+    def __init__(self, process: UpdateProcessor):
+        self._process = process
+        self._tasks: set[asyncio.Task] = set()
+
+    def _spawn(self, coro: Awaitable) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, update: dict) -> None:
+        """Обрабатывает обновление; ошибка одного обновления не останавливает очередь чата."""
+        try:
+            await self._process(update)
+        except Exception:
+            logger.exception(f"Ошибка при обработке обновления {update.get('update_id')}")
+
+    @abstractmethod
+    async def submit(self, key: Optional[str], update: dict) -> None:
+        """Ставит обновление в очередь чата `key` (None — обработать без очереди)."""
+
+    async def close(self, timeout: float = 30.0) -> None:
+        """Дожидается обработки уже принятых обновлений."""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+
+class LocalChatSequencer(_BaseSequencer):
+    """Очередность в пределах одного процесса (режим webhook с одним воркером)."""
+
+    def __init__(self, process: UpdateProcessor):
+        super().__init__(process)
+        # Последняя задача каждого чата; следующая ждет ее завершения
+        self._tails: dict[str, asyncio.Task] = {}
+
+    async def submit(self, key: Optional[str], update: dict) -> None:
+        if key is None:
+            self._spawn(self._run(update))
+            return
+        task = self._spawn(self._after(self._tails.get(key), update))
+        self._tails[key] = task
+        task.add_done_callback(lambda t: self._tails.pop(key, None) if self._tails.get(key) is t else None)
+
+    async def _after(self, previous: Optional[asyncio.Task], update: dict) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        await self._run(update)
+
+
+class RedisChatSequencer(_BaseSequencer):
+    """
+    Очередность между воркерами: очереди чатов и блокировки хранятся в Redis.
+
+    Блокировка имеет TTL и продлевается, пока воркер обрабатывает очередь;
+    если воркер упал, блокировка истекает, и очередь подхватит
+    следующее обновление этого чата.
+
+    Доставка «хотя бы один раз»: на время обработки обновление переносится
+    (LMOVE) в список обрабатываемых обновлений чата и удаляется из него
+    только после завершения обработчика. Если воркер упал посреди обработки,
+    следующий владелец блокировки вернет обновление в начало очереди
+    и обработает его повторно. Это произойдет при следующем обновлении
+    этого чата, поскольку очередь разбирается только после `submit`.
+    """
+
+    QUEUE_PREFIX = "mindfix:bot:chat_queue:"
+    PROCESSING_PREFIX = "mindfix:bot:chat_processing:"
+    LOCK_PREFIX = "mindfix:bot:chat_lock:"
+
+    def __init__(self, redis: Redis, process: UpdateProcessor, lock_ttl: float = 30.0, queue_ttl: int = 86400):
+        super().__init__(process)
+        self.redis = redis
+        self.lock_ttl_ms = int(lock_ttl * 1000)
+        self.queue_ttl = queue_ttl
+
+    async def submit(self, key: Optional[str], update: dict) -> None:
+        if key is None:
+            self._spawn(self._run(update))
+            return
+        queue_key = self.QUEUE_PREFIX + key
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(queue_key, json.dumps(update, ensure_ascii=False))
+            pipe.expire(queue_key, self.queue_ttl)
+            await pipe.execute()
+        self._spawn(self._drain(key))
+
+    async def _drain(self, key: str) -> None:
+        """Обрабатывает очередь чата, если удалось захватить его блокировку."""
+        try:
+            await self._drain_queue(key)
+        except RedisError as e:
+            logger.error(f"Ошибка Redis при обработке очереди чата {key}: {e}")
+
+    async def _drain_queue(self, key: str) -> None:
+        queue_key = self.QUEUE_PREFIX + key
+        processing_key = self.PROCESSING_PREFIX + key
+        lock_key = self.LOCK_PREFIX + key
+        # Повторная проверка после снятия блокировки: пока мы ее отпускали,
+        # другой воркер мог добавить обновление и не получить блокировку
+        while await self.redis.llen(queue_key):
+            token = uuid.uuid4().hex
+            if not await self.redis.set(lock_key, token, nx=True, px=self.lock_ttl_ms):
+                return  # Очередь обрабатывает другой воркер, он заберет и наше обновление
+            heartbeat = asyncio.create_task(self._keep_lock(lock_key, token))
+            try:
+                # Обновление, которое не успел обработать упавший воркер, идет первым
+                while await self.redis.lmove(processing_key, queue_key, "RIGHT", "LEFT") is not None:
+                    logger.warning(f"Повторная обработка прерванного обновления чата {key}")
+                while (raw := await self.redis.lmove(queue_key, processing_key, "LEFT", "RIGHT")) is not None:
+                    await self.redis.expire(processing_key, self.queue_ttl)
+                    await self._run(json.loads(raw))
+                    await self.redis.lrem(processing_key, 1, raw)
+            finally:
+                heartbeat.cancel()
+                await self.redis.eval(_RELEASE_LOCK, 1, lock_key, token)
+
+    async def _keep_lock(self, lock_key: str, token: str) -> None:
+        """Продлевает блокировку, пока обрабатывается очередь (генерация ответа может быть долгой)."""
+        while True:
+            await asyncio.sleep(self.lock_ttl_ms / 3000)
+            try:
+                extended = await self.redis.eval(_EXTEND_LOCK, 1, lock_key, token, self.lock_ttl_ms)
+            except RedisError as e:
+                logger.error(f"Не удалось продлить блокировку {lock_key}: {e}")
+                continue
+            if not extended:
+                logger.warning(f"Блокировка {lock_key} истекла во время обработки очереди чата")
+                return
@@ -0,0 +1,206 @@
+"""
+Ограничение частоты запросов к модели (token bucket) для каждого пользователя и для бота в целом.
+
+Каждый запрос к модели расходует один токен из корзины; корзина пополняется
+со скоростью `rate` токенов в секунду и вмещает не больше `burst` токенов.
+Счетчики хранятся в памяти процесса или в Redis (общие для всех воркеров webhook).
+"""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Protocol
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message, TelegramObject
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from core.metrics import MERGED_MESSAGES, THROTTLED_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+# Флаг обработчика, запросы которого расходуют токены: @router.message(..., flags={"throttling": "llm"})
+THROTTLING_FLAG = "throttling"
+
+# Атомарное пополнение корзины и списание токена; возвращает время до появления токена (0 — токен списан)
+_TAKE_TOKEN = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call("hmget", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call("hset", KEYS[1], "tokens", tostring(tokens), "ts", tostring(now))
+redis.call("pexpire", KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Параметры корзины: скорость пополнения (токенов в секунду) и емкость."""
+    rate: float
+    burst: int
+
+
+class RateLimiter(Protocol):
+    """Хранилище корзин токенов."""
+
+    async def take(self, key: str, limit: Limit) -> float:
+        """
+        Списывает токен из корзины `key`.
+
+        Returns:
+            0, если токен списан, иначе время в секундах до появления токена.
+        """
+        ...
+
+
+class MemoryRateLimiter:
+    """Корзины в памяти процесса; давно не обновлявшиеся корзины вытесняются (LRU)."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> (токены, время последнего обновления)
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(limit.burst), now))
+        tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / limit.rate
+        self._buckets[key] = (tokens, now)
+        # Вытесненная корзина за время простоя почти наверняка пополнилась бы целиком
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisRateLimiter:
+    """Корзины в Redis; при ошибке Redis запрос пропускается (ограничение не должно ломать бота)."""
+
+    KEY_PREFIX = "mindfix:bot:throttle:"
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+
+    async def take(self, key: str, limit: Limit) -> float:
+        try:
+            wait = await self.redis.eval(
+                _TAKE_TOKEN, 1, self.KEY_PREFIX + key, limit.rate, limit.burst, time.time()
+            )
+        except RedisError as e:
+            logger.warning(f"Ошибка Redis при проверке лимита {key}, запрос пропущен: {e}")
+            return 0.0
+        return float(wait)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничивает запросы к модели от одного пользователя и от всех пользователей вместе.
+
+    Срабатывает только для обработчиков с флагом `throttling`. Сообщения,
+    пришедшие, пока для пользователя генерируется ответ, не порождают
+    отдельных запросов: после ответа они объединяются в один вопрос
+    (не больше `merge_max` сообщений, остальные отклоняются). Запросы сверх
+    лимита отклоняются с вежливым сообщением и до backend не доходят.
+    """
+
+    def __init__(self, limiter: RateLimiter, user_limit: Limit, global_limit: Limit, merge_max: int = 5):
+        self.limiter = limiter
+        self.user_limit = user_limit
+        self.global_limit = global_limit
+        self.merge_max = merge_max
+        # Сообщения пользователей, у которых сейчас генерируется ответ
+        self._pending: dict[int, list[Message]] = {}
+        # До какого момента пользователю не повторяем предупреждение об отказе
+        self._notified_until: dict[int, float] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Message) or event.from_user is None or not get_flag(data, THROTTLING_FLAG):
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            if len(pending) < self.merge_max:
+                pending.append(event)
+                return None
+            THROTTLED_MESSAGES.labels("merge_overflow").inc()
+            await self._notify(event, "⏳ Я еще отвечаю на ваши предыдущие сообщения. Дождитесь ответа, пожалуйста.", 10.0)
+            return None
+
+        # Место занимаем до первого await, чтобы одновременные сообщения попали в очередь на объединение
+        self._pending[user_id] = pending = []
+        result = None
+        try:
+            message: Optional[Message] = event
+            while message is not None and await self._admit(message):
+                result = await handler(message, data)
+                # Сообщения, пришедшие во время генерации, — одним вопросом
+                message = self._merge(pending) if pending else None
+                pending.clear()
+            return result
+        finally:
+            del self._pending[user_id]
+
+    async def _admit(self, message: Message) -> bool:
+        """Списывает токены пользователя и общий; при нехватке отвечает пользователю."""
+        wait = await self.limiter.take(f"user:{message.from_user.id}", self.user_limit)
+        if wait:
+            THROTTLED_MESSAGES.labels("user").inc()
+            await self._notify(
+                message,
+                f"⏳ Слишком много вопросов подряд. Пожалуйста, подождите {max(1, round(wait))} с и спросите снова.",
+                wait,
+            )
+            return False
+        wait = await self.limiter.take("global", self.global_limit)
+        if wait:
+            THROTTLED_MESSAGES.labels("global").inc()
+            await self._notify(message, "⏳ Сейчас ко мне обращается много людей. Пожалуйста, повторите вопрос через минуту.", wait)
+            return False
+        return True
+
+    async def _notify(self, message: Message, text: str, quiet_for: float) -> None:
+        """Отвечает об отказе не чаще раза за `quiet_for` секунд, чтобы не отвечать на каждое сообщение флуда."""
+        now = time.monotonic()
+        user_id = message.from_user.id
+        if self._notified_until.get(user_id, 0.0) > now:
+            return
+        if len(self._notified_until) > 10000:
+            self._notified_until = {uid: until for uid, until in self._notified_until.items() if until > now}
+        self._notified_until[user_id] = now + quiet_for
+        await message.answer(text)
+
+    @staticmethod
+    def _merge(messages: list[Message]) -> Message:
+        """Объединяет тексты сообщений в одно (ответ придет на последнее)."""
+        if len(messages) == 1:
+            return messages[0]
+        MERGED_MESSAGES.inc(len(messages))
+        text = "\n".join(message.text for message in messages if message.text)
+        return messages[-1].model_copy(update={"text": text})
+
+
+def create_limiter(redis: Optional[Redis]) -> RateLimiter:
+    """Выбирает хранилище корзин: Redis, если он настроен, иначе память процесса."""
+    return RedisRateLimiter(redis) if redis is not None else MemoryRateLimiter()
@@ -1,54 +1,370 @@
+import asyncio
+import json
 import logging
+import random
+import time
+import uuid
 import aiohttp
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command, CommandStart
 
 from core.config import settings
+from core.cancellation import GenerationRegistry, Superseded
+from core.circuit_breaker import CircuitBreaker, CircuitState
+from core.intents import IntentEngine, KeywordIntentRouter, load_rules
+from core.metrics import (
+    BACKEND_REQUEST_SECONDS, BACKEND_RETRIES, BACKEND_TTFB_SECONDS, CIRCUIT_REJECTED, HANDLER_SECONDS,
+)
+from core.throttling import THROTTLING_FLAG
 from .logging import session_logger
+from .streaming import StreamingReply
 
 router = Router()
 
 logger = logging.getLogger(__name__)
 
+# Заголовок с идентификатором запроса: backend пишет его в свои логи и передает дальше
+REQUEST_ID_HEADER = "X-Request-ID"
+# Заголовок с оставшимся сроком ответа в секундах: по его истечении backend отменяет генерацию
+DEADLINE_HEADER = "X-Request-Timeout"
+# Запас к сроку запроса: backend должен успеть ответить 504, прежде чем бот оборвет соединение
+DEADLINE_GRACE = 1.0
+
+# Статусы бэкенда, при которых имеет смысл повторить запрос
+TRANSIENT_STATUSES = {502, 503, 504}
+
+DEGRADED_RESPONSE = "🔧 RAG-сервис временно недоступен. Попробуйте позже."
+
+THROTTLED_RESPONSE = "⏳ Вы отправляете сообщения слишком часто. Дождитесь ответа на предыдущий вопрос."
+
+TIMEOUT_RESPONSE = "⏳ Сервис слишком долго отвечает. Попробуйте позже."
+
+SUPERSEDED_RESPONSE = "⏹ Ответ прерван: вы отправили новое сообщение."
+
+def new_request_id() -> str:
+    """Создает идентификатор запроса для сквозного поиска по логам бота и backend."""
+    return uuid.uuid4().hex[:16]
+
+class TransientBackendError(Exception):
+    """Временная ошибка бэкенда, после которой запрос можно повторить."""
+
 class RAGClient:
-    """Клиент для взаимодействия с RAG API."""
+    """
+    Клиент для взаимодействия с RAG API.
+
+    Держит одну `aiohttp.ClientSession` на процесс бота, повторяет временные
+    ошибки с экспоненциальной задержкой и случайным разбросом (jitter),
+    а при серии неудач размыкает circuit breaker и сразу отвечает пользователю
+    деградированным сообщением, не нагружая недоступный бэкенд.
+
+    Все попытки ответа на сообщение укладываются в общий срок (`RAG_DEADLINE`),
+    остаток которого передается в backend заголовком `X-Request-Timeout`.
+    """
     
     def __init__(self, base_url: str):
         self.base_url = base_url.rstrip('/')
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=settings.CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+        )
+
+    async def start(self) -> None:
+        """Открывает общую HTTP-сессию (вызывается при старте диспетчера)."""
+        if self._session is None or self._session.closed:
+            # Общее время запроса задается сроком ответа в каждом запросе (`_attempt_timeout`)
+            timeout = aiohttp.ClientTimeout(connect=settings.RAG_CONNECT_TIMEOUT)
+            self._session = aiohttp.ClientSession(timeout=timeout)
+
+    async def close(self) -> None:
+        """Закрывает HTTP-сессию (вызывается при остановке диспетчера)."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Возвращает задержку перед повтором по схеме "full jitter"."""
+        cap = min(settings.RAG_RETRY_BACKOFF_MAX, settings.RAG_RETRY_BACKOFF_BASE * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    @staticmethod
+    def _can_retry(attempt: int, delay: float, deadline: float) -> bool:
+        """Проверяет, остались ли попытки и успеет ли повтор начаться до истечения срока ответа."""
+        return attempt < settings.RAG_MAX_RETRIES and time.monotonic() + delay < deadline
+
+    @staticmethod
+    def _attempt_headers(request_id: str, deadline: float) -> dict[str, str]:
+        """Заголовки попытки: идентификатор запроса и оставшийся срок ответа."""
+        remaining = max(deadline - time.monotonic(), 0.0)
+        return {REQUEST_ID_HEADER: request_id, DEADLINE_HEADER: f"{remaining:.3f}"}
+
+    @staticmethod
+    def _attempt_timeout(deadline: float) -> aiohttp.ClientTimeout:
+        """Таймаут попытки: оставшийся срок ответа с небольшим запасом."""
+        remaining = max(deadline - time.monotonic(), 0.0)
+        return aiohttp.ClientTimeout(total=remaining + DEADLINE_GRACE, connect=settings.RAG_CONNECT_TIMEOUT)
+
+    async def _post(self, url: str, payload: dict, request_id: str, deadline: float) -> str:
+        """Выполняет один POST-запрос к RAG API."""
+        await self.start()
+        started = time.perf_counter()
+        status = "connection_error"
+        try:
+            async with self._session.post(
+                url,
+                json=payload,
+                headers=self._attempt_headers(request_id, deadline),
+                timeout=self._attempt_timeout(deadline),
+            ) as response:
+                status = str(response.status)
+                return await self._read_response(response)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            raise
+        except asyncio.CancelledError:
+            # Генерацию отменило новое сообщение: соединение закрывается, backend прекращает генерацию
+            status = "cancelled"
+            raise
+        finally:
+            BACKEND_REQUEST_SECONDS.labels("query", status).observe(time.perf_counter() - started)
+
+    async def send_log_batch(self, interactions: list[dict], sessions: list[dict]) -> None:
+        """
+        Отправляет пачку записей логов в backend для записи в PostgreSQL.
+
+        Без повторов: пропущенные записи остаются в файлах логов и догружаются импортом.
+        """
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HTTP-сессия к бэкенду не открыта")
+        async with self._session.post(
+            f"{self.base_url}/api/v1/interactions/batch",
+            json={"interactions": interactions, "sessions": sessions},
+            timeout=aiohttp.ClientTimeout(total=settings.LOG_SHIP_TIMEOUT),
+        ) as response:
+            response.raise_for_status()
+
+    async def reset_context(self, user_id: int) -> None:
+        """
+        Сбрасывает контекст диалога пользователя в backend (новая сессия по /start).
+
+        Ошибка только логируется: без сброса контекст удалится сам через `CONTEXT_TTL`.
+        """
+        await self.start()
+        try:
+            async with self._session.delete(
+                f"{self.base_url}/api/v1/rag/context/{user_id}",
+                timeout=aiohttp.ClientTimeout(total=settings.RAG_CONNECT_TIMEOUT),
+            ) as response:
+                response.raise_for_status()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Не удалось сбросить контекст диалога пользователя {user_id}: {e!r}")
+
+    async def _read_response(self, response: aiohttp.ClientResponse) -> str:
+        """Разбирает ответ `/query` в текст для пользователя."""
+        if response.status == 200:
+            data = await response.json()
+            return data.get("response", "Извините, не удалось получить ответ.")
+        if response.status in TRANSIENT_STATUSES:
+            raise TransientBackendError(f"RAG API вернул статус {response.status}")
+        if response.status == 429:
+            return THROTTLED_RESPONSE
+        logger.error(f"RAG API вернул статус {response.status}")
+        return "❌ Произошла ошибка при обработке вашего запроса."
         
-    async def query(self, text: str, doc_type: Optional[str] = None, topic: Optional[str] = None) -> str:
-        """Отправляет запрос к RAG API и возвращает ответ."""
+    async def query(
+        self,
+        text: str,
+        doc_type: Optional[str] = None,
+        topic: Optional[str] = None,
+        user_id: Optional[int] = None,
+        request_id: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """
+        Отправляет запрос к RAG API и возвращает ответ.
+
+        Args:
+            deadline: Срок ответа по `time.monotonic()` (по умолчанию через `RAG_DEADLINE`).
+        """
+        request_id = request_id or new_request_id()
+        deadline = deadline or time.monotonic() + settings.RAG_DEADLINE
+        if not self.breaker.allow_request():
+            logger.warning(f"[{request_id}] Circuit breaker разомкнут, запрос к RAG API пропущен")
+            CIRCUIT_REJECTED.inc()
+            return DEGRADED_RESPONSE
+        trial = self.breaker.state is CircuitState.HALF_OPEN
+
         url = f"{self.base_url}/api/v1/rag/query"
         
         payload = {
             "text": text,
             "doc_type": doc_type,
-            "topic": topic
+            "topic": topic,
+            "user_id": str(user_id) if user_id is not None else None
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get("response", "Извините, не удалось получить ответ.")
-                    elif response.status == 503:
-                        return "🔧 RAG-сервис временно недоступен. Попробуйте позже."
-                    else:
-                        logger.error(f"RAG API вернул статус {response.status}")
-                        return "❌ Произошла ошибка при обработке вашего запроса."
-        except aiohttp.ClientError as e:
-            logger.error(f"Ошибка соединения с RAG API: {e}")
-            return "🌐 Не удалось связаться с сервисом. Проверьте подключение."
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при обращении к RAG API: {e}")
-            return "❌ Произошла неожиданная ошибка."
+            for attempt in range(settings.RAG_MAX_RETRIES + 1):
+                try:
+                    response = await self._post(url, payload, request_id, deadline)
+                    self.breaker.record_success()
+                    return response
+                except asyncio.TimeoutError:
+                    # Таймаут генерации не повторяем: это лишь удвоит ожидание пользователя
+                    logger.error(f"[{request_id}] Превышено время ожидания ответа от RAG API")
+                    self.breaker.record_failure()
+                    return TIMEOUT_RESPONSE
+                except (TransientBackendError, aiohttp.ClientConnectionError) as e:
+                    logger.warning(f"[{request_id}] Временная ошибка RAG API (попытка {attempt + 1}): {e}")
+                    delay = self._backoff_delay(attempt)
+                    if self._can_retry(attempt, delay, deadline):
+                        BACKEND_RETRIES.labels("query").inc()
+                        await asyncio.sleep(delay)
+                        continue
+                    self.breaker.record_failure()
+                    if time.monotonic() >= deadline:
+                        # 504 от backend: срок ответа истек
+                        return TIMEOUT_RESPONSE
+                    if isinstance(e, TransientBackendError):
+                        return DEGRADED_RESPONSE
+                    return "🌐 Не удалось связаться с сервисом. Проверьте подключение."
+                except aiohttp.ClientError as e:
+                    logger.error(f"[{request_id}] Ошибка соединения с RAG API: {e}")
+                    self.breaker.record_failure()
+                    return "🌐 Не удалось связаться с сервисом. Проверьте подключение."
+                except Exception as e:
+                    logger.error(f"[{request_id}] Неожиданная ошибка при обращении к RAG API: {e}")
+                    self.breaker.record_failure()
+                    return "❌ Произошла неожиданная ошибка."
+            return DEGRADED_RESPONSE
+        finally:
+            # Отмененный пробный вызов не должен оставить цепь в HALF_OPEN навсегда
+            if trial:
+                self.breaker.release_trial()
+
+    async def stream_query(
+        self,
+        text: str,
+        doc_type: Optional[str] = None,
+        topic: Optional[str] = None,
+        user_id: Optional[int] = None,
+        request_id: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Запрашивает потоковый ответ у RAG API и выдает его фрагменты.
+
+        Повторы выполняются только до получения первого фрагмента: после этого
+        пользователь уже видит часть ответа, и повтор привел бы к дублированию.
+        Ошибки выдаются как текстовые фрагменты, чтобы их увидел пользователь.
+        Срок ответа `deadline` (по `time.monotonic()`) ограничивает весь поток.
+        """
+        request_id = request_id or new_request_id()
+        deadline = deadline or time.monotonic() + settings.RAG_DEADLINE
+        if not self.breaker.allow_request():
+            logger.warning(f"[{request_id}] Circuit breaker разомкнут, запрос к RAG API пропущен")
+            CIRCUIT_REJECTED.inc()
+            yield DEGRADED_RESPONSE
+            return
+        trial = self.breaker.state is CircuitState.HALF_OPEN
+
+        url = f"{self.base_url}/api/v1/rag/query/stream"
+        payload = {
+            "text": text,
+            "doc_type": doc_type,
+            "topic": topic,
+            "user_id": str(user_id) if user_id is not None else None
+        }
+        await self.start()
+        received = False
+
+        try:
+            for attempt in range(settings.RAG_MAX_RETRIES + 1):
+                started = time.perf_counter()
+                status = "connection_error"
+                try:
+                    headers = self._attempt_headers(request_id, deadline)
+                    try:
+                        async with self._session.post(
+                            url, json=payload, timeout=self._attempt_timeout(deadline), headers=headers
+                        ) as response:
+                            status = str(response.status)
+                            if response.status in TRANSIENT_STATUSES:
+                                raise TransientBackendError(f"RAG API вернул статус {response.status}")
+                            if response.status == 429:
+                                # Отказ по частоте запросов: backend доступен
+                                self.breaker.record_success()
+                                yield THROTTLED_RESPONSE
+                                return
+                            if response.status != 200:
+                                logger.error(f"[{request_id}] RAG API вернул статус {response.status}")
+                                self.breaker.record_failure()
+                                yield "❌ Произошла ошибка при обработке вашего запроса."
+                                return
+                            async for raw_line in response.content:
+                                line = raw_line.decode("utf-8").strip()
+                                if not line.startswith("data:"):
+                                    continue
+                                event = json.loads(line[len("data:"):])
+                                if event.get("type") == "chunk":
+                                    if not received:
+                                        BACKEND_TTFB_SECONDS.observe(time.perf_counter() - started)
+                                    received = True
+                                    yield event.get("text", "")
+                                elif event.get("type") == "error":
+                                    logger.error(f"[{request_id}] Ошибка генерации в RAG API: {event.get('detail')}")
+                                    self.breaker.record_failure()
+                                    expired = time.monotonic() >= deadline
+                                    yield ("\n\n" if received else "") + (TIMEOUT_RESPONSE if expired else DEGRADED_RESPONSE)
+                                    return
+                                elif event.get("type") == "done":
+                                    break
+                    except asyncio.TimeoutError:
+                        status = "timeout"
+                        raise
+                    except (asyncio.CancelledError, GeneratorExit):
+                        status = "cancelled"
+                        raise
+                    finally:
+                        # Время попытки без паузы перед повтором
+                        BACKEND_REQUEST_SECONDS.labels("stream", status).observe(time.perf_counter() - started)
+                    self.breaker.record_success()
+                    if not received:
+                        yield "Извините, не удалось получить ответ."
+                    return
+                except asyncio.TimeoutError:
+                    logger.error(f"[{request_id}] Превышено время ожидания ответа от RAG API")
+                    self.breaker.record_failure()
+                    yield ("\n\n" if received else "") + TIMEOUT_RESPONSE
+                    return
+                except (TransientBackendError, aiohttp.ClientConnectionError) as e:
+                    logger.warning(f"[{request_id}] Временная ошибка RAG API (попытка {attempt + 1}): {e}")
+                    delay = self._backoff_delay(attempt)
+                    if not received and self._can_retry(attempt, delay, deadline):
+                        BACKEND_RETRIES.labels("stream").inc()
+                        await asyncio.sleep(delay)
+                        continue
+                    self.breaker.record_failure()
+                    expired = time.monotonic() >= deadline
+                    yield ("\n\n" if received else "") + (TIMEOUT_RESPONSE if expired else DEGRADED_RESPONSE)
+                    return
+                except (aiohttp.ClientError, json.JSONDecodeError, UnicodeDecodeError) as e:
+                    logger.error(f"[{request_id}] Ошибка при чтении потока RAG API: {e}")
+                    self.breaker.record_failure()
+                    yield ("\n\n" if received else "") + "🌐 Не удалось связаться с сервисом. Проверьте подключение."
+                    return
+        finally:
+            # Отмененный пробный вызов не должен оставить цепь в HALF_OPEN навсегда
+            if trial:
+                self.breaker.release_trial()
 
 # Создаем экземпляр клиента
 rag_client = RAGClient(settings.BACKEND_API_URL)
+# Классификатор запросов: правила компилируются один раз при импорте
+intent_router: IntentEngine = KeywordIntentRouter(load_rules(settings.INTENT_RULES_PATH))
 
 @router.message(CommandStart())
 async def start_command(message: Message):
@@ -58,7 +374,9 @@ async def start_command(message: Message):
     
     # Логируем начало сессии
     session_logger.log_user_session(user_id, username, "start")
-    
+    # Новая сессия начинается без контекста прошлого разговора
+    await rag_client.reset_context(user_id)
+
     welcome_text = """
 👋 Добро пожаловать в Mind-Fix!
 
@@ -140,28 +458,68 @@ async def practice_command(message: Message):
         "Например: \"Как работать с прокрастинацией?\" или \"Техники для снижения тревоги\""
     )
 
-@router.message(F.text)
-async def handle_text_message(message: Message):
+@router.message(F.text, flags={THROTTLING_FLAG: "llm"})
+async def handle_text_message(message: Message, generations: GenerationRegistry):
     """Обработчик текстовых сообщений."""
+    mode = "stream" if settings.RAG_STREAMING_ENABLED else "plain"
+    with HANDLER_SECONDS.labels(mode).time():
+        await _answer_text_message(message, generations)
+
+async def _answer_text_message(message: Message, generations: GenerationRegistry):
+    """
+    Получает ответ RAG API на текстовое сообщение и отправляет его пользователю.
+
+    Генерация регистрируется в `generations`: новое сообщение пользователя
+    прерывает ее, и ответ на устаревший вопрос не отправляется.
+    """
     user_text = message.text
     user_id = message.from_user.id
     username = message.from_user.username or f"user_{user_id}"
+    # Один идентификатор на сообщение: по нему запрос находится в логах бота и backend
+    request_id = new_request_id()
+    # Срок ответа отсчитывается от получения сообщения и общий для всех попыток
+    deadline = time.monotonic() + settings.RAG_DEADLINE
+    chat_key = str(message.chat.id)
     
     # Показываем, что бот печатает
     await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
     
     # Логируем запрос (без личных данных)
-    logger.info(f"Получен запрос от пользователя {user_id}: {user_text[:50]}...")
+    logger.info(f"[{request_id}] Получен запрос от пользователя {user_id}: {user_text[:50]}...")
     
-    # Определяем тип запроса на основе контекста
-    doc_type = None
-    if any(word in user_text.lower() for word in ["теория", "концепция", "что такое", "объясни"]):
-        doc_type = "theory"
-    elif any(word in user_text.lower() for word in ["как", "помоги", "совет", "рекомендация", "техника"]):
-        doc_type = "practice"
+    # Определяем тип запроса и тему: backend сужает по ним поиск
+    intent = intent_router.classify(user_text)
+    doc_type = intent.doc_type
     
+    if settings.RAG_STREAMING_ENABLED:
+        # Показываем ответ по мере генерации, дописывая одно сообщение
+        reply = StreamingReply(message, edit_interval=settings.STREAM_EDIT_INTERVAL)
+        try:
+            response = await generations.run(chat_key, message.message_id, reply.consume(rag_client.stream_query(
+                user_text, doc_type=doc_type, topic=intent.topic, user_id=user_id, request_id=request_id, deadline=deadline
+            )))
+            logger.info(f"[{request_id}] Отправлен ответ пользователю {user_id}")
+        except Superseded:
+            logger.info(f"[{request_id}] Генерация прервана новым сообщением пользователя {user_id}")
+            response = SUPERSEDED_RESPONSE
+            await reply.interrupt(SUPERSEDED_RESPONSE)
+        except Exception as e:
+            logger.error(f"[{request_id}] Ошибка при отправке ответа: {e}")
+            response = reply.text
+            await message.answer("❌ Произошла ошибка при отправке ответа. Попробуйте еще раз.")
+        session_logger.log_interaction(user_id, username, user_text, response, doc_type)
+        return
+
     # Отправляем запрос к RAG API
-    response = await rag_client.query(user_text, doc_type=doc_type)
+    try:
+        response = await generations.run(chat_key, message.message_id, rag_client.query(
+            user_text, doc_type=doc_type, topic=intent.topic, user_id=user_id, request_id=request_id, deadline=deadline
+        ))
+    except Superseded:
+        # Пользователь уже задал новый вопрос: ответ на этот не отправляем
+        logger.info(f"[{request_id}] Генерация прервана новым сообщением пользователя {user_id}")
+        session_logger.log_interaction(user_id, username, user_text, SUPERSEDED_RESPONSE, doc_type)
+        return
     
     # Логируем взаимодействие
     session_logger.log_interaction(user_id, username, user_text, response, doc_type)
@@ -169,9 +527,9 @@ async def handle_text_message(message: Message):
     # Отправляем ответ пользователю
     try:
         await message.answer(response)
-        logger.info(f"Отправлен ответ пользователю {user_id}")
+        logger.info(f"[{request_id}] Отправлен ответ пользователю {user_id}")
     except Exception as e:
-        logger.error(f"Ошибка при отправке ответа: {e}")
+        logger.error(f"[{request_id}] Ошибка при отправке ответа: {e}")
         await message.answer("❌ Произошла ошибка при отправке ответа. Попробуйте еще раз.")
 
 @router.message()
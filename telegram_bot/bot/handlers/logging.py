@@ -1,22 +1,235 @@
+import asyncio
+import fcntl
+import gzip
 import logging
 import json
-from datetime import datetime
+import os
+import re
+import shutil
+from datetime import date, datetime
 from pathlib import Path
-from typing import Optional
+from typing import IO, Awaitable, Callable, Optional
+
+from core.config import settings
+from core.metrics import QUERY_CHARS, RESPONSE_CHARS
 
 logger = logging.getLogger(__name__)
 
+# Имена дневных файлов логов: interactions_YYYY-MM-DD.jsonl, sessions_YYYY-MM-DD.jsonl
+_DAILY_LOG_RE = re.compile(r"^(?:interactions|sessions)_(\d{4}-\d{2}-\d{2})\.jsonl$")
+
+# Получатель записанных пачек: (взаимодействия, сессии)
+LogSink = Callable[[list[dict], list[dict]], Awaitable[None]]
+
 class UserSessionLogger:
-    """Класс для логирования пользовательских сессий."""
-    
-    def __init__(self, log_dir: str = "logs"):
+    """
+    Класс для логирования пользовательских сессий.
+
+    Записи кладутся в ограниченную очередь в памяти и пишутся на диск фоновой
+    задачей пачками, не блокируя event loop. Файлы текущего дня остаются
+    открытыми между пачками, а файлы прошедших дней сжимаются в `.jsonl.gz`.
+    До вызова `start` (например, в скриптах) записи пишутся синхронно.
+
+    Если задан `sink`, каждая записанная пачка передается и ему (например,
+    в backend для записи в PostgreSQL). Ошибка получателя не влияет на файлы:
+    они остаются источником для повторного импорта.
+    """
+
+    def __init__(
+        self,
+        log_dir: str = "logs",
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        fsync_policy: str = "batch",
+        gzip_past_days: bool = True,
+    ):
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
-        
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.gzip_past_days = gzip_past_days
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._handles: dict[Path, IO[str]] = {}
+        self._current_day: Optional[str] = None
+        self.sink: Optional[LogSink] = None
+
+    async def start(self) -> None:
+        """Запускает фоновую запись (вызывается при старте диспетчера)."""
+        if self._writer_task is not None:
+            return
+        if self.gzip_past_days:
+            await asyncio.to_thread(self._rotate_past_days, date.today().isoformat())
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._writer_task = asyncio.create_task(self._run_writer())
+
+    async def stop(self) -> None:
+        """Дописывает все накопленные записи и закрывает файлы (при остановке диспетчера)."""
+        if self._writer_task is None:
+            return
+        # Сигнал остановки ставим в очередь, чтобы он обработался после всех записей
+        await self._queue.put(None)
+        await self._writer_task
+        self._writer_task = None
+        self._queue = None
+        await asyncio.to_thread(self._close_handles)
+        if self.dropped:
+            logger.warning(f"Отброшено записей лога из-за переполнения очереди: {self.dropped}")
+
+    def _enqueue(self, kind: str, record: dict) -> None:
+        """Ставит запись в очередь или пишет ее сразу, если фоновая запись не запущена."""
+        item = (f"{kind}_{record['timestamp'][:10]}.jsonl", record)
+        if self._queue is None:
+            self._write_batch([item])
+            return
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.error(f"Очередь логов переполнена, записи отбрасываются (всего {self.dropped})")
+
+    async def _run_writer(self) -> None:
+        """Фоновая задача: собирает записи в пачки и передает их на запись в поток."""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"Ошибка при записи пачки логов: {e}")
+            if self.sink is not None:
+                await self._send_to_sink(batch)
+
+    async def _send_to_sink(self, batch: list[tuple[str, dict]]) -> None:
+        """Передает пачку получателю, разделив записи по видам."""
+        interactions = [record for file_name, record in batch if file_name.startswith("interactions_")]
+        sessions = [record for file_name, record in batch if file_name.startswith("sessions_")]
+        try:
+            await self.sink(interactions, sessions)
+        except Exception as e:
+            logger.warning(f"Не удалось передать пачку логов ({len(batch)} записей): {e}")
+
+    def _write_batch(self, batch: list[tuple[str, dict]]) -> None:
+        """Записывает пачку записей, группируя их по файлам (выполняется в потоке)."""
+        lines: dict[str, list[str]] = {}
+        for file_name, record in batch:
+            lines.setdefault(file_name, []).append(json.dumps(record, ensure_ascii=False) + '\n')
+
+        today = date.today().isoformat()
+        if self._current_day != today:
+            self._switch_day(today)
+
+        for file_name, file_lines in lines.items():
+            path = self.log_dir / file_name
+            try:
+                handle = self._locked_handle(path)
+                try:
+                    # Одна запись на файл: в режиме webhook в те же файлы дописывают
+                    # другие воркеры, и строки разных процессов не должны перемешиваться
+                    handle.write(''.join(file_lines))
+                    handle.flush()
+                    if self.fsync_policy == "batch":
+                        os.fsync(handle.fileno())
+                finally:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            except Exception as e:
+                logger.error(f"Ошибка при записи лога {file_name}: {e}")
+        if self._queue is None:
+            # Синхронный режим: файлы не держим открытыми
+            self._close_handles()
+
+    def _locked_handle(self, path: Path) -> IO[str]:
+        """
+        Возвращает открытый файл лога под разделяемой блокировкой.
+
+        Файл прошедшего дня сжимается под исключительной блокировкой
+        (`_rotate_past_days`), поэтому строки не дописываются в него между
+        копированием и удалением. Если файл уже сжат и удален, открывается
+        новый: его сожмет следующая ротация.
+        """
+        while True:
+            handle = self._handles.get(path)
+            if handle is None:
+                handle = self._handles[path] = open(path, 'a', encoding='utf-8')
+            fcntl.flock(handle.fileno(), fcntl.LOCK_SH)
+            if os.fstat(handle.fileno()).st_nlink > 0:
+                return handle
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            handle.close()
+            del self._handles[path]
+
+    def _switch_day(self, today: str) -> None:
+        """Закрывает файлы прошедшего дня и сжимает их."""
+        self._close_handles()
+        self._current_day = today
+        if self.gzip_past_days and self._queue is not None:
+            self._rotate_past_days(today)
+
+    def _close_handles(self) -> None:
+        """Закрывает все открытые файлы логов."""
+        for handle in self._handles.values():
+            try:
+                handle.close()
+            except OSError as e:
+                logger.error(f"Ошибка при закрытии файла лога: {e}")
+        self._handles.clear()
+
+    def _rotate_past_days(self, today: str) -> None:
+        """
+        Сжимает дневные файлы логов за прошедшие дни в `.jsonl.gz`.
+
+        Другие воркеры могут еще дописывать в файл вчерашние записи из своих
+        очередей, поэтому файл сжимается и удаляется под исключительной
+        блокировкой, которую пишущие ждут (см. `_locked_handle`).
+        """
+        for path in self.log_dir.glob("*.jsonl"):
+            match = _DAILY_LOG_RE.match(path.name)
+            if not match or match.group(1) >= today:
+                continue
+            gz_path = path.with_name(path.name + ".gz")
+            tmp_path = path.with_name(path.name + ".gz.tmp")
+            try:
+                # Если архив за этот день уже есть (запись пришла после полуночи),
+                # дописываем новый gzip-член, не теряя прежнее содержимое
+                with open(path, 'rb') as src:
+                    fcntl.flock(src.fileno(), fcntl.LOCK_EX)
+                    mode = 'wb'
+                    if gz_path.exists():
+                        shutil.copyfile(gz_path, tmp_path)
+                        mode = 'ab'
+                    with gzip.open(tmp_path, mode) as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.replace(tmp_path, gz_path)
+                    path.unlink()
+            except OSError as e:
+                logger.error(f"Ошибка при сжатии лога {path.name}: {e}")
+
     def log_interaction(self, user_id: int, username: str, query: str, response: str, doc_type: Optional[str] = None):
         """Логирует взаимодействие пользователя с ботом."""
         timestamp = datetime.now().isoformat()
-        
+
         interaction_data = {
             "timestamp": timestamp,
             "user_id": user_id,
@@ -27,34 +240,32 @@ class UserSessionLogger:
             "query_length": len(query),
             "response_length": len(response)
         }
-        
+
+        QUERY_CHARS.observe(interaction_data["query_length"])
+        RESPONSE_CHARS.observe(interaction_data["response_length"])
+
         # Логируем в файл по дням
-        log_file = self.log_dir / f"interactions_{datetime.now().strftime('%Y-%m-%d')}.jsonl"
-        
-        try:
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(interaction_data, ensure_ascii=False) + '\n')
-        except Exception as e:
-            logger.error(f"Ошибка при записи лога взаимодействия: {e}")
-    
+        self._enqueue("interactions", interaction_data)
+
     def log_user_session(self, user_id: int, username: str, action: str):
         """Логирует начало/конец пользовательской сессии."""
         timestamp = datetime.now().isoformat()
-        
+
         session_data = {
             "timestamp": timestamp,
             "user_id": user_id,
             "username": username,
             "action": action  # "start", "end", "command"
         }
-        
-        log_file = self.log_dir / f"sessions_{datetime.now().strftime('%Y-%m-%d')}.jsonl"
-        
-        try:
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(session_data, ensure_ascii=False) + '\n')
-        except Exception as e:
-            logger.error(f"Ошибка при записи лога сессии: {e}")
+
+        self._enqueue("sessions", session_data)
 
 # Глобальный экземпляр логгера
-session_logger = UserSessionLogger() 
\ No newline at end of file
+session_logger = UserSessionLogger(
+    log_dir=settings.LOG_DIR,
+    queue_size=settings.LOG_QUEUE_MAX_SIZE,
+    batch_size=settings.LOG_BATCH_SIZE,
+    flush_interval=settings.LOG_FLUSH_INTERVAL,
+    fsync_policy=settings.LOG_FSYNC_POLICY,
+    gzip_past_days=settings.LOG_GZIP_PAST_DAYS,
+)
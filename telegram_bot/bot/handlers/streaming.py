@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class StreamingReply:
+    """
+    Постепенно отображает ответ в Telegram по мере его генерации.
+
+    Первый фрагмент отправляется новым сообщением, последующие дописываются
+    через `edit_text` не чаще, чем раз в `edit_interval` секунд. Если текст
+    превышает лимит Telegram, сообщение фиксируется и продолжение идет в новом.
+    Текст отправляется без parse_mode: незавершенный фрагмент может содержать
+    обрезанную HTML-разметку.
+    """
+
+    def __init__(self, message: Message, edit_interval: float):
+        self.message = message
+        self.edit_interval = edit_interval
+        self.text = ""
+        self._reply: Optional[Message] = None
+        self._reply_offset = 0 # Позиция в `text`, с которой начинается текущее сообщение
+        self._shown = ""
+        self._next_edit_at = 0.0
+
+    async def _send_new(self, text: str) -> None:
+        """Отправляет новое сообщение, в которое будет дописываться ответ."""
+        self._reply = await self.message.answer(text, parse_mode=None)
+        self._shown = text
+
+    async def _edit(self, text: str, wait_on_retry: bool = False) -> None:
+        """
+        Обновляет текущее сообщение, соблюдая ограничения Telegram на частоту правок.
+
+        Args:
+            text: Новый текст сообщения.
+            wait_on_retry: Дождаться снятия ограничения и повторить правку
+                (используется для финального и переполненного сообщения).
+        """
+        if self._reply is None:
+            await self._send_new(text)
+            return
+        if text == self._shown:
+            return
+        try:
+            await self._reply.edit_text(text, parse_mode=None)
+            self._shown = text
+        except TelegramRetryAfter as e:
+            if wait_on_retry:
+                await asyncio.sleep(e.retry_after)
+                await self._edit(text, wait_on_retry=True)
+                return
+            self._next_edit_at = asyncio.get_running_loop().time() + e.retry_after
+        except TelegramBadRequest as e:
+            # "message is not modified" и подобные ошибки не критичны для стрима
+            logger.debug(f"Не удалось обновить сообщение: {e}")
+
+    async def _flush(self, force: bool = False) -> None:
+        """Выводит накопленный текст, если пришло время очередной правки."""
+        loop = asyncio.get_running_loop()
+        # Переполнение: фиксируем текущее сообщение и переходим к новому
+        while len(self.text) - self._reply_offset > TELEGRAM_MESSAGE_LIMIT:
+            end = self._reply_offset + TELEGRAM_MESSAGE_LIMIT
+            await self._edit(self.text[self._reply_offset:end], wait_on_retry=True)
+            self._reply = None
+            self._reply_offset = end
+            self._next_edit_at = 0.0
+
+        now = loop.time()
+        if not force and now < self._next_edit_at:
+            return
+        current = self.text[self._reply_offset:]
+        if current.strip():
+            await self._edit(current, wait_on_retry=force)
+            # Не сокращаем паузу, если Telegram попросил подождать (RetryAfter)
+            self._next_edit_at = max(self._next_edit_at, now + self.edit_interval)
+
+    async def consume(self, chunks: AsyncIterator[str]) -> str:
+        """
+        Читает фрагменты ответа и отображает их пользователю.
+
+        Args:
+            chunks: Асинхронный итератор текстовых фрагментов ответа.
+
+        Returns:
+            Полный текст ответа.
+        """
+        async for chunk in chunks:
+            self.text += chunk
+            await self._flush()
+        await self._flush(force=True)
+        return self.text
+
+    async def interrupt(self, note: str) -> None:
+        """
+        Дописывает к показанной части ответа пометку о том, что генерация прервана.
+
+        Если пользователь еще ничего не увидел, сообщение не отправляется.
+        """
+        if not self.text.strip():
+            return
+        self.text += f"\n\n{note}"
+        await self._flush(force=True)
@@ -1,38 +1,264 @@
 import asyncio
 import logging
+import multiprocessing
+import signal
 import sys
+from multiprocessing.connection import wait
+from typing import Optional
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 
+from core.cancellation import SupersedeMiddleware, create_registry, update_question
 from core.config import settings
+from core.metrics import start_metrics_server
+from core.ordering import LocalChatSequencer, RedisChatSequencer, chat_key
+from core.throttling import Limit, ThrottlingMiddleware, create_limiter
 from handlers import chat
+from handlers.logging import session_logger
 
-async def main() -> None:
-    """
-    Основная функция для запуска Telegram-бота.
-    """
-    if not settings.TELEGRAM_BOT_TOKEN:
-        logging.critical("ОШИБКА: Не задана переменная окружения TELEGRAM_BOT_TOKEN!")
-        sys.exit(1)
+# Заголовок с секретом, который Telegram передает в каждом запросе webhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
 
+
+def create_bot() -> Bot:
+    """Создает экземпляр бота с настройками по умолчанию."""
     # Задаем свойства по умолчанию для бота, включая parse_mode
     default_properties = DefaultBotProperties(parse_mode=ParseMode.HTML)
-    
-    # Используем токен из настроек и передаем свойства
-    bot = Bot(token=settings.TELEGRAM_BOT_TOKEN, default=default_properties)
-    dp = Dispatcher()
+    return Bot(token=settings.TELEGRAM_BOT_TOKEN, default=default_properties)
+
+
+def create_dispatcher(redis: Optional[Redis] = None) -> Dispatcher:
+    """
+    Создает диспетчер с роутерами и общими ресурсами процесса.
+
+    Args:
+        redis: Клиент Redis для состояний FSM, лимитов запросов и рассылки
+            отмен генерации; без него они хранятся в памяти процесса.
+    """
+    dp = Dispatcher(storage=RedisStorage(redis) if redis is not None else MemoryStorage())
+
+    # Текущие генерации ответов по чатам (передаются в обработчики как `generations`)
+    generations = create_registry(redis)
+    dp["generations"] = generations
+    dp.startup.register(generations.start)
+    dp.shutdown.register(generations.close)
+    # Новый вопрос отменяет генерацию ответа на предыдущий еще до проверки лимитов
+    if settings.SUPERSEDE_ENABLED:
+        dp.message.outer_middleware(SupersedeMiddleware(generations))
+
+    # Лимиты запросов к модели проверяются до обработчика, запросы сверх лимита до backend не доходят
+    if settings.THROTTLE_ENABLED:
+        dp.message.middleware(ThrottlingMiddleware(
+            create_limiter(redis),
+            user_limit=Limit(settings.THROTTLE_USER_RATE, settings.THROTTLE_USER_BURST),
+            global_limit=Limit(settings.THROTTLE_GLOBAL_RATE, settings.THROTTLE_GLOBAL_BURST),
+            merge_max=settings.THROTTLE_MERGE_MAX,
+        ))
 
     # Подключаем роутеры
     dp.include_router(chat.router)
-    
+
+    # Фоновая запись логов взаимодействий; при остановке очередь дописывается на диск.
+    # Регистрируется раньше HTTP-сессии, чтобы последние пачки успели уйти в backend
+    if settings.LOG_SHIP_TO_BACKEND:
+        session_logger.sink = chat.rag_client.send_log_batch
+    dp.startup.register(session_logger.start)
+    dp.shutdown.register(session_logger.stop)
+
+    # Одна HTTP-сессия к бэкенду на весь процесс бота
+    dp.startup.register(chat.rag_client.start)
+    dp.shutdown.register(chat.rag_client.close)
+    return dp
+
+
+def webhook_url() -> str:
+    """Полный адрес webhook, который регистрируется в Telegram."""
+    return settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH
+
+
+async def run_polling() -> None:
+    """Получает обновления long polling'ом в одном процессе."""
+    bot = create_bot()
+    redis = Redis.from_url(settings.REDIS_URL) if settings.REDIS_URL else None
+    dp = create_dispatcher(redis)
+
+    # Метрики Prometheus на отдельном порту (в фоновом потоке)
+    start_metrics_server(settings.METRICS_PORT)
+
     logging.info("Telegram-бот запущен и готов к работе.")
-    await dp.start_polling(bot)
+    try:
+        # Webhook и polling взаимоисключающие: снимаем webhook, если он остался
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
+    finally:
+        if redis is not None:
+            await redis.aclose()
+
+
+def create_webhook_app() -> web.Application:
+    """
+    Создает aiohttp-приложение, принимающее обновления от Telegram.
+
+    Запрос подтверждается сразу после постановки обновления в очередь его чата,
+    а обработка (включая генерацию ответа) идет в фоне. С Redis очереди чатов,
+    блокировки и состояния FSM общие для всех воркеров, поэтому сообщения
+    одного пользователя обрабатываются по порядку, в каком бы воркере они ни оказались.
+    """
+    bot = create_bot()
+    redis = Redis.from_url(settings.REDIS_URL) if settings.REDIS_URL else None
+    dp = create_dispatcher(redis)
+
+    async def process(update: dict) -> None:
+        await dp.feed_raw_update(bot, update)
+
+    if redis is not None:
+        sequencer = RedisChatSequencer(redis, process, lock_ttl=settings.CHAT_LOCK_TTL)
+    else:
+        sequencer = LocalChatSequencer(process)
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if settings.WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != settings.WEBHOOK_SECRET:
+            return web.Response(status=401)
+        update = await request.json()
+        question = update_question(update)
+        try:
+            # Обновления чата обрабатываются по очереди, поэтому генерацию ответа
+            # на предыдущий вопрос отменяем сразу, а не когда дойдет очередь нового
+            if settings.SUPERSEDE_ENABLED and question is not None:
+                await dp["generations"].supersede(*question)
+            await sequencer.submit(chat_key(update), update)
+        except RedisError as e:
+            # Telegram повторит доставку, если не получит ответ 2xx
+            logging.error(f"Не удалось поставить обновление {update.get('update_id')} в очередь: {e}")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def on_shutdown(app: web.Application) -> None:
+        # До остановки диспетчера: принятые обновления должны успеть обработаться
+        await sequencer.close()
+
+    async def on_cleanup(app: web.Application) -> None:
+        await bot.session.close()
+        if redis is not None:
+            await redis.aclose()
+
+    app = web.Application()
+    app.router.add_post(settings.WEBHOOK_PATH, handle_update)
+    app.on_shutdown.append(on_shutdown)
+    setup_application(app, dp, bot=bot)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def run_webhook_worker(worker: int) -> None:
+    """Запускает один воркер webhook (отдельный процесс со своим event loop)."""
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format=f"[worker {worker}] %(levelname)s:%(name)s:%(message)s")
+    if worker:
+        # Архивы логов за прошедшие дни создает только первый воркер,
+        # иначе воркеры сжимали бы одни и те же файлы одновременно
+        session_logger.gzip_past_days = False
+    if settings.METRICS_PORT:
+        start_metrics_server(settings.METRICS_PORT + worker)
+    logging.info(f"Воркер webhook слушает {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}")
+    # reuse_port: все воркеры слушают один порт, ядро распределяет соединения между ними
+    web.run_app(
+        create_webhook_app(),
+        host=settings.WEBHOOK_HOST,
+        port=settings.WEBHOOK_PORT,
+        reuse_port=settings.WEBHOOK_WORKERS > 1,
+        print=None,
+    )
+
+
+async def register_webhook() -> None:
+    """Регистрирует адрес webhook в Telegram (один раз, до запуска воркеров)."""
+    bot = create_bot()
+    try:
+        await bot.set_webhook(
+            url=webhook_url(),
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=chat.router.resolve_used_update_types(),
+        )
+        logging.info(f"Webhook зарегистрирован: {webhook_url()}")
+    finally:
+        await bot.session.close()
+
+
+def run_webhook() -> None:
+    """
+    Запускает режим webhook: `WEBHOOK_WORKERS` процессов на одном порту.
+
+    Упавший воркер перезапускается; SIGTERM/SIGINT передаются воркерам,
+    чтобы те дообработали принятые обновления.
+    """
+    if not settings.WEBHOOK_BASE_URL:
+        logging.critical("ОШИБКА: для BOT_MODE=webhook нужно задать WEBHOOK_BASE_URL!")
+        sys.exit(1)
+    if settings.WEBHOOK_WORKERS > 1 and not settings.REDIS_URL:
+        logging.critical("ОШИБКА: для нескольких воркеров webhook нужен REDIS_URL (общие очереди чатов и FSM)!")
+        sys.exit(1)
+
+    asyncio.run(register_webhook())
+    if settings.WEBHOOK_WORKERS == 1:
+        run_webhook_worker(0)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers: dict[int, multiprocessing.Process] = {}
+    stopping = False
+
+    def start_worker(index: int) -> None:
+        process = context.Process(target=run_webhook_worker, args=(index,), name=f"bot-worker-{index}")
+        process.start()
+        workers[index] = process
+
+    def stop_workers(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    for index in range(settings.WEBHOOK_WORKERS):
+        start_worker(index)
+
+    while workers:
+        wait([process.sentinel for process in workers.values()])
+        for index, process in list(workers.items()):
+            if process.is_alive():
+                continue
+            del workers[index]
+            if not stopping:
+                logging.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапускаем")
+                start_worker(index)
+
+
+def main() -> None:
+    """
+    Основная функция для запуска Telegram-бота.
+    """
+    if not settings.TELEGRAM_BOT_TOKEN:
+        logging.critical("ОШИБКА: Не задана переменная окружения TELEGRAM_BOT_TOKEN!")
+        sys.exit(1)
+
+    if settings.BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        asyncio.run(run_polling())
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
     # Выводим информацию о загруженных настройках (без секретов)
     logging.info(f"Загружен URL бэкенда: {settings.BACKEND_API_URL}")
-    asyncio.run(main()) 
\ No newline at end of file
+    main()